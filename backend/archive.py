@@ -0,0 +1,89 @@
+"""Hot/cold archival of old posts (``ARCHIVE_AFTER_DAYS``).
+
+Posts older than ``max_age`` move with their comments into
+``posts_archive`` / ``comments_archive``, oldest first and ``batch_size``
+posts per batch (``Storage.archive_posts``). The feed, search and their
+indexes then only cover recent posts, which keeps the hot working set in
+memory. ``get_post`` and ``get_comments`` fall back to the archive;
+archived posts leave the feed and search and take no new comments.
+
+Every batch writes its copies before deleting the originals, so a run cut
+short is finished by the next one, and workers that run the job at the
+same time only redo each other's copies.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Archiver:
+    def __init__(self, storage, max_age: Optional[timedelta] = None, batch_size: int = 500, pause: float = 0.05,
+                 observer: Optional[Callable[[int, int], None]] = None):
+        self.storage = storage
+        self.max_age = max_age
+        self.batch_size = batch_size
+        # Sleep between batches so requests are not starved during a long run
+        self.pause = pause
+        # Called as observer(posts, comments) after a run that moved anything
+        self.observer = observer
+        self.runs = 0
+        self.posts_archived = 0
+        self.comments_archived = 0
+        self.last_run: Optional[dict] = None
+
+    async def run_once(self, max_age: Optional[timedelta] = None) -> dict:
+        """Archive every post older than ``max_age`` (default: the configured age)."""
+        max_age = max_age or self.max_age
+        if max_age is None:
+            raise ValueError("No archival age configured")
+        before = datetime.utcnow() - max_age
+        start = time.perf_counter()
+        posts = comments = batches = 0
+        while True:
+            moved_posts, moved_comments = await self.storage.archive_posts(before, self.batch_size)
+            if not moved_posts:
+                break
+            posts += moved_posts
+            comments += moved_comments
+            batches += 1
+            await asyncio.sleep(self.pause)
+        if posts:
+            await self.storage.bump_feed_version()
+            if self.observer:
+                self.observer(posts, comments)
+        self.runs += 1
+        self.posts_archived += posts
+        self.comments_archived += comments
+        self.last_run = {
+            "before": before,
+            "posts": posts,
+            "comments": comments,
+            "batches": batches,
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+        return self.last_run
+
+    async def run(self, interval: float):
+        """Archive every ``interval`` seconds until cancelled."""
+        while True:
+            try:
+                result = await self.run_once()
+                if result["posts"]:
+                    logger.info("Archived %s posts and %s comments", result["posts"], result["comments"])
+            except Exception:
+                logger.exception("Archival run failed; retrying in %s seconds", interval)
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        return {
+            "max_age_days": self.max_age / timedelta(days=1) if self.max_age else None,
+            "batch_size": self.batch_size,
+            "runs": self.runs,
+            "posts_archived": self.posts_archived,
+            "comments_archived": self.comments_archived,
+            "last_run": self.last_run,
+        }
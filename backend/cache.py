@@ -0,0 +1,211 @@
+"""In-process cache of hot feed pages and single posts.
+
+Feed pages are cached as rendered response bodies keyed by the feed version
+plus the page parameters, and only for the first ``page_depth`` pages. A
+write anywhere bumps the version, so an entry can never be served for a
+newer feed; superseded entries simply age out of the LRU.
+
+Where the version comes from depends on the invalidation mode:
+
+* ``version`` (default): every request reads the version from storage (one
+  key lookup, as the ETag check already did) and a hit skips the feed query
+  and serialization.
+* ``change_stream`` (Mongo replica set): the worker remembers the version
+  and forgets it on local writes and on any posts/comments/meta change seen
+  on the change stream, so a hit costs no database round trip at all. If
+  the stream breaks the cache falls back to ``version`` until it recovers.
+
+Author profiles for ``expand=author`` are cached separately with a short
+TTL instead of being invalidated.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, object]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable):
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class FeedCache:
+    def __init__(self, storage, max_pages: int = 256, max_posts: int = 10_000, page_depth: int = 3):
+        self.storage = storage
+        self.pages = LRUCache(max_pages)
+        self.posts = LRUCache(max_posts)
+        self.page_depth = page_depth
+        # Cursor handed out by a cached page -> depth of the page it opens
+        self._cursor_depth: "OrderedDict[str, int]" = OrderedDict()
+        # Set while a change stream keeps this worker's view current
+        self.trusted = False
+        self._version: Optional[int] = None
+        # Bumped by every invalidation so reads that raced one are not stored
+        self.generation = 0
+        self.invalidations = 0
+
+    async def feed_version(self) -> int:
+        if self.trusted and self._version is not None:
+            return self._version
+        generation = self.generation
+        version = await self.storage.get_feed_version()
+        if self.trusted and generation == self.generation:
+            self._version = version
+        return version
+
+    def page_depth_of(self, cursor: Optional[str]) -> Optional[int]:
+        """Depth of the page ``cursor`` opens, or None if it is not a cached one."""
+        if cursor is None:
+            return 0
+        return self._cursor_depth.get(cursor)
+
+    def get_page(self, version: int, key: tuple):
+        return self.pages.get((version, key))
+
+    def put_page(self, generation: int, version: int, key: tuple, depth: int, etag: str, body: bytes, cursor_out: Optional[str]):
+        if generation != self.generation:
+            return
+        self.pages.set((version, key), (etag, body, cursor_out))
+        if cursor_out and depth + 1 < self.page_depth:
+            self._cursor_depth[cursor_out] = depth + 1
+            if len(self._cursor_depth) > self.pages.max_entries:
+                self._cursor_depth.popitem(last=False)
+
+    def get_post(self, post_id: str) -> Optional[dict]:
+        return self.posts.get(post_id)
+
+    def put_post(self, generation: int, post: dict):
+        if generation == self.generation:
+            self.posts.set(post["id"], post)
+
+    def invalidate_feed(self):
+        """A post or comment was written: forget the remembered version and pages."""
+        self.generation += 1
+        self.invalidations += 1
+        self._version = None
+        self.pages.clear()
+        self._cursor_depth.clear()
+
+    def invalidate_posts(self):
+        self.invalidate_feed()
+        self.posts.clear()
+
+    def stats(self) -> dict:
+        return {
+            "mode": "change_stream" if self.trusted else "version",
+            "page_depth": self.page_depth,
+            "invalidations": self.invalidations,
+            "pages": self.pages.stats(),
+            "posts": self.posts.stats(),
+        }
+
+
+class AuthorCache:
+    """Compact author profiles by user id, each kept for ``ttl`` seconds.
+
+    Ids missing from the cache are resolved together with one
+    ``users.get_many``; unknown ids are cached as None too.
+    """
+
+    FIELDS = ("id", "username", "avatar", "is_admin")
+
+    def __init__(self, storage, ttl: float = 60.0, max_entries: int = 10_000):
+        self.storage = storage
+        self.ttl = ttl
+        self.profiles = LRUCache(max_entries)
+        self.expired = 0
+        self.lookups = 0
+
+    async def resolve(self, user_ids: Iterable[str]) -> Dict[str, Optional[dict]]:
+        now = time.monotonic()
+        authors: Dict[str, Optional[dict]] = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            entry = self.profiles.get(user_id)
+            if entry is not None and entry[0] > now:
+                authors[user_id] = entry[1]
+                continue
+            if entry is not None:
+                self.expired += 1
+            missing.append(user_id)
+        if missing:
+            self.lookups += 1
+            users = await self.storage.users.get_many(missing)
+            found = {user["id"]: {field: user[field] for field in self.FIELDS} for user in users}
+            expires = time.monotonic() + self.ttl
+            for user_id in missing:
+                authors[user_id] = found.get(user_id)
+                self.profiles.set(user_id, (expires, authors[user_id]))
+        return authors
+
+    def stats(self) -> dict:
+        return {"ttl_seconds": self.ttl, "expired": self.expired, "lookups": self.lookups, **self.profiles.stats()}
+
+
+async def watch_invalidations(db, cache: FeedCache):
+    """Invalidate ``cache`` on every change other workers make (replica set only)."""
+    pipeline = [{"$match": {"ns.coll": {"$in": ["posts", "comments", "meta"]}}}]
+    while True:
+        try:
+            async with db.watch(pipeline) as stream:
+                # Anything cached before the stream was open may already be stale
+                cache.invalidate_posts()
+                cache.trusted = True
+                async for change in stream:
+                    if change["ns"]["coll"] == "posts" and change["operationType"] != "insert":
+                        # Posts are cached by id, but updates/deletes only carry _id
+                        cache.invalidate_posts()
+                    else:
+                        cache.invalidate_feed()
+        except asyncio.CancelledError:
+            cache.trusted = False
+            raise
+        except Exception:
+            cache.trusted = False
+            cache.invalidate_posts()
+            logger.exception("Change stream for cache invalidation failed; validating against the feed version")
+            await asyncio.sleep(5)
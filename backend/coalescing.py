@@ -0,0 +1,131 @@
+"""Opt-in batching of post and comment inserts (``WRITE_COALESCING=1``).
+
+Writers enqueue their document and wait; the queue is flushed as one
+``insert_many`` per collection when ``max_batch`` documents are waiting or
+``max_delay`` seconds after the first one arrived, whichever comes first.
+Each caller's await returns only once its collection's insert was
+acknowledged, so a response still means the write is stored, and a failure
+in one collection does not fail writers whose documents were stored.
+Comment counters are applied with one increment per post and the feed
+version is bumped once per batch that stored anything.
+"""
+import asyncio
+import logging
+import time
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Posts first, so a comment never lands before its post within a batch
+FLUSH_ORDER = ("posts", "comments")
+
+
+class WriteCoalescer:
+    def __init__(self, storage, max_batch: int = 100, max_delay: float = 0.005,
+                 observer: Optional[Callable[[int, float], None]] = None):
+        self.storage = storage
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        # Called as observer(batch_size, write_seconds) after each flush
+        self.observer = observer
+        self._pending: List[Tuple[str, dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes = set()
+        self.batches = 0
+        self.writes = 0
+
+    async def insert(self, collection: str, doc: dict):
+        if collection not in FLUSH_ORDER:
+            raise ValueError(f"Cannot coalesce writes to {collection}")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((collection, doc, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        # A cancelled caller must not cancel the write shared with its batch
+        await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._write(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _write(self, batch: list):
+        start = time.perf_counter()
+        # Collections whose insert was acknowledged; their writers succeed even if a later step fails
+        stored = set()
+        failures = {}
+        try:
+            for name in FLUSH_ORDER:
+                docs = [doc for collection, doc, _ in batch if collection == name]
+                if not docs:
+                    continue
+                try:
+                    _, duplicates = await self.storage.insert_many(name, docs)
+                except Exception as e:
+                    logger.exception("Coalesced insert of %s %s failed", len(docs), name)
+                    failures[name] = e
+                    continue
+                stored.add(name)
+                if duplicates:
+                    logger.warning("Coalesced %s batch skipped %s duplicate ids", name, duplicates)
+                if name == "comments":
+                    await self._count_comments(docs)
+        finally:
+            if stored:
+                # Before answering, so a writer that reads back its feed never gets a stale 304
+                try:
+                    await self.storage.bump_feed_version()
+                except Exception:
+                    logger.exception("Feed version bump after a coalesced write failed")
+            self._resolve(batch, stored, failures)
+        written = sum(1 for collection, _, _ in batch if collection in stored)
+        if written:
+            self.batches += 1
+            self.writes += written
+            if self.observer:
+                self.observer(written, time.perf_counter() - start)
+
+    async def _count_comments(self, docs: List[dict]):
+        counts = {}
+        for doc in docs:
+            counts[doc["post_id"]] = counts.get(doc["post_id"], 0) + 1
+        try:
+            await asyncio.gather(*(
+                self.storage.posts.increment_comment_count(post_id, by=count) for post_id, count in counts.items()
+            ))
+        except Exception:
+            # The comments are stored, so their writers still succeed; only the counts drift
+            logger.exception("Comment counts of a coalesced batch were not updated")
+
+    @staticmethod
+    def _resolve(batch: list, stored: set, failures: dict):
+        for collection, _, future in batch:
+            if future.done():
+                continue
+            if collection in stored:
+                future.set_result(None)
+            else:
+                future.set_exception(failures.get(collection) or RuntimeError("Coalesced write was interrupted"))
+
+    async def close(self):
+        """Flush what is queued and wait for every batch in flight."""
+        self._flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_delay_ms": self.max_delay * 1000,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "writes": self.writes,
+            "avg_batch": round(self.writes / self.batches, 2) if self.batches else 0,
+        }
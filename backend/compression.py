@@ -0,0 +1,144 @@
+"""Negotiated gzip/brotli compression for larger responses.
+
+Bodies under ``minimum_size`` bytes go out as they are, since compressing
+them costs more than it saves. Brotli is preferred when the client accepts
+it and the optional ``brotli`` package is installed. Streamed bodies (the
+NDJSON export) are compressed chunk by chunk and flushed as they go.
+Responses that already have a Content-Encoding, and event streams, are
+passed through untouched.
+"""
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from metrics import Registry
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+DEFAULT_MINIMUM_SIZE = 1024
+GZIP_LEVEL = 6
+# Quality 4 compresses about as well as gzip -6 and faster; 11 is for static assets
+BROTLI_QUALITY = 4
+UNCOMPRESSED_TYPES = ("text/event-stream", "application/gzip", "image/")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best supported coding in an Accept-Encoding header by q-value; brotli wins ties."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    supported = ("br", "gzip") if brotli is not None else ("gzip",)
+    best, best_quality = None, 0.0
+    for encoding in supported:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._brotli = None
+            # wbits 16 + 15: gzip container
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        """Compress ``data`` and flush it, so a streamed chunk reaches the client now."""
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = DEFAULT_MINIMUM_SIZE, registry: Optional[Registry] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.responses = self.bytes_in = self.bytes_out = None
+        if registry is not None:
+            self.responses = registry.counter("compressed_responses_total", "Responses sent compressed", ("encoding",))
+            self.bytes_in = registry.counter("compression_input_bytes_total", "Response bytes before compression", ("encoding",))
+            self.bytes_out = registry.counter("compression_output_bytes_total", "Response bytes after compression", ("encoding",))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_wrapper(message: Message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether to compress
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = Headers(raw=start["headers"])
+                if (
+                    "content-encoding" in headers
+                    or headers.get("content-type", "").startswith(UNCOMPRESSED_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers = MutableHeaders(raw=start["headers"])
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    compressed = compressor.finish(body)
+                    headers["Content-Length"] = str(len(compressed))
+                    self._record(encoding, len(body), len(compressed))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send(start)
+            compressed = compressor.chunk(body) if more_body else compressor.finish(body)
+            self._record(encoding, len(body), len(compressed), done=not more_body)
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _record(self, encoding: str, bytes_in: int, bytes_out: int, done: bool = True):
+        if self.responses is None:
+            return
+        self.bytes_in.inc(encoding, amount=bytes_in)
+        self.bytes_out.inc(encoding, amount=bytes_out)
+        if done:
+            self.responses.inc(encoding)
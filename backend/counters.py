@@ -0,0 +1,152 @@
+"""Post view and reaction counters, buffered per worker and flushed in batches.
+
+Counting a view or reaction only updates a dict in this worker. Every
+``flush_interval`` seconds the buffered increments are written as one batch
+(a single unordered ``bulk_write`` of ``$inc`` upserts on Mongo), so a hot
+post costs one write per worker per interval instead of one per request.
+A post that gathered at least ``hot_threshold`` increments since the last
+flush goes to one of ``shards`` counter documents picked at random, so
+workers flushing the same hot post do not contend on one document.
+
+Totals are approximate: what storage returns is cached for ``read_ttl``
+seconds and this worker's unflushed increments are added on top, while
+other workers' show up after their next flush. A crash loses at most one
+interval of the worker's increments; a failed flush is retried with the next.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Optional
+
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+VIEWS = "views"
+REACTIONS = ("like", "love", "laugh", "sad", "angry")
+
+
+def _merge(target: Dict[str, int], counts: Dict[str, int]):
+    for name, amount in counts.items():
+        target[name] = target.get(name, 0) + amount
+
+
+class CounterBuffer:
+    def __init__(self, storage, flush_interval: float = 1.0, shards: int = 1, hot_threshold: int = 100,
+                 read_ttl: float = 5.0, max_cached: int = 10_000,
+                 observer: Optional[Callable[[int, float], None]] = None):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.shards = max(1, shards)
+        self.hot_threshold = hot_threshold
+        self.read_ttl = read_ttl
+        # Called as observer(documents_written, write_seconds) after each flush
+        self.observer = observer
+        # post id -> {counter: increments not yet written}
+        self._pending: Dict[str, Dict[str, int]] = defaultdict(dict)
+        # The batch being written, still counted by reads until it lands
+        self._flushing: Dict[str, Dict[str, int]] = {}
+        # post id -> (expires, stored totals)
+        self._totals = LRUCache(max_cached)
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self.increments = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.writes = 0
+
+    def add(self, post_id: str, name: str, amount: int = 1):
+        counts = self._pending[post_id]
+        counts[name] = counts.get(name, 0) + amount
+        self.increments += amount
+
+    def start(self):
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        # Not cancelled on close, so a batch is never cut off halfway through its write
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending or self._flushing:
+            return
+        batch, self._pending = self._pending, defaultdict(dict)
+        self._flushing = batch
+        deltas = {}
+        for post_id, counts in batch.items():
+            hot = sum(counts.values()) >= self.hot_threshold
+            deltas[(post_id, random.randrange(self.shards) if hot else 0)] = counts
+        start = time.perf_counter()
+        try:
+            await self.storage.counters.add(deltas)
+        except Exception:
+            logger.exception("Counter flush of %s posts failed; retrying with the next one", len(batch))
+            self.failed_flushes += 1
+            for post_id, counts in batch.items():
+                _merge(self._pending[post_id], counts)
+            return
+        finally:
+            self._flushing = {}
+        for post_id in batch:
+            # Re-read next time, or the batch would drop out of the totals until they expire
+            self._totals.pop(post_id)
+        self.flushes += 1
+        self.writes += len(deltas)
+        if self.observer:
+            self.observer(len(deltas), time.perf_counter() - start)
+
+    async def totals(self, post_ids: Iterable[str]) -> Dict[str, Dict[str, int]]:
+        """Approximate counters per post: cached stored totals plus this worker's unflushed increments."""
+        now = time.monotonic()
+        stored: Dict[str, Dict[str, int]] = {}
+        missing = []
+        for post_id in dict.fromkeys(post_ids):
+            entry = self._totals.get(post_id)
+            if entry is not None and entry[0] > now:
+                stored[post_id] = entry[1]
+            else:
+                missing.append(post_id)
+        if missing:
+            found = await self.storage.counters.totals(missing)
+            expires = time.monotonic() + self.read_ttl
+            for post_id in missing:
+                stored[post_id] = found.get(post_id, {})
+                self._totals.set(post_id, (expires, stored[post_id]))
+        totals = {}
+        for post_id, counts in stored.items():
+            totals[post_id] = dict(counts)
+            for unflushed in (self._flushing, self._pending):
+                if post_id in unflushed:
+                    _merge(totals[post_id], unflushed[post_id])
+        return totals
+
+    async def close(self):
+        """Stop the flush loop and write what is still buffered."""
+        if self._task is None:
+            await self.flush()
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "flush_interval_seconds": self.flush_interval,
+            "shards": self.shards,
+            "hot_threshold": self.hot_threshold,
+            "read_ttl_seconds": self.read_ttl,
+            "pending_posts": len(self._pending),
+            "increments": self.increments,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "writes": self.writes,
+            "totals_cache": self._totals.stats(),
+        }
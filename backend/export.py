@@ -0,0 +1,37 @@
+"""Constant-memory NDJSON export streamed from the storage engine."""
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Iterable, Optional
+
+from serialization import json_default
+from storage.base import COLLECTIONS as EXPORTABLE_COLLECTIONS
+
+# Lines are buffered into chunks of roughly this size before being sent
+CHUNK_BYTES = 64 * 1024
+
+
+async def iter_ndjson(storage, collections: Iterable[str], since: Optional[datetime] = None, until: Optional[datetime] = None) -> AsyncIterator[bytes]:
+    """Yield NDJSON chunks; each line is {"collection": ..., "data": {...}}."""
+    buffer = []
+    size = 0
+    for name in collections:
+        async for doc in storage.iter_documents(name, since, until):
+            line = json.dumps({"collection": name, "data": doc}, default=json_default, ensure_ascii=False).encode() + b"\n"
+            buffer.append(line)
+            size += len(line)
+            if size >= CHUNK_BYTES:
+                yield b"".join(buffer)
+                buffer.clear()
+                size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,125 @@
+"""Password hashing on a bounded worker pool, off the event loop."""
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from passlib.context import CryptContext
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full and the caller should back off."""
+
+
+# Module level so they can be pickled into a process pool; each returns its
+# own CPU time so queue wait and bcrypt cost can be reported separately.
+def _timed_hash(password):
+    start = time.perf_counter()
+    hashed = pwd_context.hash(password)
+    return hashed, time.perf_counter() - start
+
+
+def _timed_verify(plain_password, hashed_password):
+    start = time.perf_counter()
+    ok = pwd_context.verify(plain_password, hashed_password)
+    return ok, time.perf_counter() - start
+
+
+def _load_backend():
+    # Imports bcrypt in the worker so the first real hash does not pay for it
+    pwd_context.handler().get_backend()
+
+
+class PasswordHasher:
+    def __init__(self, workers: int, max_queue: int, executor: str = "thread",
+                 observer: Optional[Callable[[str, float, float], None]] = None):
+        if executor == "process":
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        elif executor == "thread":
+            # bcrypt releases the GIL, so threads scale across cores as well
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        else:
+            raise ValueError(f"Unknown password hash executor: {executor}")
+        self.executor_kind = executor
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.hash_seconds_total = 0.0
+        self.hash_seconds_max = 0.0
+        self.wait_seconds_total = 0.0
+        # Called as observer(operation, hash_seconds, wait_seconds) after each job
+        self.observer = observer
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._pending - self.workers)
+
+    async def _run(self, operation: str, fn, *args):
+        # Admission is decided on the event loop, so the counter needs no lock
+        if self._pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HasherBusy()
+        self._pending += 1
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            job = self._executor.submit(fn, *args)
+        except BaseException:
+            self._pending -= 1
+            raise
+        # Released when the job ends rather than when its caller stops waiting: a cancelled
+        # request's bcrypt round keeps its worker busy and still counts towards the bound
+        job.add_done_callback(lambda _: self._release(loop))
+        result, hash_seconds = await asyncio.wrap_future(job)
+        wait_seconds = time.perf_counter() - start - hash_seconds
+        self.completed += 1
+        self.hash_seconds_total += hash_seconds
+        self.hash_seconds_max = max(self.hash_seconds_max, hash_seconds)
+        self.wait_seconds_total += wait_seconds
+        if self.observer:
+            self.observer(operation, hash_seconds, wait_seconds)
+        return result
+
+    def _release(self, loop: asyncio.AbstractEventLoop):
+        # Runs on the executor's thread, or on the loop when a queued job is cancelled
+        try:
+            loop.call_soon_threadsafe(self._done)
+        except RuntimeError:
+            pass  # the loop is already closed
+
+    def _done(self):
+        self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", _timed_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run("verify", _timed_verify, plain_password, hashed_password)
+
+    async def warmup(self):
+        """Start every worker (and load bcrypt in it) before the first login."""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _load_backend) for _ in range(self.workers)))
+
+    def stats(self) -> dict:
+        completed = self.completed or 1
+        return {
+            "executor": self.executor_kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": min(self._pending, self.workers),
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "hash_ms_avg": round(self.hash_seconds_total / completed * 1000, 2),
+            "hash_ms_max": round(self.hash_seconds_max * 1000, 2),
+            "queue_wait_ms_avg": round(self.wait_seconds_total / completed * 1000, 2),
+        }
+
+    def shutdown(self):
+        # Queued jobs are dropped; waiting only covers the bcrypt rounds already running
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,281 @@
+"""Bulk import of legacy kullanicilar.json / gonderiler.json style data.
+
+Records are streamed from a top-level JSON array or NDJSON, mapped from the
+legacy camelCase shape to the User/Post/Comment documents and written with
+unordered ``insert_many`` batches through the storage engine. Progress is checkpointed per source after
+every batch, so an interrupted import resumes where it stopped; ids are kept
+(or derived deterministically) so replaying a batch only produces duplicate
+key errors, which are counted and skipped.
+
+    python importer.py --users ../kullanicilar.json --posts ../gonderiler.json
+"""
+import argparse
+import asyncio
+import codecs
+import json
+import logging
+import os
+import sys
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable
+
+from storage.base import naive_utc
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+READ_CHUNK_BYTES = 256 * 1024
+DEFAULT_AVATAR = "https://images.unsplash.com/photo-1616582607004-eba71ce01e07?crop=entropy&cs=srgb&fm=jpg&ixid=M3w3NTY2Nzd8MHwxfHNlYXJjaHwxfHxtYXNrZWQlMjBwb3J0cmFpdHxlbnwwfHx8YmxhY2tfYW5kX3doaXRlfDE3NTIyNDQ2MDl8MA&ixlib=rb-4.1.0&q=85"
+
+
+# Namespace of the uuid5 ids given to legacy records that have none
+LEGACY_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "fsociety:legacy-import")
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+async def iter_json_records(read: Callable[[int], Awaitable[bytes]]) -> AsyncIterator[dict]:
+    """Yield objects from a JSON array or NDJSON stream without loading it whole."""
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    pos = 0
+    eof = False
+    while True:
+        # Skip separators between records: whitespace, array brackets and commas
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,[]":
+            pos += 1
+        if pos < len(buffer):
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Most likely a record cut at the chunk boundary; read more
+                if eof:
+                    raise ImportFormatError(f"Invalid JSON near offset {pos}")
+            else:
+                if not isinstance(record, dict):
+                    raise ImportFormatError("Expected a JSON object per record")
+                yield record
+                pos = end
+                continue
+        elif eof:
+            return
+        chunk = await read(READ_CHUNK_BYTES)
+        eof = not chunk
+        buffer = buffer[pos:] + text_decoder.decode(chunk, final=eof)
+        pos = 0
+
+
+def parse_legacy_datetime(value) -> datetime:
+    if isinstance(value, datetime):
+        parsed = value
+    elif value:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    else:
+        return datetime.utcnow()
+    return naive_utc(parsed)
+
+
+def _pick(record: dict, *keys, default=None):
+    for key in keys:
+        if record.get(key) is not None:
+            return record[key]
+    return default
+
+
+def _required(record: dict, *keys):
+    value = _pick(record, *keys)
+    if value is None or value == "":
+        raise ValueError(f"missing {keys[0]}")
+    return value
+
+
+def map_legacy_user(record: dict) -> dict:
+    username = _required(record, "username")
+    return {
+        # Usernames are unique, so an id derived from one is stable across re-imports
+        "id": str(_pick(record, "id", default=uuid.uuid5(LEGACY_ID_NAMESPACE, f"user:{username}"))),
+        "username": username,
+        "email": _required(record, "email"),
+        "password_hash": _pick(record, "password_hash", "passwordHash"),
+        "avatar": _pick(record, "avatar", default=DEFAULT_AVATAR),
+        "created_at": parse_legacy_datetime(_pick(record, "created_at", "createdAt")),
+        "is_admin": bool(_pick(record, "is_admin", "isAdmin", default=False)),
+        "token_version": 0,
+    }
+
+
+def map_legacy_post(record: dict, fallback_id: str):
+    """Return (post, comments) with the embedded comments split out.
+
+    ``fallback_id`` is used when the record has no id; it must be the same
+    each time the record is imported, so replays end up as duplicates.
+    """
+    post_id = str(_pick(record, "id", default=fallback_id))
+    created_at = parse_legacy_datetime(_required(record, "created_at", "createdAt"))
+    post = {
+        "id": post_id,
+        "title": _required(record, "title"),
+        "content": _required(record, "content"),
+        "author_id": str(_required(record, "author_id", "authorId")),
+        "author_username": _required(record, "author_username", "authorUsername"),
+        "created_at": created_at,
+        "updated_at": parse_legacy_datetime(_pick(record, "updated_at", "updatedAt", default=created_at)),
+    }
+    comments = []
+    for index, comment in enumerate(record.get("comments") or []):
+        comments.append({
+            # Derived ids keep re-imports idempotent for comments without one
+            "id": str(_pick(comment, "id", default=f"{post_id}-comment-{index}")),
+            "post_id": post_id,
+            "content": _required(comment, "content"),
+            "author_id": str(_required(comment, "author_id", "authorId")),
+            "author_username": _required(comment, "author_username", "authorUsername"),
+            "created_at": parse_legacy_datetime(_required(comment, "created_at", "createdAt")),
+        })
+    post["comment_count"] = len(comments)
+    return post, comments
+
+
+class ImportStats:
+    def __init__(self):
+        self.read = 0
+        self.skipped = 0
+        self.inserted = {}
+        self.duplicates = {}
+        self.errors = []
+
+    def as_dict(self) -> dict:
+        return {
+            "read": self.read,
+            "skipped_from_checkpoint": self.skipped,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "errors": self.errors[:100],
+        }
+
+
+class Importer:
+    def __init__(self, storage, password_hasher, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.storage = storage
+        self.password_hasher = password_hasher
+        self.batch_size = batch_size
+        # Leave queue room on a shared hasher so logins are not rejected
+        self._hash_slots = asyncio.Semaphore(password_hasher.workers)
+
+    async def _hash_user(self, record: dict, user: dict):
+        if user["password_hash"]:
+            return
+        async with self._hash_slots:
+            user["password_hash"] = await self.password_hasher.hash(record["password"])
+
+    async def _prepare(self, kind: str, records: list, stats: ImportStats, source: str, first: int):
+        """Map ``records``, the ones at positions ``first``, ``first + 1``, ... of ``source``."""
+        mapped = []
+        for position, record in enumerate(records, first):
+            try:
+                if kind == "users":
+                    user = map_legacy_user(record)
+                    if not user["password_hash"] and not record.get("password"):
+                        raise ValueError("missing password")
+                    mapped.append((record, user))
+                else:
+                    fallback_id = str(uuid.uuid5(LEGACY_ID_NAMESPACE, f"{source}:{position}"))
+                    mapped.append(map_legacy_post(record, fallback_id))
+            except (KeyError, TypeError, ValueError) as e:
+                stats.errors.append(f"{kind} {record.get('id', '?')}: {e!r}")
+        if kind == "users":
+            await asyncio.gather(*(self._hash_user(record, user) for record, user in mapped))
+            return {"users": [user for _, user in mapped]}
+        return {
+            "posts": [post for post, _ in mapped],
+            "comments": [comment for _, comments in mapped for comment in comments],
+        }
+
+    async def run(self, kind: str, source: str, read: Callable[[int], Awaitable[bytes]], resume: bool = True) -> ImportStats:
+        """Import ``users`` or ``posts`` records from ``read`` under checkpoint key ``source``."""
+        if kind not in ("users", "posts"):
+            raise ValueError(f"Unknown import kind: {kind}")
+        checkpoint_key = f"{kind}:{source}"
+        done = await self.storage.get_checkpoint(checkpoint_key) if resume else 0
+        stats = ImportStats()
+        batch = []
+        pending = None
+
+        async def flush(records: list, position: int):
+            nonlocal pending
+            prepared = await self._prepare(kind, records, stats, checkpoint_key, position - len(records) + 1)
+            # Hash/map the next batch while the previous one is being written
+            if pending:
+                await pending
+            pending = asyncio.ensure_future(self._write(kind, prepared, stats, checkpoint_key, position))
+
+        try:
+            async for record in iter_json_records(read):
+                stats.read += 1
+                if stats.read <= done:
+                    stats.skipped += 1
+                    continue
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    await flush(batch, stats.read)
+                    batch = []
+            if batch:
+                await flush(batch, stats.read)
+        finally:
+            if pending:
+                await pending
+        return stats
+
+    async def _write(self, kind: str, prepared: dict, stats: ImportStats, checkpoint_key: str, position: int):
+        for name, docs in prepared.items():
+            inserted, duplicates = await self.storage.insert_many(name, docs)
+            stats.inserted[name] = stats.inserted.get(name, 0) + inserted
+            if duplicates:
+                stats.duplicates[name] = stats.duplicates.get(name, 0) + duplicates
+        if kind == "posts":
+            await self.storage.bump_feed_version()
+        await self.storage.save_checkpoint(checkpoint_key, position)
+        logger.info("Imported %s records for %s", position, checkpoint_key)
+
+
+async def _main(args) -> int:
+    from dotenv import load_dotenv
+
+    from hashing import PasswordHasher
+    from storage import create_storage
+
+    load_dotenv(Path(__file__).parent / '.env')
+    storage = create_storage()
+    # Unique keys are what make replayed batches safe
+    await storage.startup()
+    hasher = PasswordHasher(workers=args.workers, max_queue=args.workers, executor="process")
+    importer = Importer(storage, hasher, batch_size=args.batch_size)
+    try:
+        for kind, path in (("users", args.users), ("posts", args.posts)):
+            if not path:
+                continue
+            with open(path, "rb") as f:
+                async def read(n, f=f):
+                    return f.read(n)
+                stats = await importer.run(kind, Path(path).name, read, resume=not args.restart)
+            print(kind, json.dumps(stats.as_dict(), ensure_ascii=False))
+    finally:
+        hasher.shutdown()
+        await storage.close()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import legacy users/posts JSON into the configured storage engine")
+    parser.add_argument("--users", help="kullanicilar.json style file (array or NDJSON)")
+    parser.add_argument("--posts", help="gonderiler.json style file (array or NDJSON)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="bcrypt worker processes")
+    parser.add_argument("--restart", action="store_true", help="ignore saved checkpoints")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(_main(parser.parse_args())))
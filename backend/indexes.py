@@ -0,0 +1,219 @@
+"""Index bootstrap and query plan checks for the forum collections.
+
+Run ``python indexes.py`` from the backend directory to create missing
+indexes, report drift and print the winning plan of every hot query. The
+command exits with status 1 if any index drifted or any query falls back
+to a COLLSCAN.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from pathlib import Path
+
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+from search import TITLE_WEIGHT
+
+logger = logging.getLogger(__name__)
+
+# Indexes the API queries rely on, per collection
+INDEXES = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "posts": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        IndexModel(
+            [("search_title", TEXT), ("search_body", TEXT)],
+            name="search_text",
+            weights={"search_title": TITLE_WEIGHT, "search_body": 1},
+            default_language="none",
+        ),
+    ],
+    "comments": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("post_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], name="post_id_created_at_id"),
+        IndexModel(
+            [("post_id", ASCENDING), ("parent_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)],
+            name="post_id_parent_id_created_at_id",
+        ),
+        # Comments from before threading have no path
+        IndexModel([("path", ASCENDING)], name="path", sparse=True),
+        IndexModel([("search_body", TEXT)], name="search_text", default_language="none"),
+    ],
+    # Cold posts and comments moved out by archive.Archiver; only read by id and per post
+    "posts_archive": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "comments_archive": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("post_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], name="post_id_created_at_id"),
+        IndexModel(
+            [("post_id", ASCENDING), ("parent_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)],
+            name="post_id_parent_id_created_at_id",
+        ),
+        IndexModel([("path", ASCENDING)], name="path", sparse=True),
+    ],
+    # View/reaction counter shards; _id is "<post_id>:<shard>"
+    "post_counters": [
+        IndexModel([("post_id", ASCENDING)], name="post_id"),
+    ],
+    # Shared rate limit buckets (RATE_LIMIT_STORE=mongo), dropped once refilled
+    "rate_limits": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+# Representative queries issued by server.py: (label, collection, filter, sort)
+HOT_QUERIES = [
+    ("login", "users", {"username": "Lukha"}, None),
+    ("get_current_user token_version", "users", {"id": "user-1"}, None),
+    ("register duplicate check", "users", {"$or": [{"username": "Lukha"}, {"email": "lukha@fsociety.com"}]}, None),
+    ("get_posts", "posts", {}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("get_post", "posts", {"id": "post-1"}, None),
+    ("get_comments", "comments", {"post_id": "post-1"}, [("created_at", ASCENDING), ("id", ASCENDING)]),
+    (
+        "get_comments threaded",
+        "comments",
+        {"post_id": "post-1", "parent_id": None},
+        [("created_at", ASCENDING), ("id", ASCENDING)],
+    ),
+    ("comment replies", "comments", {"path": {"$gt": "root/", "$lt": "root0"}}, [("path", ASCENDING)]),
+    ("search posts", "posts", {"$text": {"$search": "fsociety"}}, None),
+    ("search comments", "comments", {"$text": {"$search": "fsociety"}}, None),
+]
+
+
+def _normalize_key(key) -> list:
+    items = key.items() if hasattr(key, "items") else key
+    return [(field, direction if isinstance(direction, str) else int(direction)) for field, direction in items]
+
+
+# Index options that change what an index holds or enforces; unset and false are the same
+INDEX_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+def _index_shape(index: dict) -> dict:
+    """The parts of an index spec or index_information() entry that must match."""
+    key = _normalize_key(index["key"])
+    shape = {option: index[option] for option in INDEX_OPTIONS if index.get(option) not in (None, False)}
+    if any(direction == TEXT for _, direction in key):
+        # Text indexes are stored as _fts/_ftsx keys; the indexed fields live in weights
+        weights = index.get("weights") or {}
+        if "_fts" in dict(key):
+            shape["text"] = dict(weights)
+        else:
+            shape["text"] = {field: weights.get(field, 1) for field, direction in key if direction == TEXT}
+        shape["default_language"] = index.get("default_language", "english")
+    else:
+        shape["key"] = key
+    return shape
+
+
+def _index_matches(spec: dict, existing: dict) -> bool:
+    return _index_shape(spec) == _index_shape(existing)
+
+
+async def check_indexes(db) -> tuple:
+    """Compare the indexes with INDEXES without changing anything.
+
+    Returns (missing, problems): the IndexModels to create per collection and
+    a drift message for every index whose key or options differ.
+    """
+    missing = {}
+    problems = []
+    for collection_name, models in INDEXES.items():
+        existing = await db[collection_name].index_information()
+        for model in models:
+            spec = model.document
+            current = existing.get(spec["name"])
+            if current is None:
+                missing.setdefault(collection_name, []).append(model)
+            elif not _index_matches(spec, current):
+                problems.append(
+                    f"{collection_name}.{spec['name']}: expected {_index_shape(spec)}, found {_index_shape(current)}"
+                )
+    return missing, problems
+
+
+async def ensure_indexes(db) -> list:
+    """Create missing indexes and return a list of drift messages for mismatched ones."""
+    missing, problems = await check_indexes(db)
+    for collection_name, models in missing.items():
+        # One at a time, so a conflict only fails the index it concerns
+        for model in models:
+            name = model.document["name"]
+            try:
+                await db[collection_name].create_indexes([model])
+                logger.info("Created index %s.%s", collection_name, name)
+            except OperationFailure as e:
+                logger.error("Could not create index %s.%s: %s", collection_name, name, e)
+                problems.append(f"{collection_name}.{name}: index creation failed: {e}")
+    for problem in problems:
+        logger.warning("Index drift: %s", problem)
+    return problems
+
+
+def _plan_stages(plan: dict) -> list:
+    stages = [plan.get("stage")]
+    if "inputStage" in plan:
+        stages += _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+
+async def explain_hot_queries(db) -> list:
+    """Return (label, stages) for the winning plan of every hot query."""
+    report = []
+    for label, collection_name, query, sort in HOT_QUERIES:
+        cursor = db[collection_name].find(query).limit(20)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        report.append((label, _plan_stages(explain["queryPlanner"]["winningPlan"])))
+    return report
+
+
+async def _main(args) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    failed = False
+    try:
+        if args.check_only:
+            # Only report drift; ensure_indexes would also create what is missing
+            missing, problems = await check_indexes(db)
+            for collection_name, models in missing.items():
+                for model in models:
+                    print(f"MISSING  {collection_name}.{model.document['name']}")
+            for problem in problems:
+                print(f"DRIFT    {problem}")
+            failed = bool(missing or problems)
+        else:
+            for problem in await ensure_indexes(db):
+                print(f"DRIFT    {problem}")
+                failed = True
+        for label, stages in await explain_hot_queries(db):
+            flag = "COLLSCAN" if "COLLSCAN" in stages else "ok"
+            failed = failed or flag == "COLLSCAN"
+            print(f"{flag:<8} {label}: {' <- '.join(s for s in stages if s)}")
+    finally:
+        client.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create/verify indexes and report query plans")
+    parser.add_argument("--check-only", action="store_true", help="do not create missing indexes")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(_main(parser.parse_args())))
@@ -0,0 +1,167 @@
+"""Server-Sent Events fan-out of new posts and comments.
+
+Every worker keeps one ``EventBroker``. Handlers publish small deltas to it;
+each connected client owns a bounded queue, so one slow reader never holds
+up the others. A reader whose queue overflows is told to ``resync`` (refetch
+the feed) instead of growing memory. Heartbeats are pushed to all queues by a
+single task rather than a timer per connection, and a short replay buffer
+lets reconnecting clients resume from ``Last-Event-ID``. Event ids are
+``<epoch>-<sequence>`` with an epoch per broker, so an id this broker cannot
+replay from (another worker's, from before a restart, or too old) gets a
+``resync`` instead of silently skipping events.
+
+With several uvicorn workers, set ``LIVE_SOURCE=change_stream`` (requires a
+replica set) so every worker publishes inserts it sees on the change stream,
+not only the writes it served itself.
+"""
+import asyncio
+import logging
+import uuid
+from collections import deque
+from typing import Optional
+
+from serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT = b": ping\n\n"
+RESYNC = b"event: resync\ndata: {}\n\n"
+
+
+class Subscriber:
+    __slots__ = ("queue", "lagged")
+
+    def __init__(self, max_queue: int):
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.lagged = False
+
+    def offer(self, message: bytes):
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Drop the backlog; the client refetches once it catches up
+            self.lagged = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+
+class EventBroker:
+    def __init__(self, max_clients: int = 10000, max_queue: int = 100, replay_size: int = 256, heartbeat_seconds: float = 15.0):
+        self.max_clients = max_clients
+        self.max_queue = max_queue
+        self.heartbeat_seconds = heartbeat_seconds
+        self._subscribers = set()
+        self._replay = deque(maxlen=replay_size)
+        self._sequence = 0
+        self.epoch = uuid.uuid4().hex[:8]
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.resyncs = 0
+
+    @property
+    def client_count(self) -> int:
+        return len(self._subscribers)
+
+    @property
+    def is_full(self) -> bool:
+        return len(self._subscribers) >= self.max_clients
+
+    def publish(self, event: str, data: dict):
+        self._sequence += 1
+        # Encoded once, shared by every subscriber
+        message = b"id: %s-%d\nevent: %s\ndata: %s\n\n" % (self.epoch.encode(), self._sequence, event.encode(), dumps(data))
+        self._replay.append((self._sequence, message))
+        self.published += 1
+        for subscriber in self._subscribers:
+            was_lagged = subscriber.lagged
+            subscriber.offer(message)
+            if subscriber.lagged and not was_lagged:
+                self.resyncs += 1
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Subscriber:
+        subscriber = Subscriber(self.max_queue)
+        if last_event_id is not None:
+            self._replay_into(subscriber, last_event_id)
+        self._subscribers.add(subscriber)
+        self._ensure_heartbeat()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+
+    def _replay_into(self, subscriber: Subscriber, last_event_id: str):
+        epoch, _, sequence = last_event_id.rpartition("-")
+        try:
+            last = int(sequence)
+        except ValueError:
+            last = None
+        oldest = self._replay[0][0] if self._replay else self._sequence + 1
+        if epoch != self.epoch or last is None or last > self._sequence or last < oldest - 1:
+            subscriber.offer(RESYNC)
+            return
+        for sequence, message in self._replay:
+            if sequence > last:
+                subscriber.offer(message)
+
+    def _ensure_heartbeat(self):
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def _heartbeat(self):
+        while self._subscribers:
+            await asyncio.sleep(self.heartbeat_seconds)
+            for subscriber in self._subscribers:
+                if subscriber.queue.empty():
+                    subscriber.offer(HEARTBEAT)
+
+    async def stream(self, last_event_id: Optional[str] = None):
+        """Async iterator of SSE frames for one client.
+
+        Subscribing happens on first iteration, so a response that is never
+        started cannot leak a subscriber.
+        """
+        subscriber = self.subscribe(last_event_id)
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                message = await subscriber.queue.get()
+                yield message
+                if message is RESYNC:
+                    subscriber.lagged = False
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> dict:
+        return {
+            "clients": self.client_count,
+            "max_clients": self.max_clients,
+            "published": self.published,
+            "resyncs": self.resyncs,
+            "last_event_id": f"{self.epoch}-{self._sequence}",
+        }
+
+    def close(self):
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+
+
+async def watch_inserts(db, broker: EventBroker, post_fields: list, comment_fields: list):
+    """Publish inserts seen on the posts/comments change stream (replica set only)."""
+    pipeline = [{"$match": {"operationType": "insert", "ns.coll": {"$in": ["posts", "comments"]}}}]
+    while True:
+        try:
+            async with db.watch(pipeline) as stream:
+                async for change in stream:
+                    doc = change["fullDocument"]
+                    if change["ns"]["coll"] == "posts":
+                        broker.publish("post", {k: doc[k] for k in post_fields if k in doc})
+                    else:
+                        broker.publish("comment", {k: doc[k] for k in comment_fields if k in doc})
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Change stream for live events failed; retrying")
+            await asyncio.sleep(5)
@@ -0,0 +1,239 @@
+"""Prometheus text-format metrics without a client library.
+
+Request latency is recorded by ``MetricsMiddleware`` per route template (so
+``/api/posts/{post_id}`` is one series, not one per id), MongoDB command
+latency by a PyMongo ``CommandListener`` per collection and command, and
+bcrypt cost by the password hasher. Every uvicorn worker keeps its own
+registry; scrape each worker, or aggregate across them with ``sum by``.
+"""
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+HASH_BUCKETS = (0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0, 5.0)
+UNMATCHED_ROUTE = "unmatched"
+# Driver housekeeping that carries no collection
+_IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "buildInfo", "saslStart", "saslContinue"}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class GaugeFunction:
+    """Gauge read from ``fn`` at scrape time; ``fn`` returns a number or {label values: number}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.label_names = labels
+
+    def samples(self) -> Iterable[str]:
+        value = self.fn()
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, number in items:
+            yield f"{self.name}{_labels(self.label_names, labels)} {_number(number)}"
+
+
+class CounterFunction(GaugeFunction):
+    """Counter kept elsewhere (e.g. a stats attribute) and read at scrape time."""
+
+    kind = "counter"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[Tuple, list] = {}
+        # Mongo events arrive on driver threads
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(snapshot):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % _number(bound)
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def gauge_function(self, name: str, help: str, fn: Callable, labels: Tuple[str, ...] = ()) -> GaugeFunction:
+        return self.register(GaugeFunction(name, help, fn, labels))
+
+    def counter_function(self, name: str, help: str, fn: Callable, labels: Tuple[str, ...] = ()) -> CounterFunction:
+        return self.register(CounterFunction(name, help, fn, labels))
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> bytes:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return ("\n".join(lines) + "\n").encode()
+
+
+class MetricsMiddleware:
+    """Count, time and track in-flight requests per method and route template.
+
+    The route is resolved up front against the app's routes, so in-flight
+    requests are labelled too; paths that match no route share one series.
+    """
+
+    def __init__(self, app: ASGIApp, registry: Registry, routes: Callable[[], list]):
+        self.app = app
+        self.routes = routes
+        self.requests = registry.counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+        self.latency = registry.histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+        self.in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being served", ("method", "route"))
+
+    def _route(self, scope: Scope) -> str:
+        for route in self.routes():
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", UNMATCHED_ROUTE)
+        return UNMATCHED_ROUTE
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        route = self._route(scope)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.in_flight.inc(method, route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.latency.observe(time.perf_counter() - start, method, route)
+            self.requests.inc(method, route, status)
+            self.in_flight.dec(method, route)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Driver command latency per collection and command name."""
+
+    def __init__(self, registry: Registry):
+        self.latency = registry.histogram(
+            "mongo_command_duration_seconds", "MongoDB command latency", ("collection", "command"), DB_BUCKETS
+        )
+        self.failures = registry.counter("mongo_command_failures_total", "Failed MongoDB commands", ("collection", "command"))
+        # (connection, request id) -> collection, between started and finished events
+        self._pending: Dict[Tuple, str] = {}
+
+    def started(self, event):
+        if event.command_name in _IGNORED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        if isinstance(collection, str):
+            self._pending[(event.connection_id, event.request_id)] = collection
+
+    def _collection(self, event) -> Optional[str]:
+        return self._pending.pop((event.connection_id, event.request_id), None)
+
+    def succeeded(self, event):
+        collection = self._collection(event)
+        if collection is not None:
+            self.latency.observe(event.duration_micros / 1e6, collection, event.command_name)
+
+    def failed(self, event):
+        collection = self._collection(event)
+        if collection is not None:
+            self.latency.observe(event.duration_micros / 1e6, collection, event.command_name)
+            self.failures.inc(collection, event.command_name)
@@ -0,0 +1,83 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at: datetime, item_id: str) -> str:
+    raw = json.dumps({"c": created_at.isoformat(), "i": item_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(data["c"]), str(data["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Geçersiz cursor")
+
+
+def decode_optional_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, str]]:
+    return decode_cursor(cursor) if cursor else None
+
+
+def encode_path_cursor(path: str) -> str:
+    """Cursor for reply pages, which are ordered by thread path rather than (created_at, id)."""
+    raw = json.dumps({"p": path}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_optional_path_cursor(cursor: Optional[str]) -> Optional[str]:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return str(json.loads(base64.urlsafe_b64decode(padded.encode()))["p"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Geçersiz cursor")
+
+
+def keyset_filter(after: Optional[Tuple[datetime, str]], descending: bool) -> dict:
+    """Build the Mongo filter for the page after the (created_at, id) position ``after``."""
+    if not after:
+        return {}
+    created_at, item_id = after
+    op = "$lt" if descending else "$gt"
+    return {
+        "$or": [
+            {"created_at": {op: created_at}},
+            {"created_at": created_at, "id": {op: item_id}},
+        ]
+    }
+
+
+def keyset_sort(descending: bool) -> list:
+    direction = -1 if descending else 1
+    return [("created_at", direction), ("id", direction)]
+
+
+def next_cursor(docs: list, limit: int) -> Optional[str]:
+    """Return the cursor for the next page, trimming the look-ahead document.
+
+    Callers fetch ``limit + 1`` documents; the extra one only signals that
+    another page exists and is removed from ``docs`` here.
+    """
+    if len(docs) <= limit:
+        return None
+    del docs[limit:]
+    last = docs[-1]
+    return encode_cursor(last["created_at"], last["id"])
+
+
+def next_path_cursor(docs: list, limit: int) -> Optional[str]:
+    """``next_cursor`` for pages in thread path order."""
+    if len(docs) <= limit:
+        return None
+    del docs[limit:]
+    return encode_path_cursor(docs[-1]["path"])
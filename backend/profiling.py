@@ -0,0 +1,243 @@
+"""Opt-in profiling of single requests.
+
+A request is profiled when an admin sends ``X-Profile: 1`` with their
+token, or when ``PROFILE_SAMPLE_RATE`` picks it. It runs under cProfile and
+its wall time is split into
+
+* ``mongo``: driver command time, from a command listener. Motor runs each
+  command in a copy of the caller's context, so only this request's
+  commands are counted.
+* ``bcrypt``: password hashing plus the wait for a hashing worker.
+* ``validation`` / ``serialization``: time spent in Pydantic and in JSON
+  encoding, taken from the cProfile stats.
+* ``other``: the remainder (routing, caches, waiting on other tasks).
+
+Each profile is saved to the profile directory as ``<id>.prof`` (open it
+with ``python -m pstats`` or snakeviz) and ``<id>.json`` (the split and the
+slowest functions), and the response carries ``X-Profile-Id: <id>``.
+
+cProfile sees the whole event loop thread, so requests the worker serves
+in the meantime show up in the .prof and in validation/serialization;
+``concurrent_requests`` in the summary counts those in flight as it started
+or ended. A worker profiles one request at a time. Requests that are not
+profiled only pay for a header scan, and each Mongo command for one
+ContextVar read.
+"""
+import asyncio
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import monitoring
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+TOP_FUNCTIONS = 30
+PROFILE_ID = re.compile(r"^\d{8}T\d{6}-[0-9a-f]{8}$")
+SERIALIZATION_FILES = (
+    f"{os.sep}serialization.py",
+    f"json{os.sep}encoder.py",
+    f"fastapi{os.sep}encoders.py",
+)
+
+
+class RequestProfile:
+    """Time per category recorded from other threads while one request runs."""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {"mongo": 0.0, "bcrypt": 0.0}
+        self.calls: Dict[str, int] = {"mongo": 0, "bcrypt": 0}
+        self._lock = threading.Lock()
+
+    def add(self, category: str, seconds: float):
+        with self._lock:
+            self.seconds[category] += seconds
+            self.calls[category] += 1
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+def record(category: str, seconds: float):
+    """Add ``seconds`` of ``category`` ("mongo" or "bcrypt") to the request being profiled, if any."""
+    profile = _current.get()
+    if profile is not None:
+        profile.add(category, seconds)
+
+
+class MongoProfileListener(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        record("mongo", event.duration_micros / 1e6)
+
+    def failed(self, event):
+        record("mongo", event.duration_micros / 1e6)
+
+
+def _category(func) -> Optional[str]:
+    filename, _, name = func
+    if "SchemaSerializer" in name or "orjson" in name or filename.endswith(SERIALIZATION_FILES):
+        return "serialization"
+    if "pydantic" in filename or "pydantic_core" in name:
+        return "validation"
+    return None
+
+
+def summarize(profiler: cProfile.Profile) -> dict:
+    """Seconds spent in validation and serialization, and the functions with the most own time."""
+    stats = pstats.Stats(profiler).stats
+    seconds = {"validation": 0.0, "serialization": 0.0}
+    for func, (_, _, own_seconds, _, _) in stats.items():
+        category = _category(func)
+        if category:
+            seconds[category] += own_seconds
+    top = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:TOP_FUNCTIONS]
+    return {
+        "seconds": seconds,
+        "top_functions": [
+            {
+                "function": pstats.func_std_string(func),
+                "calls": calls,
+                "own_seconds": round(own_seconds, 6),
+                "cumulative_seconds": round(cumulative, 6),
+            }
+            for func, (_, calls, own_seconds, cumulative, _) in top
+        ],
+    }
+
+
+class ProfileStore:
+    """Saved profiles in ``directory``, keeping the newest ``max_files``."""
+
+    def __init__(self, directory: Path, max_files: int = 200):
+        self.directory = Path(directory)
+        self.max_files = max_files
+        self.saved = 0
+
+    def save(self, profile_id: str, profiler: cProfile.Profile, summary: dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(self.directory / f"{profile_id}.prof")
+        (self.directory / f"{profile_id}.json").write_text(json.dumps(summary, indent=2, default=str))
+        self.saved += 1
+        # Ids start with their timestamp, so name order is age order
+        for old in sorted(self.directory.glob("*.json"))[:-self.max_files]:
+            old.unlink(missing_ok=True)
+            old.with_suffix(".prof").unlink(missing_ok=True)
+
+    def recent(self, limit: int) -> List[dict]:
+        if not self.directory.is_dir():
+            return []
+        summaries = []
+        for path in sorted(self.directory.glob("*.json"), reverse=True)[:limit]:
+            summary = json.loads(path.read_text())
+            summary.pop("top_functions", None)
+            summaries.append(summary)
+        return summaries
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        if not PROFILE_ID.match(profile_id):
+            return None
+        path = self.directory / f"{profile_id}.json"
+        return json.loads(path.read_text()) if path.is_file() else None
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp, store: ProfileStore, authorize: Callable[[Optional[str]], Awaitable[bool]],
+                 sample_rate: float = 0.0):
+        self.app = app
+        self.store = store
+        # authorize(Authorization header) -> whether the caller may ask for a profile
+        self.authorize = authorize
+        self.sample_rate = sample_rate
+        self.in_flight = 0
+        self._active = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        self.in_flight += 1
+        try:
+            sampled = bool(self.sample_rate) and random.random() < self.sample_rate
+            if (sampled or await self._requested(scope)) and not self._active:
+                await self._profile(scope, receive, send, sampled)
+            else:
+                await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+
+    async def _requested(self, scope: Scope) -> bool:
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER and value == b"1":
+                return await self.authorize(Headers(scope=scope).get("authorization"))
+        return False
+
+    async def _profile(self, scope: Scope, receive: Receive, send: Send, sampled: bool):
+        self._active = True
+        profile_id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        profile = RequestProfile()
+        status = None
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message).append("X-Profile-Id", profile_id)
+            await send(message)
+
+        summary = {
+            "id": profile_id,
+            "method": scope["method"],
+            "path": scope["path"],
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "sampled": sampled,
+            "started_at": datetime.utcnow(),
+            "concurrent_requests": self.in_flight - 1,
+        }
+        token = _current.set(profile)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.disable()
+            wall_seconds = time.perf_counter() - start
+            _current.reset(token)
+            self._active = False
+            summary["concurrent_requests"] = max(summary["concurrent_requests"], self.in_flight - 1)
+            summary["status"] = status
+            try:
+                await asyncio.to_thread(self._save, profile_id, profiler, profile, wall_seconds, summary)
+            except Exception:
+                logger.exception("Could not save profile %s", profile_id)
+
+    def _save(self, profile_id: str, profiler: cProfile.Profile, profile: RequestProfile, wall_seconds: float, summary: dict):
+        stats = summarize(profiler)
+        seconds = {**profile.seconds, **stats["seconds"]}
+        # Concurrent Mongo commands can add up to more than the wall time
+        seconds["other"] = max(0.0, wall_seconds - sum(seconds.values()))
+        summary.update({
+            "wall_seconds": round(wall_seconds, 6),
+            "breakdown_seconds": {category: round(value, 6) for category, value in seconds.items()},
+            "mongo_commands": profile.calls["mongo"],
+            "bcrypt_operations": profile.calls["bcrypt"],
+            "top_functions": stats["top_functions"],
+        })
+        self.store.save(profile_id, profiler, summary)
@@ -0,0 +1,151 @@
+"""Token-bucket rate limits for the bcrypt-heavy auth endpoints.
+
+A limit such as ``10/60`` allows bursts of 10 requests and refills at 10
+per 60 seconds. Buckets live in this worker's memory by default; with
+``RATE_LIMIT_STORE=mongo`` they are kept in the ``rate_limits`` collection
+and updated atomically, so the limits hold across uvicorn workers.
+"""
+import logging
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Dict, NamedTuple, Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+MAX_MEMORY_KEYS = 100_000
+
+
+class Limit(NamedTuple):
+    capacity: float
+    per_seconds: float
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.per_seconds
+
+
+def parse_limit(value: str) -> Optional[Limit]:
+    """``"10/60"`` -> 10 requests per 60 seconds; ``"0"`` or empty disables the limit."""
+    value = value.strip()
+    if not value or value == "0":
+        return None
+    count, _, seconds = value.partition("/")
+    limit = Limit(float(count), float(seconds or 1))
+    if limit.capacity <= 0 or limit.per_seconds <= 0:
+        raise ValueError(f"Invalid rate limit: {value!r}")
+    return limit
+
+
+def forwarded_ip(forwarded: Optional[str], peer: str, trusted_hops: int = 1) -> str:
+    """Client address from an X-Forwarded-For chain behind ``trusted_hops`` proxies.
+
+    Each proxy appends the address it received from, so only the last
+    ``trusted_hops`` entries are trustworthy; anything left of them was sent
+    by the client and is ignored.
+    """
+    hops = [hop.strip() for hop in (forwarded or "").split(",") if hop.strip()]
+    if not hops or trusted_hops <= 0:
+        return peer
+    return hops[max(0, len(hops) - trusted_hops)]
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class MemoryBucketStore:
+    def __init__(self, max_keys: int = MAX_MEMORY_KEYS):
+        self.max_keys = max_keys
+        # key -> [tokens, monotonic time of last update, limit]
+        self._buckets: Dict[str, list] = {}
+
+    def _prune(self, now: float):
+        # Buckets that refilled completely carry no state worth keeping
+        full = [
+            key for key, (tokens, updated, limit) in self._buckets.items()
+            if tokens + (now - updated) * limit.rate >= limit.capacity
+        ]
+        for key in full:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_keys:
+            self._buckets.clear()
+
+    async def take(self, key: str, limit: Limit, cost: float = 1) -> float:
+        """Consume ``cost`` tokens; return 0 if allowed, else seconds until it would be."""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._prune(now)
+            bucket = self._buckets[key] = [limit.capacity, now, limit]
+        tokens = min(limit.capacity, bucket[0] + (now - bucket[1]) * limit.rate)
+        bucket[1] = now
+        if tokens < cost:
+            bucket[0] = tokens
+            return (cost - tokens) / limit.rate
+        bucket[0] = tokens - cost
+        return 0.0
+
+
+class MongoBucketStore:
+    """Buckets shared by every worker, updated with one pipeline upsert per check."""
+
+    def __init__(self, db):
+        self.collection = db.rate_limits
+
+    async def take(self, key: str, limit: Limit, cost: float = 1) -> float:
+        now = time.time()
+        refilled = {"$min": [
+            limit.capacity,
+            {"$add": [
+                {"$ifNull": ["$tokens", limit.capacity]},
+                {"$multiply": [{"$max": [0, {"$subtract": [now, {"$ifNull": ["$updated", now]}]}]}, limit.rate]},
+            ]},
+        ]}
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated": now}},
+                {"$set": {
+                    "allowed": {"$gte": ["$tokens", cost]},
+                    "tokens": {"$cond": [{"$gte": ["$tokens", cost]}, {"$subtract": ["$tokens", cost]}, "$tokens"]},
+                    # TTL index removes buckets once they would be full again
+                    "expires_at": datetime.utcnow() + timedelta(seconds=limit.per_seconds),
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if bucket["allowed"]:
+            return 0.0
+        return (cost - bucket["tokens"]) / limit.rate
+
+
+class RateLimiter:
+    def __init__(self, store, limits: Dict[str, Optional[Limit]]):
+        self.store = store
+        self.limits = limits
+        self.rejected: Dict[str, int] = {}
+
+    async def check(self, name: str, key: str):
+        """Raise RateLimited if ``key`` exhausted the ``name`` limit; store errors fail open."""
+        limit = self.limits.get(name)
+        if limit is None:
+            return
+        try:
+            retry_after = await self.store.take(f"{name}:{key}", limit)
+        except Exception:
+            logger.warning("Rate limit store failed; allowing request", exc_info=True)
+            return
+        if retry_after > 0:
+            self.rejected[name] = self.rejected.get(name, 0) + 1
+            raise RateLimited(retry_after)
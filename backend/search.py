@@ -0,0 +1,80 @@
+"""Full-text search over posts and comments with Turkish-aware folding.
+
+Titles, contents and comments are folded into ``search_*`` fields when they
+are written: Turkish casing rules first (I -> ı, İ -> i), then dotted and
+dotless i are merged and diacritics stripped, so "İSTANBUL", "istanbul" and
+"ıstanbul" or "Gönderi" and "gonderi" all match. Each storage engine indexes those fields: Mongo text
+indexes (language "none", no stemming of already-folded text), SQLite FTS5
+tables or the in-memory inverted index.
+"""
+import re
+import unicodedata
+from typing import List, Tuple
+
+TITLE_WEIGHT = 5
+# A matching comment lifts its post, but less than a match in the post itself
+COMMENT_SCORE_FACTOR = 0.5
+MAX_CANDIDATES = 200
+
+_FOLD = str.maketrans({"ı": "i", "ş": "s", "ç": "c", "ğ": "g", "ö": "o", "ü": "u", "â": "a", "î": "i", "û": "u"})
+_TOKEN = re.compile(r"\w+")
+
+
+def fold(text: str) -> str:
+    text = text.replace("I", "ı").replace("İ", "i").lower().translate(_FOLD)
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(fold(text))
+
+
+def search_text(text: str) -> str:
+    return " ".join(tokenize(text))
+
+
+def post_search_fields(title: str, content: str) -> dict:
+    return {"search_title": search_text(title), "search_body": search_text(content)}
+
+
+def comment_search_fields(content: str) -> dict:
+    return {"search_body": search_text(content)}
+
+
+def parse_query(q: str) -> Tuple[List[str], List[str]]:
+    """Split ``q`` into folded (terms, phrases); quoted parts are phrases.
+
+    Every engine matches documents containing all phrases, or, without
+    phrases, any of the terms.
+    """
+    phrases = [search_text(phrase) for phrase in re.findall(r'"([^"]+)"', q)]
+    terms = tokenize(re.sub(r'"[^"]+"', " ", q))
+    return terms, [phrase for phrase in phrases if phrase]
+
+
+async def search_posts(storage, q: str, offset: int, limit: int):
+    """Return (total_candidates, [(post, score, comment_matches)]) ranked by relevance."""
+    terms, phrases = parse_query(q)
+    if not terms and not phrases:
+        return 0, []
+    posts = await storage.posts.search(terms, phrases, MAX_CANDIDATES)
+    comment_hits = await storage.comments.search(terms, phrases, MAX_CANDIDATES)
+
+    ranked = {post["id"]: [post, score, 0] for post, score in posts}
+    comment_scores = {}
+    for post_id, score in comment_hits:
+        entry = comment_scores.setdefault(post_id, [0.0, 0])
+        entry[0] += score * COMMENT_SCORE_FACTOR
+        entry[1] += 1
+    missing = [post_id for post_id in comment_scores if post_id not in ranked]
+    if missing:
+        for post in await storage.posts.get_many(missing):
+            ranked[post["id"]] = [post, 0.0, 0]
+    for post_id, (extra, matches) in comment_scores.items():
+        if post_id in ranked:
+            ranked[post_id][1] += extra
+            ranked[post_id][2] = matches
+
+    results = sorted(ranked.values(), key=lambda r: (-r[1], r[0]["id"]))
+    return len(results), [tuple(r) for r in results[offset:offset + limit]]
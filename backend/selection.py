@@ -0,0 +1,39 @@
+"""``fields=`` selection for the read API.
+
+Selected fields are read as a projection, so unused data never leaves the
+database. ``snippet`` is the start of ``content``, cut at a word boundary
+on the server, for clients that only show previews.
+"""
+from typing import Iterable, Optional, Tuple
+
+from fastapi import HTTPException
+
+from storage.base import SELECTABLE_POST_FIELDS, SNIPPET_LENGTH
+
+FEED_FIELDS = SELECTABLE_POST_FIELDS + ("comment_count", "latest_comments")
+
+
+def parse_fields(value: Optional[str], allowed: Iterable[str]) -> Optional[Tuple[str, ...]]:
+    """``"id,title"`` -> ("id", "title"), in the requested order; None selects everything."""
+    if value is None:
+        return None
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(",") if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if unknown or not fields:
+        raise HTTPException(status_code=400, detail=f"Geçersiz alan: {', '.join(unknown)}")
+    return fields
+
+
+def make_snippet(text: str, length: int = SNIPPET_LENGTH) -> str:
+    if len(text) <= length:
+        return text
+    cut = text[:length]
+    # Prefer the last word boundary, unless that throws away most of the text
+    boundary = max(cut.rfind(" "), cut.rfind("\n"))
+    if boundary > length // 2:
+        cut = cut[:boundary]
+    return cut.rstrip() + "…"
+
+
+def select_fields(doc: dict, fields: Tuple[str, ...]) -> dict:
+    return {field: make_snippet(doc["snippet"]) if field == "snippet" else doc.get(field) for field in fields}
@@ -1,37 +1,73 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, UploadFile, File, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from starlette.responses import Response, StreamingResponse
+import asyncio
 import logging
-from pathlib import Path
+from contextlib import asynccontextmanager
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional, Tuple
 import uuid
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 import hashlib
 import jwt
-from passlib.context import CryptContext
-
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
-
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+from archive import Archiver
+from cache import AuthorCache, FeedCache, watch_invalidations
+from coalescing import WriteCoalescer
+from compression import CompressionMiddleware
+from counters import REACTIONS, VIEWS, CounterBuffer
+from etags import etag_headers, is_not_modified, make_etag, not_modified
+from export import EXPORTABLE_COLLECTIONS, gzip_stream, iter_ndjson
+from hashing import HasherBusy, PasswordHasher
+from importer import Importer, ImportFormatError
+from live import EventBroker, watch_inserts
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, HASH_BUCKETS, Counter, MetricsMiddleware, MongoCommandMetrics, Registry
+from ratelimit import MemoryBucketStore, MongoBucketStore, RateLimited, RateLimiter, forwarded_ip
+from pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    decode_optional_cursor,
+    decode_optional_path_cursor,
+    next_cursor,
+    next_path_cursor,
+)
+from profiling import MongoProfileListener, ProfileStore, ProfilingMiddleware, record as record_profile
+from search import MAX_CANDIDATES as MAX_SEARCH_CANDIDATES, search_posts
+from selection import FEED_FIELDS, parse_fields, select_fields
+from serialization import FastJSONResponse, dumps, list_of, model_response, to_trusted_dict
+from settings import Settings, load_settings
+from storage import DuplicateKeyError, Storage, create_storage
+from storage.base import CommentRepository, comment_path, naive_utc, thread_path
 
-# Create the main app without a prefix
-app = FastAPI()
+# One app per process: create_app binds these, and the route handlers below use them directly
+settings: Settings
+storage: Storage
+metrics_registry: Registry
+hash_rejections: Counter
+rate_limit_rejections: Counter
+password_hasher: PasswordHasher
+rate_limiter: RateLimiter
+write_coalescer: Optional[WriteCoalescer] = None
+feed_cache: FeedCache
+author_cache: AuthorCache
+counter_buffer: CounterBuffer
+archiver: Archiver
+profile_store: ProfileStore
+live_broker: EventBroker
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
 # Security
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = "fsociety_secret_key_2024"
+TOKEN_VERSION_CACHE_SIZE = 100_000
+MAX_BATCH_POSTS = 50
+# Replies nest at most this deep; a deeper reply is refused
+MAX_THREAD_DEPTH = 10
+DEFAULT_REPLIES_PREVIEW = 3
+MAX_REPLIES_PREVIEW = 20
 
 # Models
 class User(BaseModel):
@@ -42,6 +78,7 @@ class User(BaseModel):
     avatar: str = "https://images.unsplash.com/photo-1616582607004-eba71ce01e07?crop=entropy&cs=srgb&fm=jpg&ixid=M3w3NTY2Nzd8MHwxfHNlYXJjaHwxfHxtYXNrZWQlMjBwb3J0cmFpdHxlbnwwfHx8YmxhY2tfYW5kX3doaXRlfDE3NTIyNDQ2MDl8MA&ixlib=rb-4.1.0&q=85"
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_admin: bool = False
+    token_version: int = 0
 
 class UserCreate(BaseModel):
     username: str
@@ -60,6 +97,11 @@ class UserResponse(BaseModel):
     created_at: datetime
     is_admin: bool
 
+class TokenUser(BaseModel):
+    id: str
+    username: str
+    is_admin: bool = False
+
 class Post(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     title: str
@@ -69,6 +111,18 @@ class Post(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+class PostCounters(BaseModel):
+    # Approximate: other workers' latest views and reactions arrive with their next flush
+    post_id: str
+    views: int
+    reactions: Dict[str, int]
+
+class ReactionCreate(BaseModel):
+    reaction: Literal[REACTIONS]
+
+class CounterBatchRequest(BaseModel):
+    post_ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_POSTS)
+
 class PostCreate(BaseModel):
     title: str
     content: str
@@ -80,37 +134,174 @@ class Comment(BaseModel):
     author_id: str
     author_username: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    # Set on replies; depth counts the ancestors, 0 for a top-level comment
+    parent_id: Optional[str] = None
+    depth: int = 0
+
+class Author(BaseModel):
+    id: str
+    username: str
+    avatar: str
+    is_admin: bool
+
+class ExpandedComment(Comment):
+    # Only with expand=author; null if the author no longer exists
+    author: Optional[Author] = None
+
+class ThreadedComment(ExpandedComment):
+    # Only with threaded=true: the first replies below this comment, depth first;
+    # replies_next_cursor continues them on GET /api/comments/{id}/replies
+    replies: List[ExpandedComment] = []
+    replies_next_cursor: Optional[str] = None
 
 class CommentCreate(BaseModel):
     post_id: str
     content: str
+    parent_id: Optional[str] = None
+
+class CommentBatchRequest(BaseModel):
+    post_ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_POSTS)
+    limit_per_post: int = Field(5, ge=1, le=MAX_PAGE_SIZE)
+
+class PostComments(BaseModel):
+    post_id: str
+    comments: List[ExpandedComment]
+    next_cursor: Optional[str] = None
+
+class SearchHit(BaseModel):
+    post: Post
+    score: float
+    comment_matches: int
+
+class SearchResult(BaseModel):
+    total: int
+    results: List[SearchHit]
+
+class FeedPost(Post):
+    comment_count: int = 0
+    latest_comments: List[Comment] = []
+
+class ExpandedFeedPost(FeedPost):
+    latest_comments: List[ExpandedComment] = []
+    author: Optional[Author] = None
+    # Only when asked for in fields=
+    snippet: Optional[str] = None
+
+Expand = Optional[Literal["author"]]
 
 # Helper functions
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+def _hasher_busy():
+    return HTTPException(
+        status_code=503,
+        detail="Sunucu meşgul, lütfen tekrar deneyin",
+        headers={"Retry-After": "1"},
+    )
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def verify_password(plain_password, hashed_password):
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except HasherBusy:
+        hash_rejections.inc("verify")
+        raise _hasher_busy()
+
+async def get_password_hash(password):
+    try:
+        return await password_hasher.hash(password)
+    except HasherBusy:
+        hash_rejections.inc("hash")
+        raise _hasher_busy()
 
-def create_access_token(data: dict):
-    to_encode = data.copy()
+def client_ip(request: Request) -> str:
+    peer = request.client.host if request.client else "unknown"
+    if settings.rate_limit_trust_proxy:
+        return forwarded_ip(request.headers.get("x-forwarded-for"), peer, settings.rate_limit_trusted_hops)
+    return peer
+
+async def enforce_rate_limit(name: str, key: str):
+    try:
+        await rate_limiter.check(name, key)
+    except RateLimited as e:
+        rate_limit_rejections.inc(name)
+        raise HTTPException(
+            status_code=429,
+            detail="Çok fazla deneme, lütfen daha sonra tekrar deneyin",
+            headers={"Retry-After": e.retry_after_header},
+        )
+
+async def expand_authors(items: List[dict]):
+    """Embed ``author`` in each item and its latest comments or replies, with one lookup for the whole page."""
+    docs = items + [
+        comment for item in items for comment in (*item.get("latest_comments", ()), *item.get("replies", ()))
+    ]
+    authors = await author_cache.resolve(doc["author_id"] for doc in docs)
+    for doc in docs:
+        doc["author"] = authors.get(doc["author_id"])
+
+def create_access_token(user: dict):
+    now = datetime.utcnow()
+    to_encode = {
+        "sub": user["username"],
+        "uid": user["id"],
+        "adm": user.get("is_admin", False),
+        "ver": user.get("token_version", 0),
+        "iat": now,
+        "exp": now + timedelta(minutes=settings.access_token_expire_minutes),
+    }
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm="HS256")
     return encoded_jwt
 
+# user id -> (token_version, monotonic time it was read)
+_token_versions: Dict[str, Tuple[int, float]] = {}
+
+async def get_token_version(user_id: str) -> Optional[int]:
+    cached = _token_versions.get(user_id)
+    now = time.monotonic()
+    if cached and now - cached[1] < settings.token_version_ttl_seconds:
+        return cached[0]
+    version = await storage.users.get_token_version(user_id)
+    if version is None:
+        _token_versions.pop(user_id, None)
+        return None
+    if len(_token_versions) >= TOKEN_VERSION_CACHE_SIZE:
+        _token_versions.clear()
+    _token_versions[user_id] = (version, now)
+    return version
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=["HS256"])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Geçersiz token")
+        payload = jwt.decode(
+            credentials.credentials,
+            SECRET_KEY,
+            algorithms=["HS256"],
+            options={"require": ["sub", "uid", "exp"]},
+        )
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Geçersiz token")
-    
-    user = await db.users.find_one({"username": username})
-    if user is None:
+
+    # Revocation: tokens minted before the user's last logout-all are rejected
+    version = await get_token_version(payload["uid"])
+    if version is None:
         raise HTTPException(status_code=401, detail="Kullanıcı bulunamadı")
-    
-    return UserResponse(**user)
+    if payload.get("ver", 0) != version:
+        raise HTTPException(status_code=401, detail="Geçersiz token")
+
+    return TokenUser(id=payload["uid"], username=payload["sub"], is_admin=payload.get("adm", False))
+
+async def require_admin(current_user: TokenUser = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Yetkisiz erişim")
+    return current_user
+
+async def is_admin_token(authorization: Optional[str]) -> bool:
+    """require_admin for an Authorization header seen outside a route (the profiling switch)."""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        user = await get_current_user(HTTPAuthorizationCredentials(scheme=scheme, credentials=token))
+    except HTTPException:
+        return False
+    return user.is_admin
 
 # Routes
 @api_router.get("/")
@@ -118,15 +309,15 @@ async def root():
     return {"message": "fsociety yeraltı dünyasına hoş geldiniz"}
 
 @api_router.post("/register", response_model=UserResponse)
-async def register(user_data: UserCreate):
+async def register(user_data: UserCreate, request: Request):
+    await enforce_rate_limit("register_ip", client_ip(request))
     # Check if user exists
-    existing_user = await db.users.find_one({"$or": [{"username": user_data.username}, {"email": user_data.email}]})
-    if existing_user:
+    if await storage.users.username_or_email_taken(user_data.username, user_data.email):
         raise HTTPException(status_code=400, detail="Kullanıcı adı veya email zaten mevcut")
     
     # Create user
     user_dict = user_data.dict()
-    user_dict["password_hash"] = get_password_hash(user_data.password)
+    user_dict["password_hash"] = await get_password_hash(user_data.password)
     del user_dict["password"]
     
     # Check if this is admin
@@ -134,23 +325,28 @@ async def register(user_data: UserCreate):
         user_dict["is_admin"] = True
     
     user_obj = User(**user_dict)
-    await db.users.insert_one(user_obj.dict())
+    try:
+        await storage.users.insert(user_obj.dict())
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Kullanıcı adı veya email zaten mevcut")
     
     return UserResponse(**user_obj.dict())
 
 @api_router.post("/login")
-async def login(user_data: UserLogin):
+async def login(user_data: UserLogin, request: Request):
+    await enforce_rate_limit("login_ip", client_ip(request))
+    await enforce_rate_limit("login_username", user_data.username)
     # Find user
-    user = await db.users.find_one({"username": user_data.username})
+    user = await storage.users.get_by_username(user_data.username)
     if not user:
         raise HTTPException(status_code=401, detail="Geçersiz kullanıcı bilgileri")
     
     # Verify password
-    if not verify_password(user_data.password, user["password_hash"]):
+    if not await verify_password(user_data.password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Geçersiz kullanıcı bilgileri")
     
     # Create token
-    access_token = create_access_token({"sub": user["username"]})
+    access_token = create_access_token(user)
     
     return {
         "access_token": access_token,
@@ -158,68 +354,604 @@ async def login(user_data: UserLogin):
         "user": UserResponse(**user)
     }
 
-@api_router.get("/posts", response_model=List[Post])
-async def get_posts():
-    posts = await db.posts.find().sort("created_at", -1).to_list(1000)
-    return [Post(**post) for post in posts]
+async def render_feed_page(generation: int, version: int, etag: str, limit: int, cursor: Optional[str], with_counts: bool,
+                           comments_preview: int, expand: Optional[str], fields: Optional[Tuple[str, ...]]) -> Tuple[bytes, Optional[str]]:
+    """Body and next cursor of a feed page, served from and stored in the hot cache when it is one of the first pages."""
+    key = (limit, cursor, with_counts, comments_preview, expand, fields)
+    depth = feed_cache.page_depth_of(cursor) if settings.feed_cache_enabled else None
+    if depth is not None:
+        cached = feed_cache.get_page(version, key)
+        if cached:
+            _, body, cursor_out = cached
+            return body, cursor_out
+
+    # Keyset pagination on (created_at, id); the next page cursor goes in a header
+    after = decode_optional_cursor(cursor)
+    # Expanding authors needs author_id even when it is not returned
+    read = fields + ("author_id",) if fields and expand else fields
+    if with_counts or comments_preview:
+        posts = await storage.posts.feed_page(after, limit + 1, comments_preview, read)
+        model = FeedPost
+        for post in posts:
+            post["latest_comments"] = list_of(Comment, post["latest_comments"])
+    else:
+        posts = await storage.posts.page(after, limit + 1, read)
+        model = Post
+    cursor_out = next_cursor(posts, limit)
+    if fields:
+        if expand:
+            await expand_authors(posts)
+        items = [select_fields(post, fields + ("author",) if expand else fields) for post in posts]
+    else:
+        items = list_of(model, posts)
+        if expand:
+            await expand_authors(items)
+    body = dumps(items)
+    if depth is not None:
+        feed_cache.put_page(generation, version, key, depth, etag, body, cursor_out)
+    return body, cursor_out
+
+@api_router.get("/posts", response_model=List[ExpandedFeedPost])
+async def get_posts(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    with_counts: bool = False,
+    comments_preview: int = Query(0, ge=0, le=10),
+    expand: Expand = None,
+    fields: Optional[str] = Query(None, description="Comma-separated, e.g. id,title,author_username,created_at,snippet"),
+):
+    selected = parse_fields(fields, FEED_FIELDS)
+    # Only the feed_page read loads these; latest_comments stays [] without comments_preview
+    if selected and ("comment_count" in selected or "latest_comments" in selected):
+        with_counts = True
+    generation = feed_cache.generation
+    version = await feed_cache.feed_version()
+    etag = make_etag("posts", version, limit, cursor, with_counts, comments_preview, expand, selected)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    body, cursor_out = await render_feed_page(generation, version, etag, limit, cursor, with_counts, comments_preview, expand, selected)
+    return Response(body, media_type="application/json", headers=etag_headers(etag, {"X-Next-Cursor": cursor_out}))
 
 @api_router.post("/posts", response_model=Post)
-async def create_post(post_data: PostCreate, current_user: UserResponse = Depends(get_current_user)):
+async def create_post(post_data: PostCreate, current_user: TokenUser = Depends(get_current_user)):
     post_dict = post_data.dict()
     post_dict["author_id"] = current_user.id
     post_dict["author_username"] = current_user.username
     
     post_obj = Post(**post_dict)
-    await db.posts.insert_one(post_obj.dict())
+    if write_coalescer:
+        await write_coalescer.insert("posts", post_obj.dict())
+    else:
+        await storage.posts.insert(post_obj.dict())
+        await storage.bump_feed_version()
+    feed_cache.invalidate_feed()
+    if settings.live_source == "local":
+        live_broker.publish("post", post_obj.dict())
     
     return post_obj
 
 @api_router.get("/posts/{post_id}", response_model=Post)
-async def get_post(post_id: str):
-    post = await db.posts.find_one({"id": post_id})
-    if not post:
-        raise HTTPException(status_code=404, detail="Gönderi bulunamadı")
+async def get_post(post_id: str, request: Request):
+    post = feed_cache.get_post(post_id) if settings.feed_cache_enabled else None
+    if post is None:
+        generation = feed_cache.generation
+        post = await storage.posts.get(post_id) or await storage.archived_posts.get(post_id)
+        if not post:
+            raise HTTPException(status_code=404, detail="Gönderi bulunamadı")
+        if settings.feed_cache_enabled:
+            feed_cache.put_post(generation, post)
+    counter_buffer.add(post_id, VIEWS)
     
-    return Post(**post)
+    etag = make_etag("post", post_id, post["updated_at"])
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    return model_response(Post, post, headers=etag_headers(etag))
+
+async def comment_source(post_id: str) -> Tuple[Optional[int], CommentRepository]:
+    """comment_count of a post and where its comments are: hot, or archived with the post."""
+    comment_count = await storage.posts.comment_count(post_id)
+    if comment_count is None:
+        archived_count = await storage.archived_posts.comment_count(post_id)
+        if archived_count is not None:
+            return archived_count, storage.archived_comments
+    return comment_count, storage.comments
+
+async def attach_replies(repository: CommentRepository, items: List[dict], comments: List[dict], per_thread: int):
+    """Add the first ``per_thread`` replies below each comment, read for the whole page at once."""
+    paths = [comment_path(comment) for comment in comments]
+    subtrees = await repository.subtrees(paths, per_thread + 1)
+    for item, path in zip(items, paths):
+        replies = subtrees[path]
+        item["replies_next_cursor"] = next_path_cursor(replies, per_thread)
+        item["replies"] = list_of(Comment, replies)
+
+@api_router.get("/posts/{post_id}/comments", response_model=List[ThreadedComment])
+async def get_comments(
+    post_id: str,
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    expand: Expand = None,
+    threaded: bool = False,
+    replies: int = Query(DEFAULT_REPLIES_PREVIEW, ge=1, le=MAX_REPLIES_PREVIEW),
+):
+    """All comments oldest first, or with ``threaded`` only top-level ones, each with its first ``replies`` replies."""
+    # comment_count changes with every new comment or reply on the post, so it versions the thread
+    comment_count, repository = await comment_source(post_id)
+    etag = make_etag("comments", post_id, comment_count, limit, cursor, expand, threaded, threaded and replies)
+    if comment_count is not None and is_not_modified(request, etag):
+        return not_modified(etag)
+
+    read_page = repository.top_level_page if threaded else repository.page
+    comments = await read_page(post_id, decode_optional_cursor(cursor), limit + 1)
+    cursor_out = next_cursor(comments, limit)
+    headers = {"X-Next-Cursor": cursor_out} if cursor_out else {}
+    if comment_count is not None:
+        headers = etag_headers(etag, headers)
+    items = list_of(Comment, comments)
+    if threaded:
+        await attach_replies(repository, items, comments, replies)
+    if expand:
+        await expand_authors(items)
+    return FastJSONResponse(items, headers=headers)
+
+@api_router.get("/comments/{comment_id}/replies", response_model=List[ExpandedComment])
+async def get_replies(
+    comment_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    expand: Expand = None,
+):
+    """Every reply below a comment, at any depth, depth first."""
+    repository = storage.comments
+    parent = await repository.get(comment_id)
+    if parent is None:
+        repository = storage.archived_comments
+        parent = await repository.get(comment_id)
+    if parent is None:
+        raise HTTPException(status_code=404, detail="Yorum bulunamadı")
+    replies = await repository.subtree(comment_path(parent), decode_optional_path_cursor(cursor), limit + 1)
+    cursor_out = next_path_cursor(replies, limit)
+    items = list_of(Comment, replies)
+    if expand:
+        await expand_authors(items)
+    return FastJSONResponse(items, headers={"X-Next-Cursor": cursor_out} if cursor_out else {})
 
-@api_router.get("/posts/{post_id}/comments", response_model=List[Comment])
-async def get_comments(post_id: str):
-    comments = await db.comments.find({"post_id": post_id}).sort("created_at", 1).to_list(1000)
-    return [Comment(**comment) for comment in comments]
+@api_router.post("/comments/batch", response_model=List[PostComments])
+async def get_comments_batch(batch: CommentBatchRequest, expand: Expand = None):
+    post_ids = list(dict.fromkeys(batch.post_ids))
+    # One extra comment per post tells whether more exist
+    rows = await storage.comments.first_for_posts(post_ids, batch.limit_per_post + 1)
+    # Same order as requested; unknown post ids are left out
+    groups = []
+    for post_id in post_ids:
+        if post_id not in rows:
+            continue
+        comments = rows[post_id]
+        cursor_out = next_cursor(comments, batch.limit_per_post)
+        groups.append({"post_id": post_id, "comments": list_of(Comment, comments), "next_cursor": cursor_out})
+    if expand:
+        await expand_authors([comment for group in groups for comment in group["comments"]])
+    return FastJSONResponse(groups)
 
 @api_router.post("/comments", response_model=Comment)
-async def create_comment(comment_data: CommentCreate, current_user: UserResponse = Depends(get_current_user)):
+async def create_comment(comment_data: CommentCreate, current_user: TokenUser = Depends(get_current_user)):
     comment_dict = comment_data.dict()
     comment_dict["author_id"] = current_user.id
     comment_dict["author_username"] = current_user.username
+    if (
+        await storage.posts.comment_count(comment_data.post_id) is None
+        and await storage.archived_posts.comment_count(comment_data.post_id) is not None
+    ):
+        raise HTTPException(status_code=409, detail="Arşivlenmiş gönderiye yorum yapılamaz")
+    parent = None
+    if comment_data.parent_id is not None:
+        parent = await storage.comments.get(comment_data.parent_id)
+        if parent is None or parent["post_id"] != comment_data.post_id:
+            raise HTTPException(status_code=404, detail="Yanıtlanan yorum bulunamadı")
+        comment_dict["depth"] = parent.get("depth", 0) + 1
+        if comment_dict["depth"] > MAX_THREAD_DEPTH:
+            raise HTTPException(status_code=400, detail="Yanıt zinciri çok derin")
     
     comment_obj = Comment(**comment_dict)
-    await db.comments.insert_one(comment_obj.dict())
+    comment = comment_obj.dict()
+    if parent is not None:
+        comment["path"] = thread_path(comment_path(parent), comment_obj.created_at, comment_obj.id)
+    if write_coalescer:
+        await write_coalescer.insert("comments", comment)
+    else:
+        await storage.comments.insert(comment)
+        await storage.posts.increment_comment_count(comment_obj.post_id)
+        await storage.bump_feed_version()
+    feed_cache.invalidate_feed()
+    if settings.live_source == "local":
+        live_broker.publish("comment", comment_obj.dict())
     
     return comment_obj
 
+def post_counters(post_id: str, counts: Dict[str, int]) -> dict:
+    return {
+        "post_id": post_id,
+        "views": counts.get(VIEWS, 0),
+        "reactions": {reaction: counts.get(reaction, 0) for reaction in REACTIONS},
+    }
+
+@api_router.get("/posts/{post_id}/counters", response_model=PostCounters)
+async def get_post_counters(post_id: str):
+    """Approximate view and reaction totals; unknown posts read as zero."""
+    totals = await counter_buffer.totals([post_id])
+    return FastJSONResponse(post_counters(post_id, totals[post_id]))
+
+@api_router.post("/counters/batch", response_model=List[PostCounters])
+async def get_counters_batch(batch: CounterBatchRequest):
+    totals = await counter_buffer.totals(batch.post_ids)
+    return FastJSONResponse([post_counters(post_id, counts) for post_id, counts in totals.items()])
+
+@api_router.post("/posts/{post_id}/reactions", response_model=PostCounters, status_code=202)
+async def add_reaction(post_id: str, reaction: ReactionCreate, current_user: TokenUser = Depends(get_current_user)):
+    """Counted now, written with the next counter flush."""
+    if await storage.posts.comment_count(post_id) is None and await storage.archived_posts.comment_count(post_id) is None:
+        raise HTTPException(status_code=404, detail="Gönderi bulunamadı")
+    counter_buffer.add(post_id, reaction.reaction)
+    totals = await counter_buffer.totals([post_id])
+    return FastJSONResponse(post_counters(post_id, totals[post_id]), status_code=202)
+
+@api_router.get("/stream")
+async def stream_events(request: Request):
+    if live_broker.is_full:
+        raise HTTPException(status_code=503, detail="Sunucu meşgul, lütfen tekrar deneyin", headers={"Retry-After": "5"})
+    return StreamingResponse(
+        live_broker.stream(request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@api_router.get("/search", response_model=SearchResult)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    offset: int = Query(0, ge=0, lt=MAX_SEARCH_CANDIDATES),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    total, hits = await search_posts(storage, q, offset, limit)
+    results = [
+        {"post": to_trusted_dict(Post, post), "score": round(score, 4), "comment_matches": matches}
+        for post, score, matches in hits
+    ]
+    return FastJSONResponse({"total": total, "results": results})
+
 @api_router.get("/me", response_model=UserResponse)
-async def get_current_user_info(current_user: UserResponse = Depends(get_current_user)):
-    return current_user
+async def get_current_user_info(current_user: TokenUser = Depends(get_current_user)):
+    user = await storage.users.get_by_id(current_user.id)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Kullanıcı bulunamadı")
+    return UserResponse(**user)
+
+@api_router.post("/logout-all")
+async def logout_all(current_user: TokenUser = Depends(get_current_user)):
+    # Bumping token_version invalidates every token issued so far
+    version = await storage.users.bump_token_version(current_user.id)
+    if version is None:
+        raise HTTPException(status_code=401, detail="Kullanıcı bulunamadı")
+    _token_versions[current_user.id] = (version, time.monotonic())
+    return {"message": "Tüm oturumlar sonlandırıldı"}
 
-# Include the router in the main app
-app.include_router(api_router)
+@api_router.get("/admin/query-plans")
+async def get_query_plans(current_user: TokenUser = Depends(require_admin)):
+    return {"engine": storage.name, **await storage.query_plans()}
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+@api_router.get("/admin/stats/hashing")
+async def get_hashing_stats(current_user: TokenUser = Depends(require_admin)):
+    return password_hasher.stats()
+
+@api_router.get("/admin/stats/cache")
+async def get_cache_stats(current_user: TokenUser = Depends(require_admin)):
+    return {"enabled": settings.feed_cache_enabled, **feed_cache.stats(), "authors": author_cache.stats()}
+
+@api_router.get("/admin/stats/writes")
+async def get_write_stats(current_user: TokenUser = Depends(require_admin)):
+    return {"coalescing": settings.write_coalescing, **(write_coalescer.stats() if write_coalescer else {})}
+
+@api_router.get("/admin/stats/counters")
+async def get_counter_stats(current_user: TokenUser = Depends(require_admin)):
+    return counter_buffer.stats()
+
+@api_router.get("/admin/stats/archive")
+async def get_archive_stats(current_user: TokenUser = Depends(require_admin)):
+    return {"interval_seconds": settings.archive_interval_seconds if settings.archive_after_days else None, **archiver.stats()}
+
+@api_router.post("/admin/archive")
+async def archive_old_posts(
+    older_than_days: Optional[float] = Query(None, gt=0),
+    current_user: TokenUser = Depends(require_admin),
+):
+    """Archive now; defaults to ARCHIVE_AFTER_DAYS."""
+    if older_than_days is None and settings.archive_after_days is None:
+        raise HTTPException(status_code=400, detail="Arşivleme yaşı belirtilmeli (older_than_days)")
+    return await archiver.run_once(timedelta(days=older_than_days) if older_than_days else None)
+
+@api_router.get("/admin/profiles")
+async def list_profiles(limit: int = Query(20, ge=1, le=200), current_user: TokenUser = Depends(require_admin)):
+    """Newest saved request profiles, without their function lists."""
+    return await asyncio.to_thread(profile_store.recent, limit)
+
+@api_router.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, current_user: TokenUser = Depends(require_admin)):
+    profile = await asyncio.to_thread(profile_store.get, profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profil bulunamadı")
+    return profile
+
+@api_router.get("/admin/stats/rate-limits")
+async def get_rate_limit_stats(current_user: TokenUser = Depends(require_admin)):
+    return {
+        "store": settings.rate_limit_store,
+        "limits": {name: limit and {"capacity": limit.capacity, "per_seconds": limit.per_seconds} for name, limit in rate_limiter.limits.items()},
+        "rejected": rate_limiter.rejected,
+    }
+
+@api_router.get("/admin/stats/stream")
+async def get_stream_stats(current_user: TokenUser = Depends(require_admin)):
+    return live_broker.stats()
+
+@api_router.get("/export")
+async def export_data(
+    collections: str = ",".join(EXPORTABLE_COLLECTIONS),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    gzip: bool = False,
+    current_user: TokenUser = Depends(require_admin),
+):
+    names = [name.strip() for name in collections.split(",") if name.strip()]
+    unknown = [name for name in names if name not in EXPORTABLE_COLLECTIONS]
+    if unknown or not names:
+        raise HTTPException(status_code=400, detail=f"Geçersiz koleksiyon: {', '.join(unknown)}")
+
+    # Stored datetimes are naive UTC; an offset in the query would otherwise break the comparison
+    body = iter_ndjson(storage, names, since and naive_utc(since), until and naive_utc(until))
+    filename = f"fsociety-export-{datetime.utcnow():%Y%m%dT%H%M%S}.ndjson"
+    media_type = "application/x-ndjson"
+    if gzip:
+        body = gzip_stream(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@api_router.post("/admin/import")
+async def import_legacy_data(
+    kind: str = Query(..., pattern="^(users|posts)$"),
+    file: UploadFile = File(...),
+    resume: bool = True,
+    batch_size: int = Query(1000, ge=1, le=10000),
+    current_user: TokenUser = Depends(require_admin),
+):
+    importer = Importer(storage, password_hasher, batch_size=batch_size)
+    try:
+        stats = await importer.run(kind, file.filename or "upload", file.read, resume=resume)
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=f"Geçersiz veri dosyası: {e}")
+    finally:
+        feed_cache.invalidate_feed()
+    return stats.as_dict()
+
+async def get_metrics():
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return Response(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+# The web client's first page (FEED_PARAMS in frontend/src/App.js)
+WARMUP_FEED_PAGE = (DEFAULT_PAGE_SIZE, None, True, 2, None, None)
+
+async def warm_up():
+    """Open pooled connections and render the first feed page, so early requests find them ready."""
+    await storage.warmup(settings.mongo_min_pool_size)
+    await password_hasher.warmup()
+    try:
+        generation = feed_cache.generation
+        version = await feed_cache.feed_version()
+        etag = make_etag("posts", version, *WARMUP_FEED_PAGE)
+        await render_feed_page(generation, version, etag, *WARMUP_FEED_PAGE)
+    except Exception:
+        logger.warning("Feed cache warmup failed; first requests will fill it", exc_info=True)
+
+async def startup(app: FastAPI):
+    # Indexes/schema and, on mongo, background backfills of older documents
+    await storage.startup()
+    if settings.warmup:
+        await warm_up()
+    counter_buffer.start()
+    app.state.tasks = []
+    if settings.feed_cache_enabled and settings.feed_cache_invalidation == "change_stream":
+        app.state.tasks.append(asyncio.create_task(watch_invalidations(storage.db, feed_cache)))
+    if settings.archive_after_days is not None:
+        app.state.tasks.append(asyncio.create_task(archiver.run(settings.archive_interval_seconds)))
+    if settings.live_source == "change_stream":
+        app.state.tasks.append(asyncio.create_task(
+            watch_inserts(storage.db, live_broker, list(Post.model_fields), list(Comment.model_fields))
+        ))
+
+async def shutdown(app: FastAPI):
+    for task in app.state.tasks:
+        task.cancel()
+    await asyncio.gather(*app.state.tasks, return_exceptions=True)
+    live_broker.close()
+    if write_coalescer:
+        # Acknowledge queued writes before the connection goes away
+        await write_coalescer.close()
+    await counter_buffer.close()
+    await storage.close()
+    password_hasher.shutdown()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup(app)
+    try:
+        yield
+    finally:
+        await shutdown(app)
+
+def create_app(app_settings: Optional[Settings] = None) -> FastAPI:
+    """Build the API from ``app_settings`` (default: the environment and ``backend/.env``).
+
+    Nothing connects until the lifespan starts: uvicorn then opens the
+    storage, warms connections and caches and only afterwards accepts
+    traffic. Run one worker per core with
+
+        uvicorn --factory server:create_app --host 0.0.0.0 --port 8001 --workers 4
+
+    Every worker is a separate process with its own connection pool, caches,
+    rate limit buckets and metrics, so keep workers x MONGO_MAX_POOL_SIZE
+    under the server's connection limit. WEB_CONCURRENCY (uvicorn's default
+    worker count) also splits the bcrypt pool between workers. For limits
+    and caches that hold across workers use RATE_LIMIT_STORE=mongo,
+    FEED_CACHE_INVALIDATION=change_stream and LIVE_SOURCE=change_stream;
+    STORAGE_ENGINE=memory only works with a single worker.
+    """
+    global settings, storage, metrics_registry, hash_rejections, rate_limit_rejections, password_hasher
+    global rate_limiter, write_coalescer, feed_cache, author_cache, counter_buffer, archiver, live_broker
+    global profile_store
+    settings = app_settings or load_settings()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    # Prometheus metrics on /metrics; Mongo command latency comes from a driver listener
+    metrics_registry = Registry()
+    client_options = settings.mongo_client_options()
+    client_options["event_listeners"] = []
+    if settings.metrics_enabled:
+        client_options["event_listeners"].append(MongoCommandMetrics(metrics_registry))
+    if settings.profiling_enabled:
+        client_options["event_listeners"].append(MongoProfileListener())
+    # Storage engine (STORAGE_ENGINE=mongo|sqlite|memory); connects on startup
+    storage = create_storage(settings.storage_engine, settings.env, **client_options)
+    _token_versions.clear()
+
+    hash_duration = metrics_registry.histogram(
+        "password_hash_duration_seconds", "bcrypt time per operation", ("operation",), HASH_BUCKETS
+    )
+    hash_wait = metrics_registry.histogram(
+        "password_hash_queue_wait_seconds", "Time waiting for a hashing worker", ("operation",), HASH_BUCKETS
+    )
+    hash_rejections = metrics_registry.counter("password_hash_rejected_total", "Hashing requests rejected as busy", ("operation",))
+    password_hasher = PasswordHasher(
+        workers=settings.password_hash_workers,
+        max_queue=settings.password_hash_queue,
+        executor=settings.password_hash_executor,
+    )
+    if settings.metrics_enabled or settings.profiling_enabled:
+        def _observe_hash(operation, hash_seconds, wait_seconds):
+            record_profile("bcrypt", hash_seconds + wait_seconds)
+            if settings.metrics_enabled:
+                hash_duration.observe(hash_seconds, operation)
+                hash_wait.observe(wait_seconds, operation)
+        password_hasher.observer = _observe_hash
+
+    # Token buckets in front of bcrypt
+    rate_limiter = RateLimiter(
+        MongoBucketStore(storage.db) if settings.rate_limit_store == "mongo" else MemoryBucketStore(),
+        settings.rate_limits,
+    )
+    rate_limit_rejections = metrics_registry.counter("rate_limited_total", "Requests rejected by a rate limit", ("limit",))
+
+    # Opt-in: batch post/comment inserts, adding at most WRITE_COALESCE_MAX_DELAY_MS to each write
+    write_coalescer = None
+    if settings.write_coalescing:
+        write_batch_size = metrics_registry.histogram(
+            "coalesced_write_batch_size", "Documents per coalesced insert batch", buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+        )
+        write_coalescer = WriteCoalescer(
+            storage,
+            max_batch=settings.write_coalesce_max_batch,
+            max_delay=settings.write_coalesce_max_delay_ms / 1000,
+            observer=lambda size, seconds: write_batch_size.observe(size),
+        )
+
+    # Hot feed pages and posts; "change_stream" (mongo replica set) skips the feed version lookup on hits
+    feed_cache = FeedCache(
+        storage,
+        max_pages=settings.feed_cache_max_pages,
+        max_posts=settings.post_cache_max_entries,
+        page_depth=settings.feed_cache_page_depth,
+    )
+    author_cache = AuthorCache(storage, ttl=settings.author_cache_ttl_seconds, max_entries=settings.author_cache_max_entries)
+
+    # Views and reactions, written in batches every COUNTER_FLUSH_INTERVAL_SECONDS
+    counter_flush_size = metrics_registry.histogram(
+        "counter_flush_documents", "Counter documents updated per flush", buckets=(1, 10, 50, 100, 500, 1000, 5000)
+    )
+    counter_buffer = CounterBuffer(
+        storage,
+        flush_interval=settings.counter_flush_interval_seconds,
+        shards=settings.counter_shards,
+        hot_threshold=settings.counter_hot_threshold,
+        read_ttl=settings.counter_read_ttl_seconds,
+        observer=lambda documents, seconds: counter_flush_size.observe(documents),
+    )
+
+    # Old posts leave the hot collections; the job runs in every worker when ARCHIVE_AFTER_DAYS is set
+    archiver = Archiver(
+        storage,
+        max_age=timedelta(days=settings.archive_after_days) if settings.archive_after_days else None,
+        batch_size=settings.archive_batch_size,
+        observer=lambda posts, comments: feed_cache.invalidate_feed(),
+    )
+
+    profile_store = ProfileStore(settings.profile_dir, max_files=settings.profile_max_files)
+
+    live_broker = EventBroker(
+        max_clients=settings.stream_max_clients,
+        max_queue=settings.stream_queue_size,
+        heartbeat_seconds=settings.stream_heartbeat_seconds,
+    )
+
+    metrics_registry.gauge_function("password_hash_queue_depth", "Hashing jobs waiting for a worker", lambda: password_hasher.queue_depth)
+    metrics_registry.counter_function(
+        "cache_hits_total", "Hot cache hits", lambda: {("feed",): feed_cache.pages.hits, ("post",): feed_cache.posts.hits, ("author",): author_cache.profiles.hits}, ("cache",)
+    )
+    metrics_registry.counter_function(
+        "cache_misses_total", "Hot cache misses", lambda: {("feed",): feed_cache.pages.misses, ("post",): feed_cache.posts.misses, ("author",): author_cache.profiles.misses}, ("cache",)
+    )
+    metrics_registry.gauge_function("stream_clients", "Connected /api/stream clients", lambda: live_broker.client_count)
+
+    app = FastAPI(lifespan=lifespan)
+    app.add_api_route("/metrics", get_metrics, include_in_schema=False)
+    app.include_router(api_router)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "ETag", "X-Profile-Id"],
+    )
+    if settings.compression_enabled:
+        app.add_middleware(
+            CompressionMiddleware,
+            minimum_size=settings.compression_min_size,
+            registry=metrics_registry if settings.metrics_enabled else None,
+        )
+    if settings.metrics_enabled:
+        app.add_middleware(MetricsMiddleware, registry=metrics_registry, routes=lambda: app.routes)
+    if settings.profiling_enabled:
+        # Outermost, so the profile covers every other middleware too
+        app.add_middleware(
+            ProfilingMiddleware, store=profile_store, authorize=is_admin_token, sample_rate=settings.profile_sample_rate
+        )
+    return app
+
+def __getattr__(name):
+    # Keeps ``uvicorn server:app`` working; the app is only built when first asked for
+    global app
+    if name == "app":
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,188 @@
+"""Server settings, read once from the environment (and ``backend/.env``).
+
+``create_app`` takes a ``Settings``; build one with ``load_settings()`` or
+``Settings.from_env(env)`` to configure an app without touching
+``os.environ``.
+"""
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Mapping, Optional
+
+from dotenv import load_dotenv
+
+from ratelimit import Limit, parse_limit
+
+ROOT_DIR = Path(__file__).parent
+
+
+def _flag(env: Mapping[str, str], name: str, default: str) -> bool:
+    return env.get(name, default) == "1"
+
+
+def _optional_int(env: Mapping[str, str], name: str) -> Optional[int]:
+    value = env.get(name)
+    return int(value) if value else None
+
+
+@dataclass(frozen=True)
+class Settings:
+    # Storage engine selection (STORAGE_ENGINE, MONGO_URL, DB_NAME, SQLITE_PATH) reads this mapping
+    env: Mapping[str, str] = field(repr=False, compare=False)
+    storage_engine: str = "mongo"
+
+    # Motor connection pool; each uvicorn worker has its own
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 10
+    mongo_max_idle_time_ms: Optional[int] = None
+    mongo_connect_timeout_ms: int = 5000
+    mongo_server_selection_timeout_ms: int = 5000
+    mongo_socket_timeout_ms: Optional[int] = None
+    mongo_wait_queue_timeout_ms: Optional[int] = None
+
+    # Open connections and render the first feed page before accepting traffic
+    warmup: bool = True
+
+    metrics_enabled: bool = True
+    password_hash_workers: int = 1
+    password_hash_queue: int = 64
+    password_hash_executor: str = "thread"
+    access_token_expire_minutes: int = 60 * 24
+    # How long a worker trusts its cached token_version before re-reading it
+    token_version_ttl_seconds: float = 60
+    # "local" publishes the writes this worker serves; "change_stream" follows all workers' inserts (mongo only)
+    live_source: str = "local"
+    stream_max_clients: int = 10000
+    stream_queue_size: int = 100
+    stream_heartbeat_seconds: float = 15
+
+    rate_limit_store: str = "memory"
+    # Only behind a trusted reverse proxy: take the client IP from X-Forwarded-For,
+    # counting rate_limit_trusted_hops proxies from the right
+    rate_limit_trust_proxy: bool = False
+    rate_limit_trusted_hops: int = 1
+    rate_limits: Dict[str, Optional[Limit]] = field(default_factory=dict)
+
+    write_coalescing: bool = False
+    write_coalesce_max_batch: int = 100
+    write_coalesce_max_delay_ms: float = 5
+
+    # Views and reactions are buffered per worker and written every counter_flush_interval_seconds;
+    # posts with counter_hot_threshold increments in one flush are spread over counter_shards documents
+    counter_flush_interval_seconds: float = 1.0
+    counter_shards: int = 1
+    counter_hot_threshold: int = 100
+    counter_read_ttl_seconds: float = 5.0
+
+    # Posts older than archive_after_days move to the archive collections every
+    # archive_interval_seconds; None leaves archival to POST /api/admin/archive
+    archive_after_days: Optional[float] = None
+    archive_batch_size: int = 500
+    archive_interval_seconds: float = 3600
+
+    # Admins profile a request with "X-Profile: 1"; profile_sample_rate also profiles a random share
+    profiling_enabled: bool = True
+    profile_sample_rate: float = 0.0
+    profile_dir: Path = ROOT_DIR / "profiles"
+    profile_max_files: int = 200
+
+    # gzip/brotli for responses of at least compression_min_size bytes
+    compression_enabled: bool = True
+    compression_min_size: int = 1024
+
+    feed_cache_enabled: bool = True
+    feed_cache_invalidation: str = "version"
+    feed_cache_max_pages: int = 256
+    post_cache_max_entries: int = 10_000
+    feed_cache_page_depth: int = 3
+    author_cache_ttl_seconds: float = 60
+    author_cache_max_entries: int = 10_000
+
+    def __post_init__(self):
+        mongo_only = {
+            "LIVE_SOURCE=change_stream": self.live_source == "change_stream",
+            "RATE_LIMIT_STORE=mongo": self.rate_limit_store == "mongo",
+            "FEED_CACHE_INVALIDATION=change_stream": self.feed_cache_invalidation == "change_stream",
+        }
+        for option, enabled in mongo_only.items():
+            if enabled and self.storage_engine != "mongo":
+                raise RuntimeError(f"{option} requires STORAGE_ENGINE=mongo")
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str] = os.environ) -> "Settings":
+        # Uvicorn's --workers default; bcrypt threads are shared out between the workers
+        web_workers = max(1, int(env.get("WEB_CONCURRENCY", 1)))
+        return cls(
+            env=env,
+            storage_engine=env.get("STORAGE_ENGINE", "mongo"),
+            mongo_max_pool_size=int(env.get("MONGO_MAX_POOL_SIZE", 100)),
+            mongo_min_pool_size=int(env.get("MONGO_MIN_POOL_SIZE", 10)),
+            mongo_max_idle_time_ms=_optional_int(env, "MONGO_MAX_IDLE_TIME_MS"),
+            mongo_connect_timeout_ms=int(env.get("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+            mongo_server_selection_timeout_ms=int(env.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+            mongo_socket_timeout_ms=_optional_int(env, "MONGO_SOCKET_TIMEOUT_MS"),
+            mongo_wait_queue_timeout_ms=_optional_int(env, "MONGO_WAIT_QUEUE_TIMEOUT_MS"),
+            warmup=_flag(env, "WARMUP_ENABLED", "1"),
+            metrics_enabled=_flag(env, "METRICS_ENABLED", "1"),
+            password_hash_workers=int(env.get("PASSWORD_HASH_WORKERS", max(1, (os.cpu_count() or 1) // web_workers))),
+            password_hash_queue=int(env.get("PASSWORD_HASH_QUEUE", 64)),
+            password_hash_executor=env.get("PASSWORD_HASH_EXECUTOR", "thread"),
+            access_token_expire_minutes=int(env.get("ACCESS_TOKEN_EXPIRE_MINUTES", 60 * 24)),
+            token_version_ttl_seconds=float(env.get("TOKEN_VERSION_TTL_SECONDS", 60)),
+            live_source=env.get("LIVE_SOURCE", "local"),
+            stream_max_clients=int(env.get("STREAM_MAX_CLIENTS", 10000)),
+            stream_queue_size=int(env.get("STREAM_QUEUE_SIZE", 100)),
+            stream_heartbeat_seconds=float(env.get("STREAM_HEARTBEAT_SECONDS", 15)),
+            rate_limit_store=env.get("RATE_LIMIT_STORE", "memory"),
+            rate_limit_trust_proxy=_flag(env, "RATE_LIMIT_TRUST_PROXY", "0"),
+            rate_limit_trusted_hops=int(env.get("RATE_LIMIT_TRUSTED_HOPS", 1)),
+            # "N/S" allows N requests per S seconds, "0" disables a limit
+            rate_limits={
+                "login_ip": parse_limit(env.get("RATE_LIMIT_LOGIN_IP", "30/60")),
+                "login_username": parse_limit(env.get("RATE_LIMIT_LOGIN_USERNAME", "10/60")),
+                "register_ip": parse_limit(env.get("RATE_LIMIT_REGISTER_IP", "10/600")),
+            },
+            write_coalescing=_flag(env, "WRITE_COALESCING", "0"),
+            write_coalesce_max_batch=int(env.get("WRITE_COALESCE_MAX_BATCH", 100)),
+            write_coalesce_max_delay_ms=float(env.get("WRITE_COALESCE_MAX_DELAY_MS", 5)),
+            counter_flush_interval_seconds=float(env.get("COUNTER_FLUSH_INTERVAL_SECONDS", 1.0)),
+            counter_shards=int(env.get("COUNTER_SHARDS", 1)),
+            counter_hot_threshold=int(env.get("COUNTER_HOT_THRESHOLD", 100)),
+            counter_read_ttl_seconds=float(env.get("COUNTER_READ_TTL_SECONDS", 5.0)),
+            archive_after_days=float(env["ARCHIVE_AFTER_DAYS"]) if env.get("ARCHIVE_AFTER_DAYS") else None,
+            archive_batch_size=int(env.get("ARCHIVE_BATCH_SIZE", 500)),
+            archive_interval_seconds=float(env.get("ARCHIVE_INTERVAL_SECONDS", 3600)),
+            profiling_enabled=_flag(env, "PROFILING_ENABLED", "1"),
+            profile_sample_rate=float(env.get("PROFILE_SAMPLE_RATE", 0)),
+            profile_dir=Path(env.get("PROFILE_DIR", ROOT_DIR / "profiles")),
+            profile_max_files=int(env.get("PROFILE_MAX_FILES", 200)),
+            compression_enabled=_flag(env, "COMPRESSION_ENABLED", "1"),
+            compression_min_size=int(env.get("COMPRESSION_MIN_SIZE", 1024)),
+            feed_cache_enabled=_flag(env, "FEED_CACHE_ENABLED", "1"),
+            feed_cache_invalidation=env.get("FEED_CACHE_INVALIDATION", "version"),
+            feed_cache_max_pages=int(env.get("FEED_CACHE_MAX_PAGES", 256)),
+            post_cache_max_entries=int(env.get("POST_CACHE_MAX_ENTRIES", 10_000)),
+            feed_cache_page_depth=int(env.get("FEED_CACHE_PAGE_DEPTH", 3)),
+            author_cache_ttl_seconds=float(env.get("AUTHOR_CACHE_TTL_SECONDS", 60)),
+            author_cache_max_entries=int(env.get("AUTHOR_CACHE_MAX_ENTRIES", 10_000)),
+        )
+
+    def mongo_client_options(self) -> dict:
+        options = {
+            "maxPoolSize": self.mongo_max_pool_size,
+            "minPoolSize": self.mongo_min_pool_size,
+            "connectTimeoutMS": self.mongo_connect_timeout_ms,
+            "serverSelectionTimeoutMS": self.mongo_server_selection_timeout_ms,
+        }
+        optional = {
+            "maxIdleTimeMS": self.mongo_max_idle_time_ms,
+            "socketTimeoutMS": self.mongo_socket_timeout_ms,
+            "waitQueueTimeoutMS": self.mongo_wait_queue_timeout_ms,
+        }
+        options.update({name: value for name, value in optional.items() if value is not None})
+        return options
+
+
+def load_settings(env_file: Path = ROOT_DIR / ".env") -> Settings:
+    load_dotenv(env_file)
+    return Settings.from_env(os.environ)
@@ -0,0 +1,40 @@
+"""Storage engines behind one repository interface.
+
+``STORAGE_ENGINE`` picks the engine:
+
+* ``mongo`` (default): MongoDB via Motor, configured by ``MONGO_URL`` and
+  ``DB_NAME``.
+* ``sqlite``: a single SQLite file at ``SQLITE_PATH`` (needs ``aiosqlite``).
+* ``memory``: process-local dicts; data is lost on restart and not shared
+  between workers.
+
+Engine modules are imported lazily so an engine's driver is only needed
+when that engine is selected.
+"""
+import os
+from typing import Mapping, Optional
+
+from storage.base import COLLECTIONS, DuplicateKeyError, Storage
+
+ENGINES = ("mongo", "sqlite", "memory")
+
+
+def create_storage(engine: Optional[str] = None, env: Mapping[str, str] = os.environ, **client_options) -> Storage:
+    """``client_options`` (pool size, timeouts, listeners) go to the Mongo client; other engines ignore them."""
+    engine = engine or env.get("STORAGE_ENGINE", "mongo")
+    if engine == "mongo":
+        from storage.mongo import MongoStorage
+
+        return MongoStorage(env["MONGO_URL"], env["DB_NAME"], **client_options)
+    if engine == "sqlite":
+        from storage.sqlite import SQLiteStorage
+
+        return SQLiteStorage(env.get("SQLITE_PATH", "fsociety.db"))
+    if engine == "memory":
+        from storage.memory import MemoryStorage
+
+        return MemoryStorage()
+    raise ValueError(f"Unknown STORAGE_ENGINE {engine!r}; expected one of {', '.join(ENGINES)}")
+
+
+__all__ = ["COLLECTIONS", "ENGINES", "DuplicateKeyError", "Storage", "create_storage"]
@@ -0,0 +1,226 @@
+"""Repository interfaces shared by every storage engine.
+
+Repositories take and return plain dicts shaped like the API models, with
+datetimes as naive UTC ``datetime`` objects. Read methods return only the
+fields listed below, in this order, so the fast serialization path can use
+them as-is.
+"""
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+USER_FIELDS = ("id", "username", "email", "password_hash", "avatar", "created_at", "is_admin", "token_version")
+POST_FIELDS = ("id", "title", "content", "author_id", "author_username", "created_at", "updated_at")
+COMMENT_FIELDS = ("id", "post_id", "content", "author_id", "author_username", "created_at", "parent_id", "depth", "path")
+COLLECTIONS = ("users", "posts", "comments")
+# Post reads with a ``fields`` selection may also ask for "snippet": the first
+# SNIPPET_LENGTH + 1 characters of content, so callers can tell it was cut
+SNIPPET_LENGTH = 200
+SELECTABLE_POST_FIELDS = POST_FIELDS + ("snippet",)
+
+# Keyset position: (created_at, id) of the last item on the previous page
+After = Optional[Tuple[datetime, str]]
+# (post_id, shard) -> {counter name: increment}
+CounterDeltas = Dict[Tuple[str, int], Dict[str, int]]
+
+
+class DuplicateKeyError(Exception):
+    """Raised when an insert collides with an existing id, username or email."""
+
+
+def naive_utc(value: datetime) -> datetime:
+    """``value`` as stored: aware datetimes are converted to UTC and lose their tzinfo."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def thread_path(parent_path: Optional[str], created_at: datetime, comment_id: str) -> str:
+    """Materialized path of a comment: its ancestors' segments and its own, joined by "/".
+
+    A segment is the fixed-width created_at followed by the id, so sorting by
+    path lists a thread depth first with siblings oldest first, and a
+    subtree is the contiguous range given by ``subtree_range``.
+    """
+    segment = f"{created_at:%Y%m%d%H%M%S%f}{comment_id}"
+    return f"{parent_path}/{segment}" if parent_path else segment
+
+
+def comment_path(comment: dict) -> str:
+    # Comments written before threading have no stored path and are all top level
+    return comment.get("path") or thread_path(None, comment["created_at"], comment["id"])
+
+
+def subtree_range(path: str) -> Tuple[str, str]:
+    """Exclusive (low, high) bounds of the paths below ``path``; "0" sorts right after "/"."""
+    return path + "/", path + "0"
+
+
+def with_thread_fields(comment: dict) -> dict:
+    """``comment`` with the defaults of a top-level comment filled in."""
+    return {"parent_id": None, "depth": 0, **comment, "path": comment_path(comment)}
+
+
+def post_fields(fields: Optional[Sequence[str]]) -> Tuple[str, ...]:
+    """Post fields to read for a ``fields`` selection; id and created_at are always read for the keyset."""
+    if fields is None:
+        return POST_FIELDS
+    return tuple(field for field in SELECTABLE_POST_FIELDS if field in fields or field in ("id", "created_at"))
+
+
+class UserRepository(ABC):
+    @abstractmethod
+    async def insert(self, user: dict) -> None: ...
+
+    @abstractmethod
+    async def get_by_id(self, user_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def get_by_username(self, username: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def get_many(self, user_ids: List[str]) -> List[dict]:
+        """Existing users among ``user_ids``, in any order."""
+
+    @abstractmethod
+    async def username_or_email_taken(self, username: str, email: str) -> bool: ...
+
+    @abstractmethod
+    async def get_token_version(self, user_id: str) -> Optional[int]:
+        """Current token_version, or None if the user does not exist."""
+
+    @abstractmethod
+    async def bump_token_version(self, user_id: str) -> Optional[int]:
+        """Increment token_version and return the new value (None if no such user)."""
+
+
+class PostRepository(ABC):
+    @abstractmethod
+    async def insert(self, post: dict) -> None:
+        """Store a post; ``comment_count`` starts at 0 unless given."""
+
+    @abstractmethod
+    async def get(self, post_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def get_many(self, post_ids: List[str]) -> List[dict]: ...
+
+    @abstractmethod
+    async def page(self, after: After, limit: int, fields: Optional[Sequence[str]] = None) -> List[dict]:
+        """Newest first, strictly after the ``after`` keyset position, with ``post_fields(fields)``."""
+
+    @abstractmethod
+    async def feed_page(self, after: After, limit: int, preview: int, fields: Optional[Sequence[str]] = None) -> List[dict]:
+        """Like ``page`` plus ``comment_count`` and the ``preview`` newest comments as ``latest_comments``."""
+
+    @abstractmethod
+    async def comment_count(self, post_id: str) -> Optional[int]:
+        """Comment counter of a post, or None if the post does not exist."""
+
+    @abstractmethod
+    async def increment_comment_count(self, post_id: str, by: int = 1) -> None: ...
+
+    @abstractmethod
+    async def search(self, terms: List[str], phrases: List[str], limit: int) -> List[Tuple[dict, float]]:
+        """Posts matching the folded query (see ``search.parse_query``) with a score, best first."""
+
+
+class CommentRepository(ABC):
+    @abstractmethod
+    async def insert(self, comment: dict) -> None:
+        """Store a comment; one without ``parent_id`` is top level (see ``with_thread_fields``)."""
+
+    @abstractmethod
+    async def get(self, comment_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def page(self, post_id: str, after: After, limit: int) -> List[dict]:
+        """Every comment of the post, replies included, oldest first, strictly after ``after``."""
+
+    @abstractmethod
+    async def top_level_page(self, post_id: str, after: After, limit: int) -> List[dict]:
+        """Like ``page`` but only comments that are not replies."""
+
+    @abstractmethod
+    async def subtree(self, path: str, after_path: Optional[str], limit: int) -> List[dict]:
+        """Replies below the comment at ``path``, in path order, strictly after ``after_path``."""
+
+    @abstractmethod
+    async def subtrees(self, paths: List[str], per_path: int) -> Dict[str, List[dict]]:
+        """The first ``per_path`` replies below each comment in ``paths``, with one read for all of them."""
+
+    @abstractmethod
+    async def first_for_posts(self, post_ids: List[str], per_post: int) -> Dict[str, List[dict]]:
+        """Oldest ``per_post`` comments for each existing post in ``post_ids``."""
+
+    @abstractmethod
+    async def search(self, terms: List[str], phrases: List[str], limit: int) -> List[Tuple[str, float]]:
+        """(post_id, score) for comments matching the folded query, best first."""
+
+
+class CounterRepository(ABC):
+    """View and reaction totals of posts, kept apart from the post documents.
+
+    A post's totals may be spread over several shards, so that flushes of a
+    hot post do not all update the same document.
+    """
+
+    @abstractmethod
+    async def add(self, deltas: CounterDeltas) -> None:
+        """Apply all ``deltas`` as one batch, creating missing shards."""
+
+    @abstractmethod
+    async def totals(self, post_ids: List[str]) -> Dict[str, Dict[str, int]]:
+        """Counters per post summed over its shards; posts without any are left out."""
+
+
+class Storage(ABC):
+    name: str
+    users: UserRepository
+    posts: PostRepository
+    comments: CommentRepository
+    counters: CounterRepository
+    # Posts moved out by ``archive_posts`` and their comments; read-only
+    archived_posts: PostRepository
+    archived_comments: CommentRepository
+
+    async def startup(self) -> None:
+        """Open connections, create schema/indexes and start background upkeep."""
+
+    async def close(self) -> None:
+        """Release connections and stop background tasks."""
+
+    async def warmup(self, connections: int) -> None:
+        """Open up to ``connections`` pooled connections ahead of the first requests."""
+
+    @abstractmethod
+    async def get_feed_version(self) -> int: ...
+
+    @abstractmethod
+    async def bump_feed_version(self) -> None: ...
+
+    @abstractmethod
+    def iter_documents(self, collection: str, since: Optional[datetime], until: Optional[datetime]) -> AsyncIterator[dict]:
+        """Every stored document of ``collection`` with created_at in [since, until)."""
+
+    @abstractmethod
+    async def insert_many(self, collection: str, docs: List[dict]) -> Tuple[int, int]:
+        """Insert, skipping duplicates; returns (inserted, duplicates)."""
+
+    @abstractmethod
+    async def archive_posts(self, before: datetime, limit: int) -> Tuple[int, int]:
+        """Move up to ``limit`` of the oldest posts created before ``before`` to the archive, with their comments.
+
+        Returns the (posts, comments) moved. Copies are written before the
+        originals are deleted, so rerunning after a failure finishes the move.
+        """
+
+    @abstractmethod
+    async def get_checkpoint(self, key: str) -> int: ...
+
+    @abstractmethod
+    async def save_checkpoint(self, key: str, records: int) -> None: ...
+
+    async def query_plans(self) -> dict:
+        """Index problems and hot query plans, for engines that can report them."""
+        return {"index_problems": [], "plans": []}
@@ -0,0 +1,359 @@
+"""In-process engine for tests, demos and single-worker development.
+
+Nothing is persisted and every uvicorn worker has its own data. Posts and
+comments are kept in (created_at, id) order so pages are bisected rather
+than scanned, and an inverted index over the folded search fields answers
+search queries.
+"""
+import bisect
+from collections import defaultdict
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from search import TITLE_WEIGHT, comment_search_fields, post_search_fields
+from storage.base import (
+    COMMENT_FIELDS,
+    POST_FIELDS,
+    SNIPPET_LENGTH,
+    USER_FIELDS,
+    After,
+    CommentRepository,
+    CounterDeltas,
+    CounterRepository,
+    DuplicateKeyError,
+    PostRepository,
+    Storage,
+    UserRepository,
+    post_fields,
+    subtree_range,
+    with_thread_fields,
+)
+
+
+def _shape(doc: dict, fields) -> dict:
+    return {field: doc[field] for field in fields if field in doc}
+
+
+def _shape_post(doc: dict, fields) -> dict:
+    post = _shape(doc, fields)
+    if "snippet" in fields:
+        post["snippet"] = doc["content"][:SNIPPET_LENGTH + 1]
+    return post
+
+
+def _key(doc: dict) -> Tuple[datetime, str]:
+    return doc["created_at"], doc["id"]
+
+
+class _TextIndex:
+    """Term -> {doc id: occurrences}, with the folded fields kept for phrase checks."""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.texts: Dict[str, str] = {}
+
+    def add(self, doc_id: str, text: str):
+        self.texts[doc_id] = text
+        for term in text.split():
+            postings = self.postings[term]
+            postings[doc_id] = postings.get(doc_id, 0) + 1
+
+    def remove(self, doc_id: str):
+        for term in set(self.texts.pop(doc_id, "").split()):
+            postings = self.postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[term]
+
+    def count(self, doc_id: str, term: str) -> int:
+        postings = self.postings.get(term)
+        return postings.get(doc_id, 0) if postings else 0
+
+    def has_phrase(self, doc_id: str, phrase: str) -> bool:
+        return f" {phrase} " in f" {self.texts.get(doc_id, '')} "
+
+    def candidates(self, terms: List[str], phrases: List[str]) -> set:
+        if phrases:
+            # Every phrase must appear; its first word narrows the candidates
+            ids = None
+            for phrase in phrases:
+                matching = {doc_id for doc_id in self.postings.get(phrase.split()[0], ()) if self.has_phrase(doc_id, phrase)}
+                ids = matching if ids is None else ids & matching
+            return ids
+        ids = set()
+        for term in terms:
+            ids.update(self.postings.get(term, ()))
+        return ids
+
+
+def _score(index: _TextIndex, doc_id: str, terms: List[str], phrases: List[str]) -> float:
+    words = [word for phrase in phrases for word in phrase.split()] + terms
+    return float(sum(index.count(doc_id, word) for word in words))
+
+
+class MemoryUserRepository(UserRepository):
+    def __init__(self):
+        self.by_id: Dict[str, dict] = {}
+        self.by_username: Dict[str, dict] = {}
+        self.emails = set()
+
+    async def insert(self, user: dict) -> None:
+        if user["id"] in self.by_id or user["username"] in self.by_username or user["email"] in self.emails:
+            raise DuplicateKeyError()
+        stored = {"token_version": 0, **user}
+        self.by_id[user["id"]] = stored
+        self.by_username[user["username"]] = stored
+        self.emails.add(user["email"])
+
+    async def get_by_id(self, user_id: str) -> Optional[dict]:
+        user = self.by_id.get(user_id)
+        return _shape(user, USER_FIELDS) if user else None
+
+    async def get_by_username(self, username: str) -> Optional[dict]:
+        user = self.by_username.get(username)
+        return _shape(user, USER_FIELDS) if user else None
+
+    async def get_many(self, user_ids: List[str]) -> List[dict]:
+        return [_shape(self.by_id[user_id], USER_FIELDS) for user_id in user_ids if user_id in self.by_id]
+
+    async def username_or_email_taken(self, username: str, email: str) -> bool:
+        return username in self.by_username or email in self.emails
+
+    async def get_token_version(self, user_id: str) -> Optional[int]:
+        user = self.by_id.get(user_id)
+        return None if user is None else user["token_version"]
+
+    async def bump_token_version(self, user_id: str) -> Optional[int]:
+        user = self.by_id.get(user_id)
+        if user is None:
+            return None
+        user["token_version"] += 1
+        return user["token_version"]
+
+
+class MemoryPostRepository(PostRepository):
+    def __init__(self, comments: "MemoryCommentRepository"):
+        self.by_id: Dict[str, dict] = {}
+        # Ascending (created_at, id); pages walk it backwards
+        self.order: List[Tuple[datetime, str]] = []
+        self.titles = _TextIndex()
+        self.bodies = _TextIndex()
+        self.comments = comments
+
+    async def insert(self, post: dict) -> None:
+        if post["id"] in self.by_id:
+            raise DuplicateKeyError()
+        stored = {"comment_count": 0, **post}
+        self.by_id[post["id"]] = stored
+        bisect.insort(self.order, _key(stored))
+        folded = post_search_fields(post["title"], post["content"])
+        self.titles.add(post["id"], folded["search_title"])
+        self.bodies.add(post["id"], folded["search_body"])
+
+    async def get(self, post_id: str) -> Optional[dict]:
+        post = self.by_id.get(post_id)
+        return _shape(post, POST_FIELDS) if post else None
+
+    def remove(self, post_id: str) -> dict:
+        stored = self.by_id.pop(post_id)
+        del self.order[bisect.bisect_left(self.order, _key(stored))]
+        self.titles.remove(post_id)
+        self.bodies.remove(post_id)
+        return stored
+
+    async def get_many(self, post_ids: List[str]) -> List[dict]:
+        return [_shape(self.by_id[post_id], POST_FIELDS) for post_id in post_ids if post_id in self.by_id]
+
+    def _page_ids(self, after: After, limit: int) -> List[str]:
+        end = bisect.bisect_left(self.order, after) if after else len(self.order)
+        return [item_id for _, item_id in reversed(self.order[max(0, end - limit):end])]
+
+    async def page(self, after: After, limit: int, fields: Optional[Sequence[str]] = None) -> List[dict]:
+        fields = post_fields(fields)
+        return [_shape_post(self.by_id[post_id], fields) for post_id in self._page_ids(after, limit)]
+
+    async def feed_page(self, after: After, limit: int, preview: int, fields: Optional[Sequence[str]] = None) -> List[dict]:
+        fields = post_fields(fields)
+        posts = []
+        for post_id in self._page_ids(after, limit):
+            stored = self.by_id[post_id]
+            post = _shape_post(stored, fields)
+            post["comment_count"] = stored["comment_count"]
+            post["latest_comments"] = self.comments.latest(post_id, preview) if preview else []
+            posts.append(post)
+        return posts
+
+    async def comment_count(self, post_id: str) -> Optional[int]:
+        post = self.by_id.get(post_id)
+        return None if post is None else post["comment_count"]
+
+    async def increment_comment_count(self, post_id: str, by: int = 1) -> None:
+        if post_id in self.by_id:
+            self.by_id[post_id]["comment_count"] += by
+
+    async def search(self, terms: List[str], phrases: List[str], limit: int) -> List[Tuple[dict, float]]:
+        # Phrases must fall within one field, title or content
+        ids = self.titles.candidates(terms, phrases) | self.bodies.candidates(terms, phrases)
+        scored = [
+            (TITLE_WEIGHT * _score(self.titles, post_id, terms, phrases) + _score(self.bodies, post_id, terms, phrases), post_id)
+            for post_id in ids
+        ]
+        scored.sort(key=lambda hit: (-hit[0], hit[1]))
+        return [(_shape(self.by_id[post_id], POST_FIELDS), score) for score, post_id in scored[:limit]]
+
+
+class MemoryCommentRepository(CommentRepository):
+    def __init__(self):
+        self.by_id: Dict[str, dict] = {}
+        # post id -> ascending [(created_at, id)]
+        self.by_post: Dict[str, List[Tuple[datetime, str]]] = defaultdict(list)
+        # post id -> ascending [(created_at, id)] of comments that are not replies
+        self.top_level: Dict[str, List[Tuple[datetime, str]]] = defaultdict(list)
+        # Every thread path, ascending, and the comment at each
+        self.paths: List[str] = []
+        self.by_path: Dict[str, str] = {}
+        self.bodies = _TextIndex()
+
+    async def insert(self, comment: dict) -> None:
+        if comment["id"] in self.by_id:
+            raise DuplicateKeyError()
+        stored = with_thread_fields(comment)
+        self.by_id[comment["id"]] = stored
+        bisect.insort(self.by_post[comment["post_id"]], _key(stored))
+        if stored["parent_id"] is None:
+            bisect.insort(self.top_level[comment["post_id"]], _key(stored))
+        bisect.insort(self.paths, stored["path"])
+        self.by_path[stored["path"]] = comment["id"]
+        self.bodies.add(comment["id"], comment_search_fields(comment["content"])["search_body"])
+
+    async def get(self, comment_id: str) -> Optional[dict]:
+        comment = self.by_id.get(comment_id)
+        return _shape(comment, COMMENT_FIELDS) if comment else None
+
+    def remove_post(self, post_id: str) -> List[dict]:
+        """Drop every comment of ``post_id`` and return them."""
+        self.top_level.pop(post_id, None)
+        removed = []
+        for _, comment_id in self.by_post.pop(post_id, []):
+            stored = self.by_id.pop(comment_id)
+            del self.paths[bisect.bisect_left(self.paths, stored["path"])]
+            del self.by_path[stored["path"]]
+            self.bodies.remove(comment_id)
+            removed.append(stored)
+        return removed
+
+    def latest(self, post_id: str, count: int) -> List[dict]:
+        keys = self.by_post.get(post_id, [])
+        return [_shape(self.by_id[item_id], COMMENT_FIELDS) for _, item_id in reversed(keys[-count:])]
+
+    async def page(self, post_id: str, after: After, limit: int) -> List[dict]:
+        keys = self.by_post.get(post_id, [])
+        start = bisect.bisect_right(keys, after) if after else 0
+        return [_shape(self.by_id[item_id], COMMENT_FIELDS) for _, item_id in keys[start:start + limit]]
+
+    async def top_level_page(self, post_id: str, after: After, limit: int) -> List[dict]:
+        keys = self.top_level.get(post_id, [])
+        start = bisect.bisect_right(keys, after) if after else 0
+        return [_shape(self.by_id[item_id], COMMENT_FIELDS) for _, item_id in keys[start:start + limit]]
+
+    async def subtree(self, path: str, after_path: Optional[str], limit: int) -> List[dict]:
+        low, high = subtree_range(path)
+        start = bisect.bisect_right(self.paths, max(low, after_path or low))
+        replies = []
+        for item_path in self.paths[start:start + limit]:
+            if item_path >= high:
+                break
+            replies.append(_shape(self.by_id[self.by_path[item_path]], COMMENT_FIELDS))
+        return replies
+
+    async def subtrees(self, paths: List[str], per_path: int) -> Dict[str, List[dict]]:
+        return {path: await self.subtree(path, None, per_path) for path in paths}
+
+    async def first_for_posts(self, post_ids: List[str], per_post: int) -> Dict[str, List[dict]]:
+        posts = self.posts.by_id
+        return {post_id: await self.page(post_id, None, per_post) for post_id in post_ids if post_id in posts}
+
+    async def search(self, terms: List[str], phrases: List[str], limit: int) -> List[Tuple[str, float]]:
+        scored = [
+            (_score(self.bodies, comment_id, terms, phrases), comment_id)
+            for comment_id in self.bodies.candidates(terms, phrases)
+        ]
+        scored.sort(key=lambda hit: (-hit[0], hit[1]))
+        return [(self.by_id[comment_id]["post_id"], score) for score, comment_id in scored[:limit]]
+
+
+class MemoryCounterRepository(CounterRepository):
+    def __init__(self):
+        # Shards only spread write load, which does not apply here
+        self.counts: Dict[str, Dict[str, int]] = defaultdict(dict)
+
+    async def add(self, deltas: CounterDeltas) -> None:
+        for (post_id, _), increments in deltas.items():
+            counts = self.counts[post_id]
+            for name, amount in increments.items():
+                counts[name] = counts.get(name, 0) + amount
+
+    async def totals(self, post_ids: List[str]) -> Dict[str, Dict[str, int]]:
+        return {post_id: dict(self.counts[post_id]) for post_id in post_ids if post_id in self.counts}
+
+
+class MemoryStorage(Storage):
+    name = "memory"
+
+    def __init__(self):
+        self.users = MemoryUserRepository()
+        self.comments = MemoryCommentRepository()
+        self.posts = MemoryPostRepository(self.comments)
+        self.comments.posts = self.posts
+        self.counters = MemoryCounterRepository()
+        self.archived_comments = MemoryCommentRepository()
+        self.archived_posts = MemoryPostRepository(self.archived_comments)
+        self.archived_comments.posts = self.archived_posts
+        self.feed_version = 0
+        self.checkpoints: Dict[str, int] = {}
+
+    async def get_feed_version(self) -> int:
+        return self.feed_version
+
+    async def bump_feed_version(self) -> None:
+        self.feed_version += 1
+
+    async def iter_documents(self, collection: str, since: Optional[datetime], until: Optional[datetime]) -> AsyncIterator[dict]:
+        repository = getattr(self, collection)
+        for doc in list(repository.by_id.values()):
+            if since and doc["created_at"] < since:
+                continue
+            if until and doc["created_at"] >= until:
+                continue
+            yield dict(doc)
+
+    async def insert_many(self, collection: str, docs: List[dict]) -> Tuple[int, int]:
+        repository = getattr(self, collection)
+        inserted = duplicates = 0
+        for doc in docs:
+            try:
+                await repository.insert(doc)
+                inserted += 1
+            except DuplicateKeyError:
+                duplicates += 1
+        return inserted, duplicates
+
+    async def archive_posts(self, before: datetime, limit: int) -> Tuple[int, int]:
+        post_ids = []
+        for created_at, post_id in self.posts.order[:limit]:
+            if created_at >= before:
+                break
+            post_ids.append(post_id)
+        comments = 0
+        for post_id in post_ids:
+            for comment in self.comments.remove_post(post_id):
+                await self.archived_comments.insert(comment)
+                comments += 1
+            await self.archived_posts.insert(self.posts.remove(post_id))
+        return len(post_ids), comments
+
+    async def get_checkpoint(self, key: str) -> int:
+        return self.checkpoints.get(key, 0)
+
+    async def save_checkpoint(self, key: str, records: int) -> None:
+        self.checkpoints[key] = records
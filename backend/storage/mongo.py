@@ -0,0 +1,442 @@
+"""MongoDB engine on Motor; the production default."""
+import asyncio
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from pymongo.errors import DuplicateKeyError as MongoDuplicateKeyError
+
+from indexes import check_indexes, ensure_indexes, explain_hot_queries
+from pagination import keyset_filter, keyset_sort
+from search import comment_search_fields, post_search_fields
+from storage.base import (
+    COMMENT_FIELDS,
+    POST_FIELDS,
+    SNIPPET_LENGTH,
+    USER_FIELDS,
+    After,
+    CommentRepository,
+    CounterDeltas,
+    CounterRepository,
+    DuplicateKeyError,
+    PostRepository,
+    Storage,
+    UserRepository,
+    post_fields,
+    subtree_range,
+    with_thread_fields,
+)
+
+logger = logging.getLogger(__name__)
+
+FEED_VERSION_ID = "feed_version"
+DUPLICATE_KEY = 11000
+EXPORT_BATCH_SIZE = 500
+BACKFILL_BATCH_SIZE = 1000
+# Archived documents drop the folded search copies; the archive is not searched
+ARCHIVE_PROJECTION = {"_id": 0, "search_title": 0, "search_body": 0}
+
+
+def _projection(fields) -> dict:
+    return {"_id": 0, **{field: 1 for field in fields}}
+
+
+POST_PROJECTION = _projection(POST_FIELDS)
+COMMENT_PROJECTION = _projection(COMMENT_FIELDS)
+USER_PROJECTION = _projection(USER_FIELDS)
+
+
+def _post_projection(fields) -> dict:
+    projection = _projection(field for field in fields if field != "snippet")
+    if "snippet" in fields:
+        projection["snippet"] = {"$substrCP": [{"$ifNull": ["$content", ""]}, 0, SNIPPET_LENGTH + 1]}
+    return projection
+
+
+def _text_search(terms: List[str], phrases: List[str]) -> str:
+    # $text requires every quoted phrase and otherwise ORs the terms
+    return " ".join([f'"{phrase}"' for phrase in phrases] + terms)
+
+
+class MongoUserRepository(UserRepository):
+    def __init__(self, db):
+        self.collection = db.users
+
+    async def insert(self, user: dict) -> None:
+        try:
+            await self.collection.insert_one(dict(user))
+        except MongoDuplicateKeyError:
+            raise DuplicateKeyError()
+
+    async def get_by_id(self, user_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": user_id}, USER_PROJECTION)
+
+    async def get_by_username(self, username: str) -> Optional[dict]:
+        return await self.collection.find_one({"username": username}, USER_PROJECTION)
+
+    async def get_many(self, user_ids: List[str]) -> List[dict]:
+        return await self.collection.find({"id": {"$in": user_ids}}, USER_PROJECTION).to_list(None)
+
+    async def username_or_email_taken(self, username: str, email: str) -> bool:
+        return await self.collection.find_one({"$or": [{"username": username}, {"email": email}]}, {"_id": 1}) is not None
+
+    async def get_token_version(self, user_id: str) -> Optional[int]:
+        user = await self.collection.find_one({"id": user_id}, {"_id": 0, "token_version": 1})
+        return None if user is None else user.get("token_version", 0)
+
+    async def bump_token_version(self, user_id: str) -> Optional[int]:
+        user = await self.collection.find_one_and_update(
+            {"id": user_id},
+            {"$inc": {"token_version": 1}},
+            projection={"_id": 0, "token_version": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        return None if user is None else user["token_version"]
+
+
+class MongoPostRepository(PostRepository):
+    def __init__(self, db, collection: str = "posts"):
+        self.collection = db[collection]
+
+    async def insert(self, post: dict) -> None:
+        try:
+            await self.collection.insert_one({
+                "comment_count": 0,
+                **post,
+                **post_search_fields(post["title"], post["content"]),
+            })
+        except MongoDuplicateKeyError:
+            raise DuplicateKeyError()
+
+    async def get(self, post_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": post_id}, POST_PROJECTION)
+
+    async def get_many(self, post_ids: List[str]) -> List[dict]:
+        return await self.collection.find({"id": {"$in": post_ids}}, POST_PROJECTION).to_list(None)
+
+    async def page(self, after: After, limit: int, fields: Optional[Sequence[str]] = None) -> List[dict]:
+        projection = _post_projection(post_fields(fields))
+        cursor = self.collection.find(keyset_filter(after, descending=True), projection)
+        return await cursor.sort(keyset_sort(descending=True)).limit(limit).to_list(limit)
+
+    async def feed_page(self, after: After, limit: int, preview: int, fields: Optional[Sequence[str]] = None) -> List[dict]:
+        """One aggregation for a feed page, with the ``preview`` newest comments per post.
+
+        The $lookup sub-pipeline matches on post_id and sorts on (created_at, id),
+        so each post is served by the comments (post_id, created_at, id) index.
+        """
+        pipeline = [
+            {"$match": keyset_filter(after, descending=True)},
+            {"$sort": dict(keyset_sort(descending=True))},
+            {"$limit": limit},
+            {"$project": {**_post_projection(post_fields(fields)), "comment_count": {"$ifNull": ["$comment_count", 0]}}},
+        ]
+        if preview:
+            pipeline.append({
+                "$lookup": {
+                    "from": "comments",
+                    "let": {"post_id": "$id"},
+                    "pipeline": [
+                        {"$match": {"$expr": {"$eq": ["$post_id", "$$post_id"]}}},
+                        {"$sort": {"created_at": -1, "id": -1}},
+                        {"$limit": preview},
+                        {"$project": COMMENT_PROJECTION},
+                    ],
+                    "as": "latest_comments",
+                }
+            })
+        posts = await self.collection.aggregate(pipeline).to_list(limit)
+        for post in posts:
+            post.setdefault("latest_comments", [])
+        return posts
+
+    async def comment_count(self, post_id: str) -> Optional[int]:
+        post = await self.collection.find_one({"id": post_id}, {"_id": 0, "comment_count": 1})
+        return None if post is None else post.get("comment_count", 0)
+
+    async def increment_comment_count(self, post_id: str, by: int = 1) -> None:
+        await self.collection.update_one({"id": post_id}, {"$inc": {"comment_count": by}})
+
+    async def search(self, terms: List[str], phrases: List[str], limit: int) -> List[Tuple[dict, float]]:
+        score = {"score": {"$meta": "textScore"}}
+        posts = await self.collection.find({"$text": {"$search": _text_search(terms, phrases)}}, {**POST_PROJECTION, **score}).sort(
+            [("score", {"$meta": "textScore"})]
+        ).to_list(limit)
+        return [(post, post.pop("score")) for post in posts]
+
+
+class MongoCommentRepository(CommentRepository):
+    def __init__(self, db, collection: str = "comments"):
+        self.db = db
+        self.collection = db[collection]
+
+    async def insert(self, comment: dict) -> None:
+        try:
+            await self.collection.insert_one({**with_thread_fields(comment), **comment_search_fields(comment["content"])})
+        except MongoDuplicateKeyError:
+            raise DuplicateKeyError()
+
+    async def get(self, comment_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": comment_id}, COMMENT_PROJECTION)
+
+    async def page(self, post_id: str, after: After, limit: int) -> List[dict]:
+        query = {"post_id": post_id, **keyset_filter(after, descending=False)}
+        cursor = self.collection.find(query, COMMENT_PROJECTION).sort(keyset_sort(descending=False))
+        return await cursor.limit(limit).to_list(limit)
+
+    async def top_level_page(self, post_id: str, after: After, limit: int) -> List[dict]:
+        # parent_id: None also matches comments written before threading
+        query = {"post_id": post_id, "parent_id": None, **keyset_filter(after, descending=False)}
+        cursor = self.collection.find(query, COMMENT_PROJECTION).sort(keyset_sort(descending=False))
+        return await cursor.limit(limit).to_list(limit)
+
+    async def subtree(self, path: str, after_path: Optional[str], limit: int) -> List[dict]:
+        low, high = subtree_range(path)
+        cursor = self.collection.find({"path": {"$gt": max(low, after_path or low), "$lt": high}}, COMMENT_PROJECTION)
+        return await cursor.sort("path", 1).limit(limit).to_list(limit)
+
+    async def subtrees(self, paths: List[str], per_path: int) -> Dict[str, List[dict]]:
+        """One aggregate: every thread is its own indexed, limited range read, joined with ``$unionWith``."""
+        groups = {path: [] for path in paths}
+        if not paths:
+            return groups
+
+        def thread(index: int, path: str) -> list:
+            low, high = subtree_range(path)
+            return [
+                {"$match": {"path": {"$gt": low, "$lt": high}}},
+                {"$sort": {"path": 1}},
+                {"$limit": per_path},
+                {"$project": COMMENT_PROJECTION},
+                {"$addFields": {"_thread": index}},
+            ]
+
+        pipeline = thread(0, paths[0]) + [
+            {"$unionWith": {"coll": self.collection.name, "pipeline": thread(index, path)}}
+            for index, path in enumerate(paths[1:], 1)
+        ]
+        async for doc in self.collection.aggregate(pipeline):
+            groups[paths[doc.pop("_thread")]].append(doc)
+        return groups
+
+    async def first_for_posts(self, post_ids: List[str], per_post: int) -> Dict[str, List[dict]]:
+        """Starts from a single ``$in`` on posts.id and bounds each post's comments
+        with an indexed $lookup, so a busy thread never loads its full comment set.
+        """
+        pipeline = [
+            {"$match": {"id": {"$in": post_ids}}},
+            {"$project": {"_id": 0, "id": 1}},
+            {
+                "$lookup": {
+                    "from": "comments",
+                    "let": {"post_id": "$id"},
+                    "pipeline": [
+                        {"$match": {"$expr": {"$eq": ["$post_id", "$$post_id"]}}},
+                        {"$sort": {"created_at": 1, "id": 1}},
+                        {"$limit": per_post},
+                        {"$project": COMMENT_PROJECTION},
+                    ],
+                    "as": "comments",
+                }
+            },
+        ]
+        return {row["id"]: row["comments"] async for row in self.db.posts.aggregate(pipeline)}
+
+    async def search(self, terms: List[str], phrases: List[str], limit: int) -> List[Tuple[str, float]]:
+        hits = await self.collection.find(
+            {"$text": {"$search": _text_search(terms, phrases)}}, {"_id": 0, "post_id": 1, "score": {"$meta": "textScore"}}
+        ).sort([("score", {"$meta": "textScore"})]).to_list(limit)
+        return [(hit["post_id"], hit["score"]) for hit in hits]
+
+
+class MongoCounterRepository(CounterRepository):
+    def __init__(self, db):
+        self.collection = db.post_counters
+
+    async def add(self, deltas: CounterDeltas) -> None:
+        if not deltas:
+            return
+        await self.collection.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": f"{post_id}:{shard}"},
+                    {
+                        "$inc": {f"counts.{name}": amount for name, amount in counts.items()},
+                        "$setOnInsert": {"post_id": post_id, "shard": shard},
+                    },
+                    upsert=True,
+                )
+                for (post_id, shard), counts in deltas.items()
+            ],
+            ordered=False,
+        )
+
+    async def totals(self, post_ids: List[str]) -> Dict[str, Dict[str, int]]:
+        totals: Dict[str, Dict[str, int]] = {}
+        async for doc in self.collection.find({"post_id": {"$in": post_ids}}, {"_id": 0, "post_id": 1, "counts": 1}):
+            counts = totals.setdefault(doc["post_id"], {})
+            for name, amount in doc.get("counts", {}).items():
+                counts[name] = counts.get(name, 0) + amount
+        return totals
+
+
+class MongoStorage(Storage):
+    name = "mongo"
+
+    def __init__(self, mongo_url: str, db_name: str, **client_options):
+        self.client = AsyncIOMotorClient(mongo_url, **client_options)
+        self.db = self.client[db_name]
+        self.users = MongoUserRepository(self.db)
+        self.posts = MongoPostRepository(self.db)
+        self.comments = MongoCommentRepository(self.db)
+        self.counters = MongoCounterRepository(self.db)
+        self.archived_posts = MongoPostRepository(self.db, "posts_archive")
+        self.archived_comments = MongoCommentRepository(self.db, "comments_archive")
+        self._tasks = []
+
+    async def startup(self) -> None:
+        await ensure_indexes(self.db)
+        # Documents written before comment_count / search fields existed
+        self._tasks.append(asyncio.create_task(self.backfill_comment_counts()))
+        self._tasks.append(asyncio.create_task(self.backfill_search_fields()))
+
+    async def warmup(self, connections: int) -> None:
+        # Concurrent pings each need their own socket, so the pool opens that many
+        await asyncio.gather(*(self.client.admin.command("ping") for _ in range(max(1, connections))))
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self.client.close()
+
+    async def get_feed_version(self) -> int:
+        doc = await self.db.meta.find_one({"_id": FEED_VERSION_ID})
+        return doc["version"] if doc else 0
+
+    async def bump_feed_version(self) -> None:
+        await self.db.meta.update_one({"_id": FEED_VERSION_ID}, {"$inc": {"version": 1}}, upsert=True)
+
+    async def iter_documents(self, collection: str, since: Optional[datetime], until: Optional[datetime]) -> AsyncIterator[dict]:
+        created_at = {}
+        if since:
+            created_at["$gte"] = since
+        if until:
+            created_at["$lt"] = until
+        query = {"created_at": created_at} if created_at else {}
+        async for doc in self.db[collection].find(query, {"_id": 0}, batch_size=EXPORT_BATCH_SIZE):
+            yield doc
+
+    async def insert_many(self, collection: str, docs: List[dict]) -> Tuple[int, int]:
+        if not docs:
+            return 0, 0
+        if collection == "posts":
+            docs = [{"comment_count": 0, **doc, **post_search_fields(doc["title"], doc["content"])} for doc in docs]
+        elif collection == "comments":
+            docs = [{**with_thread_fields(doc), **comment_search_fields(doc["content"])} for doc in docs]
+        try:
+            result = await self.db[collection].insert_many(docs, ordered=False)
+            return len(result.inserted_ids), 0
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != DUPLICATE_KEY for err in write_errors):
+                raise
+            return e.details.get("nInserted", 0), len(write_errors)
+
+    async def _move(self, name: str, docs: List[dict]) -> None:
+        """Upsert ``docs`` into the archive of collection ``name``, then delete them from it."""
+        if not docs:
+            return
+        archive = self.db[f"{name}_archive"]
+        await archive.bulk_write([ReplaceOne({"id": doc["id"]}, doc, upsert=True) for doc in docs], ordered=False)
+        await self.db[name].delete_many({"id": {"$in": [doc["id"] for doc in docs]}})
+
+    async def archive_posts(self, before: datetime, limit: int) -> Tuple[int, int]:
+        cursor = self.db.posts.find({"created_at": {"$lt": before}}, ARCHIVE_PROJECTION)
+        posts = await cursor.sort(keyset_sort(descending=False)).limit(limit).to_list(limit)
+        if not posts:
+            return 0, 0
+        post_ids = [post["id"] for post in posts]
+        comments = await self.db.comments.find({"post_id": {"$in": post_ids}}, ARCHIVE_PROJECTION).to_list(None)
+        # Comments first: while a post is still hot, readers use its hot comments
+        await self._move("comments", comments)
+        await self._move("posts", posts)
+        # Comments that raced in while the batch moved
+        late = await self.db.comments.find({"post_id": {"$in": post_ids}}, ARCHIVE_PROJECTION).to_list(None)
+        await self._move("comments", late)
+        return len(posts), len(comments) + len(late)
+
+    async def get_checkpoint(self, key: str) -> int:
+        checkpoint = await self.db.import_checkpoints.find_one({"_id": key})
+        return checkpoint["records"] if checkpoint else 0
+
+    async def save_checkpoint(self, key: str, records: int) -> None:
+        await self.db.import_checkpoints.update_one(
+            {"_id": key},
+            {"$set": {"records": records, "updated_at": datetime.utcnow()}},
+            upsert=True,
+        )
+
+    async def query_plans(self) -> dict:
+        # Read-only: missing indexes are reported, not created
+        missing, index_problems = await check_indexes(self.db)
+        index_problems += [
+            f"{collection_name}.{model.document['name']}: missing"
+            for collection_name, models in missing.items()
+            for model in models
+        ]
+        plans = [
+            {"query": label, "stages": [s for s in stages if s], "collscan": "COLLSCAN" in stages}
+            for label, stages in await explain_hot_queries(self.db)
+        ]
+        return {"index_problems": index_problems, "plans": plans}
+
+    async def backfill_comment_counts(self) -> int:
+        """Set comment_count on posts written before the counter existed."""
+        updated = 0
+        while True:
+            posts = await self.db.posts.find({"comment_count": {"$exists": False}}, {"_id": 0, "id": 1}).to_list(BACKFILL_BATCH_SIZE)
+            if not posts:
+                break
+            ids = [post["id"] for post in posts]
+            counts = {
+                row["_id"]: row["count"]
+                async for row in self.db.comments.aggregate([
+                    {"$match": {"post_id": {"$in": ids}}},
+                    {"$group": {"_id": "$post_id", "count": {"$sum": 1}}},
+                ])
+            }
+            # The $exists guard keeps increments from concurrent create_comment calls
+            await self.db.posts.bulk_write(
+                [UpdateOne({"id": post_id, "comment_count": {"$exists": False}}, {"$set": {"comment_count": counts.get(post_id, 0)}}) for post_id in ids],
+                ordered=False,
+            )
+            updated += len(ids)
+        if updated:
+            await self.bump_feed_version()
+            logger.info("Backfilled comment_count on %s posts", updated)
+        return updated
+
+    async def backfill_search_fields(self) -> int:
+        """Fold posts/comments written before search existed."""
+        updated = 0
+        for name, fields in (("posts", {"title": 1, "content": 1}), ("comments", {"content": 1})):
+            collection = self.db[name]
+            while True:
+                docs = await collection.find({"search_body": {"$exists": False}}, {"_id": 1, **fields}).to_list(BACKFILL_BATCH_SIZE)
+                if not docs:
+                    break
+                ops = []
+                for doc in docs:
+                    if name == "posts":
+                        folded = post_search_fields(doc.get("title", ""), doc.get("content", ""))
+                    else:
+                        folded = comment_search_fields(doc.get("content", ""))
+                    ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": folded}))
+                await collection.bulk_write(ops, ordered=False)
+                updated += len(docs)
+        if updated:
+            logger.info("Backfilled search fields on %s documents", updated)
+        return updated
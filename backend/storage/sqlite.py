@@ -0,0 +1,624 @@
+"""SQLite engine on aiosqlite, for single-node deployments without MongoDB.
+
+One connection in WAL mode does the worker's writes; a lock keeps concurrent
+requests from committing or rolling back each other's writes. Reads go
+through a second, read-only connection, so they only ever see committed
+data and never wait for a write transaction. Datetimes are
+stored as ISO-8601 text with fixed microsecond precision so they sort as
+strings, and FTS5 tables over the folded search fields serve search with
+bm25 ranking.
+"""
+import asyncio
+import contextlib
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from search import TITLE_WEIGHT, comment_search_fields, post_search_fields
+from storage.base import (
+    COMMENT_FIELDS,
+    POST_FIELDS,
+    SNIPPET_LENGTH,
+    USER_FIELDS,
+    After,
+    CommentRepository,
+    CounterDeltas,
+    CounterRepository,
+    DuplicateKeyError,
+    PostRepository,
+    Storage,
+    UserRepository,
+    post_fields,
+    subtree_range,
+    with_thread_fields,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    email TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    avatar TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    is_admin INTEGER NOT NULL DEFAULT 0,
+    token_version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS posts (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    content TEXT NOT NULL,
+    author_id TEXT NOT NULL,
+    author_username TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    comment_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS posts_created_at_id ON posts (created_at, id);
+CREATE TABLE IF NOT EXISTS comments (
+    id TEXT PRIMARY KEY,
+    post_id TEXT NOT NULL,
+    content TEXT NOT NULL,
+    author_id TEXT NOT NULL,
+    author_username TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    parent_id TEXT,
+    depth INTEGER NOT NULL DEFAULT 0,
+    path TEXT
+);
+CREATE INDEX IF NOT EXISTS comments_post_id_created_at_id ON comments (post_id, created_at, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(id UNINDEXED, search_title, search_body);
+CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(post_id UNINDEXED, search_body);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS posts_archive (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    content TEXT NOT NULL,
+    author_id TEXT NOT NULL,
+    author_username TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    comment_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS comments_archive (
+    id TEXT PRIMARY KEY,
+    post_id TEXT NOT NULL,
+    content TEXT NOT NULL,
+    author_id TEXT NOT NULL,
+    author_username TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    parent_id TEXT,
+    depth INTEGER NOT NULL DEFAULT 0,
+    path TEXT
+);
+CREATE INDEX IF NOT EXISTS comments_archive_post_id_created_at_id ON comments_archive (post_id, created_at, id);
+CREATE INDEX IF NOT EXISTS comments_archive_top_level ON comments_archive (post_id, created_at, id) WHERE parent_id IS NULL;
+CREATE INDEX IF NOT EXISTS comments_archive_path ON comments_archive (path) WHERE path IS NOT NULL;
+CREATE TABLE IF NOT EXISTS post_counters (
+    post_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (post_id, name, shard)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS import_checkpoints (key TEXT PRIMARY KEY, records INTEGER NOT NULL, updated_at TEXT NOT NULL);
+"""
+# Columns added after the first schema: (table, column, definition)
+ADDED_COLUMNS = [
+    ("comments", "parent_id", "TEXT"),
+    ("comments", "depth", "INTEGER NOT NULL DEFAULT 0"),
+    ("comments", "path", "TEXT"),
+]
+# Created once ADDED_COLUMNS exist
+THREAD_INDEXES = """
+CREATE INDEX IF NOT EXISTS comments_top_level ON comments (post_id, created_at, id) WHERE parent_id IS NULL;
+CREATE INDEX IF NOT EXISTS comments_path ON comments (path) WHERE path IS NOT NULL;
+"""
+
+DATETIME_FIELDS = {"created_at", "updated_at"}
+BOOL_FIELDS = {"is_admin"}
+COLUMNS = {
+    "users": USER_FIELDS,
+    "posts": POST_FIELDS + ("comment_count",),
+    "comments": COMMENT_FIELDS,
+}
+HOT_QUERIES = [
+    ("posts feed page", "SELECT id FROM posts WHERE (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT 20", ("", "")),
+    ("comments of a post", "SELECT id FROM comments WHERE post_id = ? ORDER BY created_at, id LIMIT 20", ("",)),
+    (
+        "top-level comments of a post",
+        "SELECT id FROM comments WHERE post_id = ? AND parent_id IS NULL ORDER BY created_at, id LIMIT 20",
+        ("",),
+    ),
+    ("replies below a comment", "SELECT id FROM comments WHERE path > ? AND path < ? ORDER BY path LIMIT 20", ("a/", "a0")),
+    ("login by username", "SELECT id FROM users WHERE username = ?", ("",)),
+    ("post by id", "SELECT id FROM posts WHERE id = ?", ("",)),
+]
+
+
+def _dump_datetime(value: datetime) -> str:
+    return value.isoformat(timespec="microseconds")
+
+
+def _to_row(doc: dict, columns) -> tuple:
+    row = []
+    for column in columns:
+        value = doc.get(column)
+        if column in DATETIME_FIELDS and isinstance(value, datetime):
+            value = _dump_datetime(value)
+        row.append(value)
+    return tuple(row)
+
+
+def _from_row(row, columns) -> dict:
+    doc = {}
+    for column, value in zip(columns, row):
+        if column in DATETIME_FIELDS:
+            value = datetime.fromisoformat(value)
+        elif column in BOOL_FIELDS:
+            value = bool(value)
+        doc[column] = value
+    return doc
+
+
+def _after(after: After) -> Optional[Tuple[str, str]]:
+    return (_dump_datetime(after[0]), after[1]) if after else None
+
+
+def _match_expression(terms: List[str], phrases: List[str]) -> str:
+    # Same semantics as Mongo $text: all phrases, otherwise any term
+    if phrases:
+        return " AND ".join(f'"{phrase}"' for phrase in phrases)
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+def _post_columns(fields) -> str:
+    return ", ".join(SNIPPET_COLUMN if field == "snippet" else field for field in fields)
+
+
+def _insert_sql(table: str, columns, ignore: bool = False) -> str:
+    verb = "INSERT OR IGNORE" if ignore else "INSERT"
+    return f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+
+POST_COLUMNS = ", ".join(POST_FIELDS)
+SNIPPET_COLUMN = f"substr(content, 1, {SNIPPET_LENGTH + 1}) AS snippet"
+COMMENT_COLUMNS = ", ".join(COMMENT_FIELDS)
+USER_COLUMNS = ", ".join(USER_FIELDS)
+
+
+class SQLiteUserRepository(UserRepository):
+    def __init__(self, storage: "SQLiteStorage"):
+        self.storage = storage
+
+    async def insert(self, user: dict) -> None:
+        user = {"token_version": 0, "is_admin": False, **user}
+        try:
+            await self.storage.execute(_insert_sql("users", USER_FIELDS), _to_row(user, USER_FIELDS))
+        except self.storage.IntegrityError:
+            raise DuplicateKeyError()
+
+    async def _get(self, column: str, value: str) -> Optional[dict]:
+        row = await self.storage.fetchone(f"SELECT {USER_COLUMNS} FROM users WHERE {column} = ?", (value,))
+        return _from_row(row, USER_FIELDS) if row else None
+
+    async def get_by_id(self, user_id: str) -> Optional[dict]:
+        return await self._get("id", user_id)
+
+    async def get_by_username(self, username: str) -> Optional[dict]:
+        return await self._get("username", username)
+
+    async def get_many(self, user_ids: List[str]) -> List[dict]:
+        if not user_ids:
+            return []
+        rows = await self.storage.fetchall(
+            f"SELECT {USER_COLUMNS} FROM users WHERE id IN ({', '.join('?' * len(user_ids))})", tuple(user_ids)
+        )
+        return [_from_row(row, USER_FIELDS) for row in rows]
+
+    async def username_or_email_taken(self, username: str, email: str) -> bool:
+        row = await self.storage.fetchone("SELECT 1 FROM users WHERE username = ? OR email = ? LIMIT 1", (username, email))
+        return row is not None
+
+    async def get_token_version(self, user_id: str) -> Optional[int]:
+        row = await self.storage.fetchone("SELECT token_version FROM users WHERE id = ?", (user_id,))
+        return row[0] if row else None
+
+    async def bump_token_version(self, user_id: str) -> Optional[int]:
+        row = await self.storage.fetchone(
+            "UPDATE users SET token_version = token_version + 1 WHERE id = ? RETURNING token_version", (user_id,), commit=True
+        )
+        return row[0] if row else None
+
+
+class SQLitePostRepository(PostRepository):
+    def __init__(self, storage: "SQLiteStorage", table: str = "posts"):
+        self.storage = storage
+        self.table = table
+
+    async def insert(self, post: dict) -> None:
+        await self.storage.insert_many("posts", [post], ignore=False)
+
+    async def get(self, post_id: str) -> Optional[dict]:
+        row = await self.storage.fetchone(f"SELECT {POST_COLUMNS} FROM {self.table} WHERE id = ?", (post_id,))
+        return _from_row(row, POST_FIELDS) if row else None
+
+    async def get_many(self, post_ids: List[str]) -> List[dict]:
+        if not post_ids:
+            return []
+        rows = await self.storage.fetchall(
+            f"SELECT {POST_COLUMNS} FROM {self.table} WHERE id IN ({', '.join('?' * len(post_ids))})", tuple(post_ids)
+        )
+        return [_from_row(row, POST_FIELDS) for row in rows]
+
+    async def _page_rows(self, columns: str, after: After, limit: int):
+        after = _after(after)
+        where = "WHERE (created_at, id) < (?, ?) " if after else ""
+        return await self.storage.fetchall(
+            f"SELECT {columns} FROM posts {where}ORDER BY created_at DESC, id DESC LIMIT ?", (*(after or ()), limit)
+        )
+
+    async def page(self, after: After, limit: int, fields: Optional[Sequence[str]] = None) -> List[dict]:
+        fields = post_fields(fields)
+        return [_from_row(row, fields) for row in await self._page_rows(_post_columns(fields), after, limit)]
+
+    async def feed_page(self, after: After, limit: int, preview: int, fields: Optional[Sequence[str]] = None) -> List[dict]:
+        fields = post_fields(fields) + ("comment_count",)
+        posts = [_from_row(row, fields) for row in await self._page_rows(_post_columns(fields), after, limit)]
+        latest: Dict[str, List[dict]] = {}
+        if preview and posts:
+            # Newest ``preview`` comments of every post on the page in one query
+            ids = [post["id"] for post in posts]
+            rows = await self.storage.fetchall(
+                f"""SELECT {COMMENT_COLUMNS} FROM (
+                        SELECT {COMMENT_COLUMNS}, ROW_NUMBER() OVER (
+                            PARTITION BY post_id ORDER BY created_at DESC, id DESC
+                        ) AS position
+                        FROM comments WHERE post_id IN ({', '.join('?' * len(ids))})
+                    ) WHERE position <= ? ORDER BY post_id, position""",
+                (*ids, preview),
+            )
+            for row in rows:
+                comment = _from_row(row, COMMENT_FIELDS)
+                latest.setdefault(comment["post_id"], []).append(comment)
+        for post in posts:
+            post["latest_comments"] = latest.get(post["id"], [])
+        return posts
+
+    async def comment_count(self, post_id: str) -> Optional[int]:
+        row = await self.storage.fetchone(f"SELECT comment_count FROM {self.table} WHERE id = ?", (post_id,))
+        return row[0] if row else None
+
+    async def increment_comment_count(self, post_id: str, by: int = 1) -> None:
+        await self.storage.execute("UPDATE posts SET comment_count = comment_count + ? WHERE id = ?", (by, post_id))
+
+    async def search(self, terms: List[str], phrases: List[str], limit: int) -> List[Tuple[dict, float]]:
+        columns = ", ".join(f"p.{field}" for field in POST_FIELDS)
+        # bm25 is lower-is-better, so it is negated into a score
+        rows = await self.storage.fetchall(
+            f"""SELECT {columns}, -bm25(posts_fts, 0.0, ?, 1.0) AS score
+                FROM posts_fts JOIN posts p ON p.id = posts_fts.id
+                WHERE posts_fts MATCH ? ORDER BY score DESC LIMIT ?""",
+            (float(TITLE_WEIGHT), _match_expression(terms, phrases), limit),
+        )
+        return [(_from_row(row[:-1], POST_FIELDS), row[-1]) for row in rows]
+
+
+class SQLiteCommentRepository(CommentRepository):
+    def __init__(self, storage: "SQLiteStorage", table: str = "comments"):
+        self.storage = storage
+        self.table = table
+
+    async def insert(self, comment: dict) -> None:
+        await self.storage.insert_many("comments", [comment], ignore=False)
+
+    async def get(self, comment_id: str) -> Optional[dict]:
+        row = await self.storage.fetchone(f"SELECT {COMMENT_COLUMNS} FROM {self.table} WHERE id = ?", (comment_id,))
+        return _from_row(row, COMMENT_FIELDS) if row else None
+
+    async def _page(self, condition: str, post_id: str, after: After, limit: int) -> List[dict]:
+        after = _after(after)
+        where = "AND (created_at, id) > (?, ?) " if after else ""
+        rows = await self.storage.fetchall(
+            f"SELECT {COMMENT_COLUMNS} FROM {self.table} WHERE {condition} {where}ORDER BY created_at, id LIMIT ?",
+            (post_id, *(after or ()), limit),
+        )
+        return [_from_row(row, COMMENT_FIELDS) for row in rows]
+
+    async def page(self, post_id: str, after: After, limit: int) -> List[dict]:
+        return await self._page("post_id = ?", post_id, after, limit)
+
+    async def top_level_page(self, post_id: str, after: After, limit: int) -> List[dict]:
+        return await self._page("post_id = ? AND parent_id IS NULL", post_id, after, limit)
+
+    async def subtree(self, path: str, after_path: Optional[str], limit: int) -> List[dict]:
+        low, high = subtree_range(path)
+        rows = await self.storage.fetchall(
+            f"SELECT {COMMENT_COLUMNS} FROM {self.table} WHERE path > ? AND path < ? ORDER BY path LIMIT ?",
+            (max(low, after_path or low), high, limit),
+        )
+        return [_from_row(row, COMMENT_FIELDS) for row in rows]
+
+    async def subtrees(self, paths: List[str], per_path: int) -> Dict[str, List[dict]]:
+        groups = {path: [] for path in paths}
+        if not paths:
+            return groups
+        # One limited range read per thread; the trailing column says which thread a row is in
+        thread = (
+            f"SELECT * FROM (SELECT {COMMENT_COLUMNS}, ? AS thread FROM {self.table} "
+            "WHERE path > ? AND path < ? ORDER BY path LIMIT ?)"
+        )
+        params = []
+        for index, path in enumerate(paths):
+            params.extend((index, *subtree_range(path), per_path))
+        rows = await self.storage.fetchall(
+            f"SELECT * FROM ({' UNION ALL '.join([thread] * len(paths))}) ORDER BY thread, path", tuple(params)
+        )
+        for row in rows:
+            groups[paths[row[-1]]].append(_from_row(row, COMMENT_FIELDS))
+        return groups
+
+    async def first_for_posts(self, post_ids: List[str], per_post: int) -> Dict[str, List[dict]]:
+        placeholders = ", ".join("?" * len(post_ids))
+        existing = await self.storage.fetchall(f"SELECT id FROM posts WHERE id IN ({placeholders})", tuple(post_ids))
+        groups = {row[0]: [] for row in existing}
+        rows = await self.storage.fetchall(
+            f"""SELECT {COMMENT_COLUMNS} FROM (
+                    SELECT {COMMENT_COLUMNS}, ROW_NUMBER() OVER (
+                        PARTITION BY post_id ORDER BY created_at, id
+                    ) AS position
+                    FROM comments WHERE post_id IN ({placeholders})
+                ) WHERE position <= ? ORDER BY post_id, position""",
+            (*post_ids, per_post),
+        )
+        for row in rows:
+            comment = _from_row(row, COMMENT_FIELDS)
+            if comment["post_id"] in groups:
+                groups[comment["post_id"]].append(comment)
+        return groups
+
+    async def search(self, terms: List[str], phrases: List[str], limit: int) -> List[Tuple[str, float]]:
+        rows = await self.storage.fetchall(
+            """SELECT post_id, -bm25(comments_fts) AS score FROM comments_fts
+               WHERE comments_fts MATCH ? ORDER BY score DESC LIMIT ?""",
+            (_match_expression(terms, phrases), limit),
+        )
+        return [(row[0], row[1]) for row in rows]
+
+
+class SQLiteCounterRepository(CounterRepository):
+    def __init__(self, storage: "SQLiteStorage"):
+        self.storage = storage
+
+    async def add(self, deltas: CounterDeltas) -> None:
+        await self.storage.executemany(
+            "INSERT INTO post_counters (post_id, name, shard, value) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (post_id, name, shard) DO UPDATE SET value = value + excluded.value",
+            [
+                (post_id, name, shard, amount)
+                for (post_id, shard), counts in deltas.items()
+                for name, amount in counts.items()
+            ],
+        )
+
+    async def totals(self, post_ids: List[str]) -> Dict[str, Dict[str, int]]:
+        if not post_ids:
+            return {}
+        rows = await self.storage.fetchall(
+            f"SELECT post_id, name, SUM(value) FROM post_counters WHERE post_id IN ({', '.join('?' * len(post_ids))}) "
+            "GROUP BY post_id, name",
+            tuple(post_ids),
+        )
+        totals: Dict[str, Dict[str, int]] = {}
+        for post_id, name, value in rows:
+            totals.setdefault(post_id, {})[name] = value
+        return totals
+
+
+class SQLiteStorage(Storage):
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        import aiosqlite
+
+        self.path = path
+        self.IntegrityError = aiosqlite.IntegrityError
+        self._connect = aiosqlite.connect
+        self.connection = None
+        self.reader = None
+        self._write_lock = asyncio.Lock()
+        self._read_lock = contextlib.nullcontext()
+        self.users = SQLiteUserRepository(self)
+        self.posts = SQLitePostRepository(self)
+        self.comments = SQLiteCommentRepository(self)
+        self.counters = SQLiteCounterRepository(self)
+        self.archived_posts = SQLitePostRepository(self, "posts_archive")
+        self.archived_comments = SQLiteCommentRepository(self, "comments_archive")
+
+    async def startup(self) -> None:
+        if self.connection is not None:
+            return
+        self.connection = await self._connect(self.path)
+        await self.connection.execute("PRAGMA journal_mode=WAL")
+        await self.connection.execute("PRAGMA synchronous=NORMAL")
+        await self.connection.executescript(SCHEMA)
+        for table, column, definition in ADDED_COLUMNS:
+            async with self.connection.execute(f"PRAGMA table_info({table})") as cursor:
+                existing = {row[1] for row in await cursor.fetchall()}
+            if column not in existing:
+                await self.connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        await self.connection.executescript(THREAD_INDEXES)
+        await self.connection.commit()
+        if self.path == ":memory:":
+            # A private in-memory database cannot be opened twice; reads wait for writes instead
+            self.reader = self.connection
+            self._read_lock = self._write_lock
+        else:
+            self.reader = await self._connect(f"{Path(self.path).resolve().as_uri()}?mode=ro", uri=True)
+
+    async def close(self) -> None:
+        if self.reader is not None and self.reader is not self.connection:
+            await self.reader.close()
+        self.reader = None
+        if self.connection is not None:
+            await self.connection.close()
+            self.connection = None
+
+    async def execute(self, sql: str, params: tuple = ()) -> None:
+        async with self._write_lock:
+            try:
+                await self.connection.execute(sql, params)
+            except Exception:
+                await self.connection.rollback()
+                raise
+            await self.connection.commit()
+
+    async def executemany(self, sql: str, rows: List[tuple]) -> None:
+        async with self._write_lock:
+            try:
+                await self.connection.executemany(sql, rows)
+            except Exception:
+                await self.connection.rollback()
+                raise
+            await self.connection.commit()
+
+    async def fetchone(self, sql: str, params: tuple = (), commit: bool = False):
+        if commit:
+            async with self._write_lock:
+                async with self.connection.execute(sql, params) as cursor:
+                    row = await cursor.fetchone()
+                await self.connection.commit()
+            return row
+        async with self._read_lock:
+            async with self.reader.execute(sql, params) as cursor:
+                return await cursor.fetchone()
+
+    async def fetchall(self, sql: str, params: tuple = ()) -> list:
+        async with self._read_lock:
+            async with self.reader.execute(sql, params) as cursor:
+                return await cursor.fetchall()
+
+    async def get_feed_version(self) -> int:
+        row = await self.fetchone("SELECT value FROM meta WHERE key = 'feed_version'")
+        return row[0] if row else 0
+
+    async def bump_feed_version(self) -> None:
+        await self.execute(
+            "INSERT INTO meta (key, value) VALUES ('feed_version', 1) ON CONFLICT (key) DO UPDATE SET value = value + 1"
+        )
+
+    async def iter_documents(self, collection: str, since: Optional[datetime], until: Optional[datetime]) -> AsyncIterator[dict]:
+        columns = COLUMNS[collection]
+        conditions, params = [], []
+        if since:
+            conditions.append("created_at >= ?")
+            params.append(_dump_datetime(since))
+        if until:
+            conditions.append("created_at < ?")
+            params.append(_dump_datetime(until))
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        async with self._read_lock:
+            async with self.reader.execute(f"SELECT {', '.join(columns)} FROM {collection}{where}", tuple(params)) as cursor:
+                async for row in cursor:
+                    yield _from_row(row, columns)
+
+    async def insert_many(self, collection: str, docs: List[dict], ignore: bool = True) -> Tuple[int, int]:
+        """Insert ``docs`` in one transaction, with their search rows.
+
+        With ``ignore`` duplicates are skipped and counted; otherwise the
+        first one rolls the batch back and raises DuplicateKeyError.
+        """
+        if not docs:
+            return 0, 0
+        columns = COLUMNS[collection]
+        if collection == "posts":
+            docs = [{"comment_count": 0, **doc} for doc in docs]
+        elif collection == "users":
+            docs = [{"token_version": 0, "is_admin": False, **doc} for doc in docs]
+        elif collection == "comments":
+            docs = [with_thread_fields(doc) for doc in docs]
+        sql = _insert_sql(collection, columns, ignore=ignore)
+        async with self._write_lock:
+            return await self._insert_rows(collection, sql, columns, docs)
+
+    async def _insert_rows(self, collection: str, sql: str, columns, docs: List[dict]) -> Tuple[int, int]:
+        inserted = 0
+        try:
+            for doc in docs:
+                cursor = await self.connection.execute(sql, _to_row(doc, columns))
+                if not cursor.rowcount:
+                    continue
+                inserted += 1
+                if collection == "posts":
+                    folded = post_search_fields(doc["title"], doc["content"])
+                    await self.connection.execute(
+                        "INSERT INTO posts_fts (id, search_title, search_body) VALUES (?, ?, ?)",
+                        (doc["id"], folded["search_title"], folded["search_body"]),
+                    )
+                elif collection == "comments":
+                    await self.connection.execute(
+                        "INSERT INTO comments_fts (post_id, search_body) VALUES (?, ?)",
+                        (doc["post_id"], comment_search_fields(doc["content"])["search_body"]),
+                    )
+            await self.connection.commit()
+        except self.IntegrityError:
+            await self.connection.rollback()
+            raise DuplicateKeyError()
+        return inserted, len(docs) - inserted
+
+    async def archive_posts(self, before: datetime, limit: int) -> Tuple[int, int]:
+        post_columns = ", ".join(COLUMNS["posts"])
+        comment_columns = ", ".join(COLUMNS["comments"])
+        async with self._write_lock:
+            # One transaction: the batch is either still hot or fully archived
+            try:
+                async with self.connection.execute(
+                    "SELECT id FROM posts WHERE created_at < ? ORDER BY created_at, id LIMIT ?", (_dump_datetime(before), limit)
+                ) as cursor:
+                    post_ids = tuple(row[0] for row in await cursor.fetchall())
+                if not post_ids:
+                    return 0, 0
+                placeholders = ", ".join("?" * len(post_ids))
+                await self.connection.execute(
+                    f"INSERT OR REPLACE INTO posts_archive ({post_columns}) SELECT {post_columns} FROM posts WHERE id IN ({placeholders})",
+                    post_ids,
+                )
+                cursor = await self.connection.execute(
+                    f"INSERT OR REPLACE INTO comments_archive ({comment_columns}) "
+                    f"SELECT {comment_columns} FROM comments WHERE post_id IN ({placeholders})",
+                    post_ids,
+                )
+                comments = cursor.rowcount
+                for sql in (
+                    f"DELETE FROM comments_fts WHERE post_id IN ({placeholders})",
+                    f"DELETE FROM comments WHERE post_id IN ({placeholders})",
+                    f"DELETE FROM posts_fts WHERE id IN ({placeholders})",
+                    f"DELETE FROM posts WHERE id IN ({placeholders})",
+                ):
+                    await self.connection.execute(sql, post_ids)
+                await self.connection.commit()
+            except BaseException:
+                await self.connection.rollback()
+                raise
+        return len(post_ids), comments
+
+    async def get_checkpoint(self, key: str) -> int:
+        row = await self.fetchone("SELECT records FROM import_checkpoints WHERE key = ?", (key,))
+        return row[0] if row else 0
+
+    async def save_checkpoint(self, key: str, records: int) -> None:
+        await self.execute(
+            """INSERT INTO import_checkpoints (key, records, updated_at) VALUES (?, ?, ?)
+               ON CONFLICT (key) DO UPDATE SET records = excluded.records, updated_at = excluded.updated_at""",
+            (key, records, _dump_datetime(datetime.utcnow())),
+        )
+
+    async def query_plans(self) -> dict:
+        plans = []
+        for label, sql, params in HOT_QUERIES:
+            rows = await self.fetchall(f"EXPLAIN QUERY PLAN {sql}", params)
+            stages = [row[-1] for row in rows]
+            # A bare "SCAN <table>" without an index is SQLite's collection scan
+            collscan = any(stage.startswith("SCAN ") and "INDEX" not in stage for stage in stages)
+            plans.append({"query": label, "stages": stages, "collscan": collscan})
+        return {"index_problems": [], "plans": plans}
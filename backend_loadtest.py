@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Load test harness for the fsociety forum API
+Drives a realistic mix of register/login/feed/post/comment traffic with
+concurrent async clients and reports p50/p95/p99 latency, throughput and
+error rate per route. Results are written as JSON so runs can be compared.
+
+    # against a server you already started
+    python backend_loadtest.py --base-url http://localhost:8001/api
+
+    # start uvicorn locally (uses MONGO_URL/DB_NAME from backend/.env)
+    python backend_loadtest.py --start-server --concurrency 64 --duration 60
+
+    # ... or without MongoDB, on the in-memory engine
+    STORAGE_ENGINE=memory python backend_loadtest.py --start-server
+
+    # compare with a previous run
+    python backend_loadtest.py --compare loadtest-results/previous.json
+
+--start-server turns off the login/register rate limits for its server,
+since setup registers and logs in every account from one address. Start
+an external server with the same settings:
+
+    RATE_LIMIT_LOGIN_IP=0 RATE_LIMIT_LOGIN_USERNAME=0 RATE_LIMIT_REGISTER_IP=0
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+ROOT_DIR = Path(__file__).parent
+# Setup and the login/register steps all come from this one address
+UNLIMITED_AUTH_ENV = {"RATE_LIMIT_LOGIN_IP": "0", "RATE_LIMIT_LOGIN_USERNAME": "0", "RATE_LIMIT_REGISTER_IP": "0"}
+DEFAULT_MIX = "feed=45,feed_page2=5,post=8,comments=15,create_post=5,create_comment=10,me=6,login=3,register=2,root=1"
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.status_codes = defaultdict(lambda: defaultdict(int))
+
+    def record(self, route, seconds, status):
+        self.latencies[route].append(seconds)
+        self.status_codes[route][status] += 1
+        if status >= 400 or status == 0:
+            self.errors[route] += 1
+
+
+class SetupRateLimited(Exception):
+    pass
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class LoadTest:
+    def __init__(self, base_url, concurrency, duration, mix, users, password):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.duration = duration
+        self.mix = mix
+        self.user_count = users
+        self.password = password
+        self.stats = Stats()
+        self.accounts = []  # (username, token)
+        self.post_ids = []
+        self.next_cursor = None
+
+    async def request(self, client, route, method, path, **kwargs):
+        start = time.perf_counter()
+        status = 0
+        try:
+            response = await client.request(method, f"{self.base_url}{path}", **kwargs)
+            status = response.status_code
+            return response
+        except httpx.HTTPError:
+            return None
+        finally:
+            self.stats.record(route, time.perf_counter() - start, status)
+
+    def auth(self):
+        _, token = random.choice(self.accounts)
+        return {"Authorization": f"Bearer {token}"}
+
+    async def setup(self, client):
+        """Register the user pool and seed a few posts; not counted in results."""
+        run_id = uuid.uuid4().hex[:8]
+        for i in range(self.user_count):
+            username = f"load_{run_id}_{i}"
+            response = await client.post(f"{self.base_url}/register", json={
+                "username": username, "email": f"{username}@fsociety.com", "password": self.password,
+            })
+            if response.status_code != 429:
+                response = await client.post(f"{self.base_url}/login", json={"username": username, "password": self.password})
+            if response.status_code == 429:
+                raise SetupRateLimited(f"{response.request.url.path} returned 429 after {i} of {self.user_count} accounts")
+            response.raise_for_status()
+            self.accounts.append((username, response.json()["access_token"]))
+        for i in range(10):
+            response = await client.post(f"{self.base_url}/posts", headers=self.auth(), json={
+                "title": f"Load test seed {i}", "content": "Sistem bozuldu. " * 20,
+            })
+            response.raise_for_status()
+            self.post_ids.append(response.json()["id"])
+
+    # Scenario steps, named after the keys accepted by --mix
+    async def op_root(self, client):
+        await self.request(client, "GET /api/", "GET", "/")
+
+    async def op_register(self, client):
+        username = f"load_{uuid.uuid4().hex[:12]}"
+        await self.request(client, "POST /api/register", "POST", "/register", json={
+            "username": username, "email": f"{username}@fsociety.com", "password": self.password,
+        })
+
+    async def op_login(self, client):
+        username, _ = random.choice(self.accounts)
+        await self.request(client, "POST /api/login", "POST", "/login", json={"username": username, "password": self.password})
+
+    async def op_me(self, client):
+        await self.request(client, "GET /api/me", "GET", "/me", headers=self.auth())
+
+    async def op_feed(self, client):
+        response = await self.request(client, "GET /api/posts", "GET", "/posts")
+        if response is not None and response.status_code == 200:
+            self.next_cursor = response.headers.get("x-next-cursor") or self.next_cursor
+
+    async def op_feed_page2(self, client):
+        params = {"cursor": self.next_cursor} if self.next_cursor else {}
+        await self.request(client, "GET /api/posts?cursor", "GET", "/posts", params=params)
+
+    async def op_post(self, client):
+        await self.request(client, "GET /api/posts/{post_id}", "GET", f"/posts/{random.choice(self.post_ids)}")
+
+    async def op_comments(self, client):
+        await self.request(client, "GET /api/posts/{post_id}/comments", "GET", f"/posts/{random.choice(self.post_ids)}/comments")
+
+    async def op_create_post(self, client):
+        response = await self.request(client, "POST /api/posts", "POST", "/posts", headers=self.auth(), json={
+            "title": "Yük testi", "content": "Güç halka aittir. " * random.randint(1, 30),
+        })
+        if response is not None and response.status_code == 200:
+            self.post_ids.append(response.json()["id"])
+            del self.post_ids[:-500]
+
+    async def op_create_comment(self, client):
+        await self.request(client, "POST /api/comments", "POST", "/comments", headers=self.auth(), json={
+            "post_id": random.choice(self.post_ids), "content": "Merhaba, dostum.",
+        })
+
+    async def worker(self, client, deadline):
+        ops = [getattr(self, f"op_{name}") for name in self.mix]
+        weights = list(self.mix.values())
+        while time.perf_counter() < deadline:
+            await random.choices(ops, weights)[0](client)
+
+    async def run(self):
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+            await self.setup(client)
+            start = time.perf_counter()
+            deadline = start + self.duration
+            await asyncio.gather(*(self.worker(client, deadline) for _ in range(self.concurrency)))
+            return time.perf_counter() - start
+
+    def report(self, elapsed):
+        routes = {}
+        for route, values in sorted(self.stats.latencies.items()):
+            values.sort()
+            count = len(values)
+            routes[route] = {
+                "count": count,
+                "rps": round(count / elapsed, 2),
+                "error_rate": round(self.stats.errors[route] / count, 4),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2),
+                "status_codes": dict(self.stats.status_codes[route]),
+            }
+        total = sum(r["count"] for r in routes.values())
+        return {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_commit": git_commit(),
+            "config": {
+                "base_url": self.base_url,
+                "concurrency": self.concurrency,
+                "duration_s": self.duration,
+                "mix": self.mix,
+                "users": self.user_count,
+            },
+            "elapsed_s": round(elapsed, 2),
+            "total_requests": total,
+            "total_rps": round(total / elapsed, 2),
+            "routes": routes,
+        }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if not hasattr(LoadTest, f"op_{name}"):
+            raise argparse.ArgumentTypeError(f"unknown scenario step: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def print_report(result, baseline=None):
+    print(f"\n{'='*100}")
+    print(f"LOAD TEST SUMMARY  commit={result['git_commit']}  concurrency={result['config']['concurrency']}  "
+          f"duration={result['elapsed_s']}s  total={result['total_requests']} req ({result['total_rps']} req/s)")
+    print(f"{'='*100}")
+    print(f"{'route':<38}{'count':>8}{'req/s':>9}{'err%':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route, r in result["routes"].items():
+        line = (f"{route:<38}{r['count']:>8}{r['rps']:>9}{r['error_rate']*100:>6.1f}%"
+                f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+        old = (baseline or {}).get("routes", {}).get(route)
+        if old and old["p99_ms"]:
+            line += f"   p99 {((r['p99_ms'] - old['p99_ms']) / old['p99_ms'] * 100):+.1f}%"
+            if old["rps"]:
+                line += f"  req/s {((r['rps'] - old['rps']) / old['rps'] * 100):+.1f}%"
+        print(line)
+
+
+async def wait_for_server(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{base_url}/")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"Server at {base_url} did not come up within {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the forum API")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8001/api")
+    parser.add_argument("--start-server", action="store_true", help="launch uvicorn from backend/ for the run")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers when --start-server is used")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30, help="seconds of measured traffic")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"weighted steps (default: {DEFAULT_MIX})")
+    parser.add_argument("--users", type=int, default=20, help="accounts registered during setup")
+    parser.add_argument("--password", default="loadtest-Sifre1")
+    parser.add_argument("--output", help="result file (default: loadtest-results/<timestamp>.json)")
+    parser.add_argument("--compare", help="previous result file to diff against")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    server = None
+    if args.start_server:
+        port = httpx.URL(args.base_url).port or 8001
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "--factory", "server:create_app", "--host", "127.0.0.1", "--port", str(port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=ROOT_DIR / "backend",
+            env={**os.environ, **UNLIMITED_AUTH_ENV},
+        )
+    try:
+        asyncio.run(wait_for_server(args.base_url))
+        test = LoadTest(args.base_url, args.concurrency, args.duration, args.mix, args.users, args.password)
+        result = test.report(asyncio.run(test.run()))
+    except SetupRateLimited as e:
+        settings = " ".join(f"{name}={value}" for name, value in UNLIMITED_AUTH_ENV.items())
+        print(f"Setup was rate limited: {e}.\nStart the server with {settings}, or use --start-server.", file=sys.stderr)
+        return 1
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=10)
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(result, baseline)
+
+    output = Path(args.output) if args.output else ROOT_DIR / "loadtest-results" / f"{datetime.utcnow():%Y%m%dT%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    print(f"\nResults saved to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
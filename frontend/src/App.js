@@ -1,9 +1,11 @@
-import React, { useState, useEffect, useContext, createContext } from "react";
+import React, { useState, useEffect, useContext, createContext, useRef, useCallback } from "react";
 import "./App.css";
 import axios from "axios";
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+// Comment counts and the newest comments come with the feed page itself
+const FEED_PARAMS = { with_counts: true, comments_preview: 2 };
 
 // Auth Context
 const AuthContext = createContext();
@@ -348,9 +350,18 @@ const ForumPost = ({ post, onCommentClick }) => {
       </div>
       <h3 className="post-title">{post.title}</h3>
       <div className="post-content">{post.content}</div>
+      {post.latest_comments?.length > 0 && (
+        <div className="comment-preview">
+          {post.latest_comments.map(comment => (
+            <div key={comment.id} className="comment-preview-item">
+              <span className="username">{comment.author_username}:</span> {comment.content}
+            </div>
+          ))}
+        </div>
+      )}
       <div className="post-actions">
         <button onClick={() => onCommentClick(post)} className="comment-button">
-          Yorumları Görüntüle
+          Yorumları Görüntüle{post.comment_count !== undefined ? ` (${post.comment_count})` : ''}
         </button>
       </div>
     </div>
@@ -359,6 +370,9 @@ const ForumPost = ({ post, onCommentClick }) => {
 
 const Dashboard = () => {
   const [posts, setPosts] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const sentinelRef = useRef(null);
   const [showCreatePost, setShowCreatePost] = useState(false);
   const [showRegister, setShowRegister] = useState(false);
   const [newPost, setNewPost] = useState({ title: '', content: '' });
@@ -368,25 +382,74 @@ const Dashboard = () => {
   useEffect(() => {
     fetchPosts();
   }, []);
+
+  // Live deltas replace refetching the feed after every change
+  useEffect(() => {
+    const source = new EventSource(`${API}/stream`);
+    source.addEventListener('post', (e) => {
+      const post = JSON.parse(e.data);
+      setPosts(prev => prev.some(p => p.id === post.id)
+        ? prev
+        : [{ ...post, comment_count: 0, latest_comments: [] }, ...prev]);
+    });
+    source.addEventListener('comment', (e) => {
+      const comment = JSON.parse(e.data);
+      setPosts(prev => prev.map(p => p.id !== comment.post_id ? p : {
+        ...p,
+        comment_count: (p.comment_count || 0) + 1,
+        latest_comments: [comment, ...(p.latest_comments || [])].slice(0, FEED_PARAMS.comments_preview),
+      }));
+    });
+    source.addEventListener('resync', () => fetchPosts());
+    return () => source.close();
+  }, []);
   
   const fetchPosts = async () => {
     try {
-      const response = await axios.get(`${API}/posts`);
+      const response = await axios.get(`${API}/posts`, { params: FEED_PARAMS });
       setPosts(response.data);
+      setNextCursor(response.headers['x-next-cursor'] || null);
     } catch (error) {
       console.error('Error fetching posts:', error);
     }
   };
+
+  const fetchMorePosts = useCallback(async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const response = await axios.get(`${API}/posts`, { params: { ...FEED_PARAMS, cursor: nextCursor } });
+      setPosts(prev => [...prev, ...response.data]);
+      setNextCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Error fetching posts:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  }, [nextCursor, loadingMore]);
+
+  useEffect(() => {
+    const sentinel = sentinelRef.current;
+    if (!sentinel || !nextCursor) return;
+    const observer = new IntersectionObserver(entries => {
+      if (entries[0].isIntersecting) fetchMorePosts();
+    }, { rootMargin: '200px' });
+    observer.observe(sentinel);
+    return () => observer.disconnect();
+  }, [nextCursor, fetchMorePosts]);
   
   const handleCreatePost = async (e) => {
     e.preventDefault();
     setLoading(true);
     
     try {
-      await axios.post(`${API}/posts`, newPost);
+      const response = await axios.post(`${API}/posts`, newPost);
+      const created = response.data;
+      setPosts(prev => prev.some(p => p.id === created.id)
+        ? prev
+        : [{ ...created, comment_count: 0, latest_comments: [] }, ...prev]);
       setNewPost({ title: '', content: '' });
       setShowCreatePost(false);
-      fetchPosts();
     } catch (error) {
       console.error('Error creating post:', error);
     } finally {
@@ -466,6 +529,9 @@ const Dashboard = () => {
               />
             ))
           )}
+          <div ref={sentinelRef} className="posts-sentinel">
+            {loadingMore && <div className="loading-text">yükleniyor...</div>}
+          </div>
         </div>
       </main>
     </div>
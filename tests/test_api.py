@@ -0,0 +1,251 @@
+"""API behaviour that spans storage, auth and caching, on the memory and sqlite engines."""
+import asyncio
+import json
+import threading
+from datetime import datetime, timedelta
+
+import httpx
+import jwt
+import pytest
+
+import server
+from settings import Settings
+
+BASE_TIME = datetime(2024, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def api(request, tmp_path):
+    """Run ``test(client)`` against a fresh app; keyword arguments are extra settings."""
+    def runner(test, **env):
+        async def main():
+            settings = Settings.from_env({
+                "STORAGE_ENGINE": request.param,
+                "SQLITE_PATH": str(tmp_path / "api.db"),
+                "WARMUP_ENABLED": "0",
+                "PROFILE_DIR": str(tmp_path / "profiles"),
+                **env,
+            })
+            app = server.create_app(settings)
+            async with app.router.lifespan_context(app):
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                    await test(client)
+
+        asyncio.run(main())
+
+    return runner
+
+
+async def add_user(name, is_admin=False):
+    """Store a user directly, skipping bcrypt, and return auth headers for them."""
+    user = {
+        "id": f"u-{name}",
+        "username": name,
+        "email": f"{name}@fsociety.com",
+        "password_hash": "hash",
+        "avatar": "avatar.png",
+        "created_at": BASE_TIME,
+        "is_admin": is_admin,
+        "token_version": 0,
+    }
+    await server.storage.users.insert(user)
+    return {"Authorization": f"Bearer {server.create_access_token(user)}"}
+
+
+async def add_post(index, created_at=None):
+    created_at = created_at or BASE_TIME + timedelta(minutes=index)
+    post = {
+        "id": f"p-{index}",
+        "title": "Başlık",
+        "content": "İçerik",
+        "author_id": "u-elliot",
+        "author_username": "elliot",
+        "created_at": created_at,
+        "updated_at": created_at,
+    }
+    await server.storage.posts.insert(post)
+    return post
+
+
+def test_export_window_accepts_utc_offsets(api):
+    async def test(client):
+        headers = await add_user("lukha", is_admin=True)
+        await add_post(0, BASE_TIME)
+        await add_post(1, BASE_TIME + timedelta(hours=2))
+
+        async def exported(**params):
+            response = await client.get("/api/export", params={"collections": "posts", **params}, headers=headers)
+            assert response.status_code == 200
+            return [json.loads(line)["data"]["id"] for line in response.text.splitlines()]
+
+        assert await exported(since="2024-01-01T13:00:00Z") == ["p-1"]
+        # 15:00+03:00 is 12:00 UTC
+        assert sorted(await exported(since="2024-01-01T15:00:00+03:00")) == ["p-0", "p-1"]
+        assert await exported(until="2024-01-01T16:00:00+03:00") == ["p-0"]
+
+    api(test)
+
+
+def test_threaded_comments_carry_their_first_replies(api):
+    async def test(client):
+        headers = await add_user("elliot")
+        await add_post(0)
+
+        async def reply(parent_id=None):
+            response = await client.post(
+                "/api/comments", json={"post_id": "p-0", "content": "yorum", "parent_id": parent_id}, headers=headers
+            )
+            assert response.status_code == 200
+            return response.json()["id"]
+
+        first, second = await reply(), await reply()
+        replies = [await reply(first) for _ in range(3)]
+        nested = await reply(replies[0])
+
+        response = await client.get("/api/posts/p-0/comments", params={"threaded": "true", "replies": 2})
+        threads = response.json()
+        assert [thread["id"] for thread in threads] == [first, second]
+        assert [comment["id"] for comment in threads[0]["replies"]] == [replies[0], nested]
+        assert threads[0]["replies_next_cursor"]
+        assert threads[1]["replies"] == [] and threads[1]["replies_next_cursor"] is None
+
+    api(test)
+
+
+def test_logout_all_revokes_earlier_tokens(api):
+    async def test(client):
+        headers = await add_user("elliot")
+        assert (await client.get("/api/me", headers=headers)).status_code == 200
+        assert (await client.post("/api/logout-all", headers=headers)).status_code == 200
+        assert (await client.get("/api/me", headers=headers)).status_code == 401
+
+        user = await server.storage.users.get_by_id("u-elliot")
+        fresh = {"Authorization": f"Bearer {server.create_access_token(user)}"}
+        assert (await client.get("/api/me", headers=fresh)).status_code == 200
+
+    api(test)
+
+
+def test_tokens_without_the_user_claims_are_rejected(api):
+    async def test(client):
+        await add_user("elliot")
+        # Tokens minted before the uid/ver claims carried only the username
+        legacy = jwt.encode({"sub": "elliot", "exp": datetime.utcnow() + timedelta(hours=1)}, server.SECRET_KEY, algorithm="HS256")
+        response = await client.get("/api/me", headers={"Authorization": f"Bearer {legacy}"})
+        assert response.status_code == 401
+
+    api(test)
+
+
+def test_login_is_rejected_with_503_while_the_hasher_is_full(api):
+    async def test(client):
+        await add_user("elliot")
+        release = threading.Event()
+
+        def blocked():
+            release.wait(5)
+            return None, 0.0
+
+        # The only worker is busy and no queueing is allowed
+        job = asyncio.ensure_future(server.password_hasher._run("hash", blocked))
+        await asyncio.sleep(0.05)
+        try:
+            response = await client.post("/api/login", json={"username": "elliot", "password": "parola"})
+            assert response.status_code == 503
+            assert response.headers["retry-after"] == "1"
+        finally:
+            release.set()
+            await job
+
+    api(test, PASSWORD_HASH_WORKERS="1", PASSWORD_HASH_QUEUE="0")
+
+
+def test_etags_revalidate_until_a_new_post_or_comment(api):
+    async def test(client):
+        headers = await add_user("elliot")
+        await add_post(0)
+
+        async def revalidated(path, etag):
+            return await client.get(path, headers={"If-None-Match": etag})
+
+        feed = await client.get("/api/posts")
+        comments = await client.get("/api/posts/p-0/comments")
+        post = await client.get("/api/posts/p-0")
+        for path, response in (("/api/posts", feed), ("/api/posts/p-0/comments", comments), ("/api/posts/p-0", post)):
+            not_modified = await revalidated(path, response.headers["etag"])
+            assert not_modified.status_code == 304
+            assert not_modified.headers["etag"] == response.headers["etag"]
+            assert not_modified.content == b""
+
+        await client.post("/api/posts", json={"title": "Yeni", "content": "İçerik"}, headers=headers)
+        feed = await revalidated("/api/posts", feed.headers["etag"])
+        assert feed.status_code == 200 and len(feed.json()) == 2
+        assert (await revalidated("/api/posts/p-0/comments", comments.headers["etag"])).status_code == 304
+
+        await client.post("/api/comments", json={"post_id": "p-0", "content": "yorum"}, headers=headers)
+        changed = await revalidated("/api/posts/p-0/comments", comments.headers["etag"])
+        assert changed.status_code == 200 and len(changed.json()) == 1
+        # The feed carries comment counts, so it changes too
+        assert (await revalidated("/api/posts", feed.headers["etag"])).status_code == 200
+
+    api(test)
+
+
+def test_auth_buckets_answer_429_with_retry_after(api):
+    async def test(client):
+        await add_user("elliot")
+        for _ in range(2):
+            response = await client.post("/api/login", json={"username": "nobody", "password": "parola"})
+            assert response.status_code == 401
+        response = await client.post("/api/login", json={"username": "nobody", "password": "parola"})
+        assert response.status_code == 429
+        assert int(response.headers["retry-after"]) > 0
+
+        # Taken usernames are refused before bcrypt runs, but they still spend the IP's tokens
+        taken = {"username": "elliot", "email": "e@fsociety.com", "password": "parola"}
+        assert (await client.post("/api/register", json=taken)).status_code == 400
+        response = await client.post("/api/register", json=taken)
+        assert response.status_code == 429
+        assert int(response.headers["retry-after"]) > 0
+
+    api(test, RATE_LIMIT_LOGIN_USERNAME="2/60", RATE_LIMIT_REGISTER_IP="1/600")
+
+
+def test_feed_cache_counts_hits_and_is_cleared_by_writes(api):
+    async def test(client):
+        headers = await add_user("lukha", is_admin=True)
+        await add_post(0)
+
+        async def cache():
+            return (await client.get("/api/admin/stats/cache", headers=headers)).json()
+
+        for _ in range(2):
+            await client.get("/api/posts")
+            await client.get("/api/posts/p-0")
+        stats = await cache()
+        assert {key: stats["pages"][key] for key in ("entries", "hits", "misses")} == {"entries": 1, "hits": 1, "misses": 1}
+        assert {key: stats["posts"][key] for key in ("entries", "hits", "misses")} == {"entries": 1, "hits": 1, "misses": 1}
+
+        await client.post("/api/posts", json={"title": "Yeni", "content": "İçerik"}, headers=headers)
+        stats = await cache()
+        assert stats["pages"]["entries"] == 0
+        assert stats["invalidations"] == 1
+        assert len((await client.get("/api/posts")).json()) == 2
+        assert (await cache())["pages"]["misses"] == 2
+
+    api(test)
+
+
+def test_feed_cache_evicts_least_recently_used_pages(api):
+    async def test(client):
+        headers = await add_user("lukha", is_admin=True)
+        await add_post(0)
+        for limit in (1, 2, 1):
+            await client.get("/api/posts", params={"limit": limit})
+        pages = (await client.get("/api/admin/stats/cache", headers=headers)).json()["pages"]
+        assert {key: pages[key] for key in ("entries", "hits", "misses", "evictions")} == {
+            "entries": 1, "hits": 0, "misses": 3, "evictions": 2
+        }
+
+    api(test, FEED_CACHE_MAX_PAGES="1")
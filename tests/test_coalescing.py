@@ -0,0 +1,46 @@
+"""Failure handling of coalesced post and comment inserts."""
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from coalescing import WriteCoalescer
+from storage import create_storage
+
+CREATED_AT = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def test_failed_collection_does_not_fail_stored_writes():
+    async def main():
+        storage = create_storage("memory", {})
+        await storage.startup()
+        insert_many = storage.insert_many
+
+        async def failing_comments(collection, docs):
+            if collection == "comments":
+                raise RuntimeError("comments unavailable")
+            return await insert_many(collection, docs)
+
+        storage.insert_many = failing_comments
+        coalescer = WriteCoalescer(storage, max_batch=2, max_delay=1)
+        version = await storage.get_feed_version()
+        post = {
+            "id": "p-1", "title": "Başlık", "content": "İçerik", "author_id": "u-elliot",
+            "author_username": "elliot", "created_at": CREATED_AT, "updated_at": CREATED_AT,
+        }
+        comment = {
+            "id": "c-1", "post_id": "p-0", "content": "yorum", "author_id": "u-darlene", "author_username": "darlene",
+            "created_at": CREATED_AT, "parent_id": None, "depth": 0, "path": "x",
+        }
+        results = await asyncio.gather(
+            coalescer.insert("posts", post), coalescer.insert("comments", comment), return_exceptions=True
+        )
+        assert results[0] is None
+        with pytest.raises(RuntimeError, match="comments unavailable"):
+            raise results[1]
+        assert (await storage.posts.get("p-1"))["title"] == "Başlık"
+        assert await storage.get_feed_version() > version
+        assert coalescer.stats()["writes"] == 1
+        await storage.close()
+
+    asyncio.run(main())
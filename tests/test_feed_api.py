@@ -0,0 +1,48 @@
+"""Feed responses through the API, on the memory engine."""
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+
+import server
+from settings import Settings
+from storage.base import thread_path
+
+BASE_TIME = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def feed(*queries):
+    """GET /api/posts with each query string, after seeding two posts with one comment each."""
+    async def main():
+        app = server.create_app(Settings.from_env({"STORAGE_ENGINE": "memory", "WARMUP_ENABLED": "0"}))
+        async with app.router.lifespan_context(app):
+            for index in range(2):
+                created_at = BASE_TIME + timedelta(minutes=index)
+                post_id = f"p-{index}"
+                await server.storage.posts.insert({
+                    "id": post_id, "title": "Başlık", "content": "İçerik", "author_id": "u-elliot",
+                    "author_username": "elliot", "created_at": created_at, "updated_at": created_at,
+                })
+                await server.storage.comments.insert({
+                    "id": f"{post_id}-c", "post_id": post_id, "content": "yorum", "author_id": "u-darlene",
+                    "author_username": "darlene", "created_at": created_at, "parent_id": None, "depth": 0,
+                    "path": thread_path(None, created_at, f"{post_id}-c"),
+                })
+                await server.storage.posts.increment_comment_count(post_id)
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return [(await client.get(f"/api/posts?{query}")).json() for query in queries]
+
+    return asyncio.run(main())
+
+
+def test_selected_latest_comments_are_loaded():
+    without_preview, with_preview = feed("fields=id,latest_comments", "fields=id,latest_comments&comments_preview=1")
+    assert without_preview == [{"id": "p-1", "latest_comments": []}, {"id": "p-0", "latest_comments": []}]
+    assert [post["id"] for post in with_preview] == ["p-1", "p-0"]
+    assert [[comment["id"] for comment in post["latest_comments"]] for post in with_preview] == [["p-1-c"], ["p-0-c"]]
+
+
+def test_selected_comment_count():
+    [posts] = feed("fields=id,comment_count")
+    assert posts == [{"id": "p-1", "comment_count": 1}, {"id": "p-0", "comment_count": 1}]
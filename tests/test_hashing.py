@@ -0,0 +1,40 @@
+"""Admission control of the bcrypt worker pool."""
+import asyncio
+import threading
+
+import pytest
+
+from hashing import HasherBusy, PasswordHasher
+
+
+def test_cancelled_callers_keep_their_slot_until_the_job_ends():
+    async def main():
+        hasher = PasswordHasher(workers=1, max_queue=0)
+        release = threading.Event()
+
+        def blocked():
+            release.wait(5)
+            return "done", 0.0
+
+        try:
+            caller = asyncio.create_task(hasher._run("hash", blocked))
+            await asyncio.sleep(0.05)
+            caller.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await caller
+            # The worker is still busy with the abandoned job
+            with pytest.raises(HasherBusy):
+                await hasher._run("hash", blocked)
+            assert hasher.stats()["in_flight"] == 1
+
+            release.set()
+            for _ in range(100):
+                if hasher.stats()["in_flight"] == 0:
+                    break
+                await asyncio.sleep(0.01)
+            assert await hasher._run("hash", blocked) == "done"
+        finally:
+            release.set()
+            hasher.shutdown()
+
+    asyncio.run(main())
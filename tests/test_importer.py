@@ -0,0 +1,51 @@
+"""Legacy import: replays, missing ids and invalid records."""
+import asyncio
+import json
+
+from hashing import PasswordHasher
+from importer import Importer
+from storage import create_storage
+
+POSTS = [
+    {
+        "title": "Başlık", "content": "İçerik", "authorId": 7, "authorUsername": "elliot",
+        "createdAt": "2024-01-01T12:00:00Z",
+        "comments": [{"content": "yorum", "authorId": 8, "authorUsername": "darlene", "createdAt": "2024-01-01T12:05:00Z"}],
+    },
+    {"id": "p-2", "title": "Başlık", "content": "İçerik", "authorId": 7, "createdAt": "2024-01-01T13:00:00Z"},
+    {"id": "p-3", "title": "Başlık", "content": "İçerik", "authorUsername": "elliot", "createdAt": "2024-01-01T13:00:00Z"},
+]
+
+
+def reader(records):
+    data = json.dumps(records).encode()
+
+    async def read(size):
+        nonlocal data
+        chunk, data = data[:size], data[size:]
+        return chunk
+
+    return read
+
+
+def test_replayed_posts_without_ids_are_duplicates():
+    async def main():
+        storage = create_storage("memory", {})
+        await storage.startup()
+        hasher = PasswordHasher(workers=1, max_queue=1)
+        importer = Importer(storage, hasher)
+        try:
+            first = await importer.run("posts", "gonderiler.json", reader(POSTS))
+            replay = await importer.run("posts", "gonderiler.json", reader(POSTS), resume=False)
+        finally:
+            hasher.shutdown()
+            await storage.close()
+        assert first.inserted == {"posts": 1, "comments": 1}
+        assert replay.inserted == {"posts": 0, "comments": 0}
+        assert replay.duplicates == {"posts": 1, "comments": 1}
+        # Records without an author are reported, never stored with a "None" author
+        assert len(first.errors) == 2
+        assert "p-2" in first.errors[0] and "author_username" in first.errors[0]
+        assert "p-3" in first.errors[1] and "author_id" in first.errors[1]
+
+    asyncio.run(main())
@@ -0,0 +1,43 @@
+"""Index drift detection against index_information() entries."""
+from indexes import INDEXES, _index_matches
+
+
+def spec(collection, name):
+    return next(model.document for model in INDEXES[collection] if model.document["name"] == name)
+
+
+def stored(document, **changes):
+    """``document`` as index_information() reports it."""
+    index = {key: value for key, value in document.items() if key != "name"}
+    return {"v": 2, **index, **changes}
+
+
+def test_indexes_as_declared_match():
+    for models in INDEXES.values():
+        for model in models:
+            assert _index_matches(model.document, stored(model.document))
+
+
+def test_option_drift_is_detected():
+    path = spec("comments", "path")
+    assert not _index_matches(path, stored(path, sparse=False))
+    assert not _index_matches(path, stored(path, partialFilterExpression={"path": {"$exists": True}}))
+    ttl = spec("rate_limits", "expires_at_ttl")
+    assert not _index_matches(ttl, stored(ttl, expireAfterSeconds=60))
+    unique = spec("users", "username_unique")
+    assert not _index_matches(unique, stored(unique, unique=False))
+
+
+def test_text_indexes_compare_weights_and_language():
+    search = spec("posts", "search_text")
+    existing = {
+        "v": 2,
+        "key": [("_fts", "text"), ("_ftsx", 1)],
+        "weights": {"search_body": 1, "search_title": 5},
+        "default_language": "none",
+        "language_override": "language",
+        "textIndexVersion": 3,
+    }
+    assert _index_matches(search, existing)
+    assert not _index_matches(search, {**existing, "weights": {"search_body": 1, "search_title": 1}})
+    assert not _index_matches(search, {**existing, "default_language": "english"})
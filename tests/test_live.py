@@ -0,0 +1,68 @@
+"""Replay and resync of the live event broker."""
+import asyncio
+
+from live import RESYNC, EventBroker
+
+
+def queued(subscriber):
+    messages = []
+    while not subscriber.queue.empty():
+        messages.append(subscriber.queue.get_nowait())
+    return messages
+
+
+def run(test):
+    async def main():
+        broker = EventBroker(max_queue=3, replay_size=3)
+        try:
+            await test(broker)
+        finally:
+            broker.close()
+
+    asyncio.run(main())
+
+
+def test_replay_resumes_after_last_event_id():
+    async def test(broker):
+        for index in range(3):
+            broker.publish("post", {"id": f"p-{index}"})
+        messages = queued(broker.subscribe(f"{broker.epoch}-1"))
+        assert [message.split(b"\n")[0] for message in messages] == [
+            f"id: {broker.epoch}-2".encode(), f"id: {broker.epoch}-3".encode()
+        ]
+        assert queued(broker.subscribe(f"{broker.epoch}-3")) == []
+
+    run(test)
+
+
+def test_unknown_event_ids_resync():
+    async def test(broker):
+        broker.publish("post", {"id": "p-0"})
+        broker.publish("post", {"id": "p-1"})
+        # Another worker's id, one from before a restart, one ahead of this broker, and garbage
+        for last_event_id in ("0123abcd-1", "500", f"{broker.epoch}-500", "nonsense"):
+            assert queued(broker.subscribe(last_event_id)) == [RESYNC]
+
+    run(test)
+
+
+def test_ids_older_than_the_replay_buffer_resync():
+    async def test(broker):
+        for index in range(6):
+            broker.publish("post", {"id": f"p-{index}"})
+        # The buffer holds events 4-6, so resuming after 3 is still complete
+        assert len(queued(broker.subscribe(f"{broker.epoch}-3"))) == 3
+        assert queued(broker.subscribe(f"{broker.epoch}-2")) == [RESYNC]
+
+    run(test)
+
+
+def test_overflow_resyncs_a_slow_reader():
+    async def test(broker):
+        slow = broker.subscribe()
+        for index in range(5):
+            broker.publish("post", {"id": f"p-{index}"})
+        assert queued(slow) == [RESYNC]
+        assert broker.stats()["resyncs"] == 1
+
+    run(test)
@@ -0,0 +1,20 @@
+"""Client address resolution for the per-IP rate limits."""
+from ratelimit import forwarded_ip
+
+
+def test_forwarded_ip_ignores_client_supplied_entries():
+    # The client sends its own X-Forwarded-For; the proxy appends the real address
+    assert forwarded_ip("1.2.3.4", "10.0.0.1") == "1.2.3.4"
+    assert forwarded_ip("6.6.6.6, 1.2.3.4", "10.0.0.1") == "1.2.3.4"
+    assert forwarded_ip("6.6.6.6, 7.7.7.7,1.2.3.4", "10.0.0.1") == "1.2.3.4"
+
+
+def test_forwarded_ip_counts_trusted_hops_from_the_right():
+    assert forwarded_ip("6.6.6.6, 1.2.3.4, 10.0.0.2", "10.0.0.1", trusted_hops=2) == "1.2.3.4"
+    assert forwarded_ip("1.2.3.4", "10.0.0.1", trusted_hops=2) == "1.2.3.4"
+
+
+def test_forwarded_ip_falls_back_to_the_peer():
+    assert forwarded_ip(None, "10.0.0.1") == "10.0.0.1"
+    assert forwarded_ip(" , ", "10.0.0.1") == "10.0.0.1"
+    assert forwarded_ip("1.2.3.4", "10.0.0.1", trusted_hops=0) == "10.0.0.1"
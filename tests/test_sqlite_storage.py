@@ -0,0 +1,47 @@
+"""SQLite engine specifics: reads during another request's write transaction."""
+import asyncio
+from datetime import datetime
+
+from storage import create_storage
+
+CREATED_AT = datetime(2024, 1, 1, 12, 0, 0)
+POST = {
+    "id": "p-1", "title": "Başlık", "content": "İçerik", "author_id": "u-elliot",
+    "author_username": "elliot", "created_at": CREATED_AT, "updated_at": CREATED_AT,
+}
+
+
+def run(test, path):
+    async def main():
+        storage = create_storage("sqlite", {"SQLITE_PATH": path})
+        await storage.startup()
+        try:
+            await test(storage)
+        finally:
+            await storage.close()
+
+    asyncio.run(main())
+
+
+def test_reads_do_not_see_uncommitted_writes(tmp_path):
+    async def test(storage):
+        async with storage._write_lock:
+            # A write transaction left open, like the middle of an archive move
+            await storage.connection.execute(
+                "INSERT INTO posts (id, title, content, author_id, author_username, created_at, updated_at, comment_count) "
+                "VALUES ('p-2', 't', 'c', 'u', 'elliot', '2024-01-01T12:00:00.000000', '2024-01-01T12:00:00.000000', 0)"
+            )
+            assert await storage.posts.get("p-2") is None
+            assert await storage.posts.page(None, 10) == []
+            await storage.connection.commit()
+        assert (await storage.posts.get("p-2"))["id"] == "p-2"
+
+    run(test, str(tmp_path / "isolation.db"))
+
+
+def test_in_memory_database_reads_its_own_writes():
+    async def test(storage):
+        await storage.posts.insert(POST)
+        assert (await storage.posts.get("p-1"))["title"] == "Başlık"
+
+    run(test, ":memory:")
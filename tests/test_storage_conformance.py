@@ -0,0 +1,341 @@
+"""Behaviour every storage engine must share.
+
+memory and sqlite always run; mongo runs when TEST_MONGO_URL points at a
+disposable server (its database is dropped after each test).
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from search import search_posts
+from storage import DuplicateKeyError, create_storage
+from storage.base import SNIPPET_LENGTH, thread_path
+
+# Millisecond precision: Mongo does not store finer datetimes
+BASE_TIME = datetime(2024, 1, 1, 12, 0, 0, 123000)
+
+
+def engines():
+    params = ["memory", "sqlite"]
+    params.append(pytest.param("mongo", marks=pytest.mark.skipif(
+        not os.environ.get("TEST_MONGO_URL"), reason="TEST_MONGO_URL not set"
+    )))
+    return params
+
+
+@pytest.fixture(params=engines())
+def run(request, tmp_path):
+    """Run a coroutine function against a fresh storage of the engine under test."""
+    engine = request.param
+    env = {
+        "SQLITE_PATH": str(tmp_path / "conformance.db"),
+        "MONGO_URL": os.environ.get("TEST_MONGO_URL", ""),
+        "DB_NAME": f"conformance_{uuid.uuid4().hex[:12]}",
+    }
+
+    def runner(test):
+        async def main():
+            storage = create_storage(engine, env)
+            await storage.startup()
+            try:
+                await test(storage)
+            finally:
+                if engine == "mongo":
+                    await storage.client.drop_database(env["DB_NAME"])
+                await storage.close()
+
+        asyncio.run(main())
+
+    return runner
+
+
+def user(name, **extra):
+    return {
+        "id": f"u-{name}",
+        "username": name,
+        "email": f"{name}@fsociety.com",
+        "password_hash": "hash",
+        "avatar": "avatar.png",
+        "created_at": BASE_TIME,
+        "is_admin": False,
+        "token_version": 0,
+        **extra,
+    }
+
+
+def post(index, title="Başlık", content="İçerik"):
+    created_at = BASE_TIME + timedelta(minutes=index)
+    return {
+        "id": f"p-{index:03d}",
+        "title": title,
+        "content": content,
+        "author_id": "u-elliot",
+        "author_username": "elliot",
+        "created_at": created_at,
+        "updated_at": created_at,
+    }
+
+
+def comment(post_id, index, content="yorum", parent=None):
+    comment_id = f"{post_id}-c-{index:03d}"
+    created_at = BASE_TIME + timedelta(seconds=index)
+    return {
+        "id": comment_id,
+        "post_id": post_id,
+        "content": content,
+        "author_id": "u-darlene",
+        "author_username": "darlene",
+        "created_at": created_at,
+        "parent_id": parent["id"] if parent else None,
+        "depth": parent["depth"] + 1 if parent else 0,
+        "path": thread_path(parent and parent["path"], created_at, comment_id),
+    }
+
+
+def test_users_roundtrip_and_uniqueness(run):
+    async def test(storage):
+        await storage.users.insert(user("elliot", is_admin=True))
+        found = await storage.users.get_by_username("elliot")
+        assert found == user("elliot", is_admin=True)
+        assert await storage.users.get_by_id("u-elliot") == found
+        assert await storage.users.get_by_username("nobody") is None
+        assert await storage.users.get_many(["u-elliot", "u-missing"]) == [found]
+        assert await storage.users.username_or_email_taken("elliot", "x@y.z")
+        assert await storage.users.username_or_email_taken("x", "elliot@fsociety.com")
+        assert not await storage.users.username_or_email_taken("x", "x@y.z")
+        with pytest.raises(DuplicateKeyError):
+            await storage.users.insert(user("elliot", id="u-other", email="other@fsociety.com"))
+        with pytest.raises(DuplicateKeyError):
+            await storage.users.insert(user("other", id="u-other2", email="elliot@fsociety.com"))
+
+    run(test)
+
+
+def test_token_version(run):
+    async def test(storage):
+        await storage.users.insert(user("elliot"))
+        assert await storage.users.get_token_version("u-elliot") == 0
+        assert await storage.users.bump_token_version("u-elliot") == 1
+        assert await storage.users.get_token_version("u-elliot") == 1
+        assert await storage.users.get_token_version("u-missing") is None
+        assert await storage.users.bump_token_version("u-missing") is None
+
+    run(test)
+
+
+def test_post_pages_newest_first(run):
+    async def test(storage):
+        for index in range(5):
+            await storage.posts.insert(post(index))
+        # Same created_at, told apart by id
+        await storage.posts.insert({**post(2), "id": "p-002b"})
+
+        first = await storage.posts.page(None, 3)
+        assert [p["id"] for p in first] == ["p-004", "p-003", "p-002b"]
+        assert first[0] == post(4)
+        last = first[-1]
+        second = await storage.posts.page((last["created_at"], last["id"]), 10)
+        assert [p["id"] for p in second] == ["p-002", "p-001", "p-000"]
+        assert await storage.posts.get("p-001") == post(1)
+        assert await storage.posts.get("missing") is None
+        assert sorted(p["id"] for p in await storage.posts.get_many(["p-000", "p-003", "missing"])) == ["p-000", "p-003"]
+        with pytest.raises(DuplicateKeyError):
+            await storage.posts.insert(post(1))
+
+    run(test)
+
+
+def test_post_pages_with_selected_fields(run):
+    async def test(storage):
+        long_text = "kelime " * 100
+        await storage.posts.insert(post(0, content=long_text))
+        await storage.posts.insert(post(1, content="kısa"))
+
+        page = await storage.posts.page(None, 10, fields=("title", "snippet"))
+        assert [sorted(p) for p in page] == [["created_at", "id", "snippet", "title"]] * 2
+        assert [p["snippet"] for p in page] == ["kısa", long_text[:SNIPPET_LENGTH + 1]]
+        feed = await storage.posts.feed_page(None, 10, preview=0, fields=("author_username",))
+        assert sorted(feed[0]) == ["author_username", "comment_count", "created_at", "id", "latest_comments"]
+
+    run(test)
+
+
+def test_comment_counts_and_feed_previews(run):
+    async def test(storage):
+        await storage.posts.insert(post(0))
+        await storage.posts.insert(post(1))
+        for index in range(4):
+            await storage.comments.insert(comment("p-000", index))
+            await storage.posts.increment_comment_count("p-000")
+
+        assert await storage.posts.comment_count("p-000") == 4
+        assert await storage.posts.comment_count("p-001") == 0
+        assert await storage.posts.comment_count("missing") is None
+
+        feed = await storage.posts.feed_page(None, 10, preview=2)
+        assert [p["id"] for p in feed] == ["p-001", "p-000"]
+        assert feed[0]["comment_count"] == 0 and feed[0]["latest_comments"] == []
+        assert feed[1]["comment_count"] == 4
+        assert feed[1]["latest_comments"] == [comment("p-000", 3), comment("p-000", 2)]
+        assert (await storage.posts.feed_page(None, 1, preview=0))[0]["latest_comments"] == []
+
+    run(test)
+
+
+def test_comment_pages_oldest_first(run):
+    async def test(storage):
+        await storage.posts.insert(post(0))
+        await storage.posts.insert(post(1))
+        for index in range(5):
+            await storage.comments.insert(comment("p-000", index))
+        await storage.comments.insert(comment("p-001", 0))
+
+        first = await storage.comments.page("p-000", None, 2)
+        assert first == [comment("p-000", 0), comment("p-000", 1)]
+        after = (first[-1]["created_at"], first[-1]["id"])
+        assert [c["id"] for c in await storage.comments.page("p-000", after, 10)] == [
+            "p-000-c-002", "p-000-c-003", "p-000-c-004",
+        ]
+
+        groups = await storage.comments.first_for_posts(["p-001", "p-000", "missing"], 2)
+        assert set(groups) == {"p-000", "p-001"}
+        assert [c["id"] for c in groups["p-000"]] == ["p-000-c-000", "p-000-c-001"]
+        assert groups["p-001"] == [comment("p-001", 0)]
+
+    run(test)
+
+
+def test_comment_threads(run):
+    async def test(storage):
+        await storage.posts.insert(post(0))
+        first = comment("p-000", 0)
+        second = comment("p-000", 1)
+        reply = comment("p-000", 2, parent=first)
+        nested = comment("p-000", 3, parent=reply)
+        late_reply = comment("p-000", 4, parent=first)
+        for doc in (first, second, reply, nested, late_reply):
+            await storage.comments.insert(doc)
+        # Written without thread fields, like comments from before threading
+        legacy = comment("p-000", 5)
+        await storage.comments.insert({key: legacy[key] for key in ("id", "post_id", "content", "author_id", "author_username", "created_at")})
+
+        assert await storage.comments.get(nested["id"]) == nested
+        assert await storage.comments.get("missing") is None
+        assert await storage.comments.top_level_page("p-000", None, 10) == [first, second, legacy]
+        after = (first["created_at"], first["id"])
+        assert [c["id"] for c in await storage.comments.top_level_page("p-000", after, 1)] == [second["id"]]
+        assert len(await storage.comments.page("p-000", None, 10)) == 6
+
+        assert await storage.comments.subtree(first["path"], None, 10) == [reply, nested, late_reply]
+        assert await storage.comments.subtree(first["path"], reply["path"], 10) == [nested, late_reply]
+        # A position outside the subtree does not leak other threads
+        assert await storage.comments.subtree(first["path"], "", 10) == [reply, nested, late_reply]
+        assert await storage.comments.subtree(second["path"], None, 10) == []
+        assert await storage.comments.subtree(legacy["path"], None, 10) == []
+
+        subtrees = await storage.comments.subtrees([first["path"], second["path"], reply["path"]], 2)
+        assert subtrees == {first["path"]: [reply, nested], second["path"]: [], reply["path"]: [nested]}
+        assert await storage.comments.subtrees([], 2) == {}
+
+    run(test)
+
+
+def test_archive_moves_old_posts_with_comments(run):
+    async def test(storage):
+        for index in range(4):
+            await storage.posts.insert(post(index))
+        root = comment("p-000", 0)
+        reply = comment("p-000", 1, parent=root)
+        for doc in (root, reply, comment("p-001", 0), comment("p-003", 0)):
+            await storage.comments.insert(doc)
+            await storage.posts.increment_comment_count(doc["post_id"])
+
+        before = BASE_TIME + timedelta(minutes=2)
+        assert await storage.archive_posts(before, 1) == (1, 2)
+        assert await storage.archive_posts(before, 10) == (1, 1)
+        assert await storage.archive_posts(before, 10) == (0, 0)
+
+        assert [p["id"] for p in await storage.posts.page(None, 10)] == ["p-003", "p-002"]
+        assert await storage.posts.get("p-000") is None
+        assert await storage.comments.page("p-000", None, 10) == []
+        assert await storage.archived_posts.get("p-000") == post(0)
+        assert await storage.archived_posts.comment_count("p-000") == 2
+        assert await storage.archived_posts.get("p-002") is None
+        assert await storage.archived_comments.page("p-000", None, 10) == [root, reply]
+        assert await storage.archived_comments.top_level_page("p-000", None, 10) == [root]
+        assert await storage.archived_comments.subtree(root["path"], None, 10) == [reply]
+        assert await storage.archived_comments.get(reply["id"]) == reply
+        assert await storage.comments.page("p-003", None, 10) == [comment("p-003", 0)]
+        assert (await search_posts(storage, "yorum", 0, 10))[0] == 1
+
+    run(test)
+
+
+def test_search_ranks_titles_and_comments(run):
+    async def test(storage):
+        await storage.posts.insert(post(0, title="İSTANBUL buluşması", content="Toplantı notları"))
+        await storage.posts.insert(post(1, title="Başka konu", content="istanbul hakkında bir cümle"))
+        await storage.posts.insert(post(2, title="Alakasız", content="hiçbir şey"))
+        await storage.comments.insert(comment("p-002", 0, content="Istanbul'da görüşürüz"))
+
+        total, hits = await search_posts(storage, "ıstanbul", 0, 10)
+        assert total == 3
+        assert [hit[0]["id"] for hit in hits] == ["p-000", "p-001", "p-002"]
+        assert hits[0][0] == post(0, title="İSTANBUL buluşması", content="Toplantı notları")
+        assert hits[2][2] == 1
+
+        total, hits = await search_posts(storage, '"bir cumle"', 0, 10)
+        assert [hit[0]["id"] for hit in hits] == ["p-001"]
+        assert await search_posts(storage, '"cumle bir"', 0, 10) == (0, [])
+        assert await search_posts(storage, "!!", 0, 10) == (0, [])
+
+    run(test)
+
+
+def test_feed_version(run):
+    async def test(storage):
+        assert await storage.get_feed_version() == 0
+        await storage.bump_feed_version()
+        await storage.bump_feed_version()
+        assert await storage.get_feed_version() == 2
+
+    run(test)
+
+
+def test_counters_sum_shards(run):
+    async def test(storage):
+        await storage.counters.add({("p-000", 0): {"views": 3, "like": 1}, ("p-001", 0): {"views": 1}})
+        await storage.counters.add({("p-000", 0): {"views": 2}, ("p-000", 3): {"views": 5, "like": 2}})
+        assert await storage.counters.totals(["p-000", "p-001", "missing"]) == {
+            "p-000": {"views": 10, "like": 3},
+            "p-001": {"views": 1},
+        }
+        await storage.counters.add({})
+        assert await storage.counters.totals([]) == {}
+
+    run(test)
+
+
+def test_bulk_insert_export_and_checkpoints(run):
+    async def test(storage):
+        inserted, duplicates = await storage.insert_many("posts", [post(0), post(1)])
+        assert (inserted, duplicates) == (2, 0)
+        inserted, duplicates = await storage.insert_many("posts", [post(1), post(2)])
+        assert (inserted, duplicates) == (1, 1)
+        await storage.insert_many("comments", [comment("p-000", 0, content="toplu yorum")])
+        assert [hit[0]["id"] for hit in (await search_posts(storage, "toplu", 0, 10))[1]] == ["p-000"]
+
+        exported = [doc async for doc in storage.iter_documents("posts", BASE_TIME + timedelta(minutes=1), None)]
+        assert sorted(doc["id"] for doc in exported) == ["p-001", "p-002"]
+        assert all(doc["created_at"] >= BASE_TIME + timedelta(minutes=1) for doc in exported)
+        until = [doc async for doc in storage.iter_documents("posts", None, BASE_TIME + timedelta(minutes=1))]
+        assert [doc["id"] for doc in until] == ["p-000"]
+
+        assert await storage.get_checkpoint("posts:gonderiler.json") == 0
+        await storage.save_checkpoint("posts:gonderiler.json", 1000)
+        assert await storage.get_checkpoint("posts:gonderiler.json") == 1000
+
+    run(test)